@@ -0,0 +1,201 @@
+"""
+bench_client_churn.py
+
+Entity churn on the client: allocations and garbage collector pauses.
+
+A headless GameClient is fed a seeded stream of what a busy match sends:
+every tick some cannon_shot and powerup_spawn events, then a snapshot in
+which the oldest projectiles are gone, and powerup_pickup events for the
+oldest powerups. With --legacy the world arrives as JSON game_updates
+instead, the client creating and dropping entities as ids come and go.
+Messages are JSON decoded inside the timed loop, like on the socket.
+
+Reported: time per tick, entity objects constructed per second of match,
+garbage collections per generation and the GC pauses (total per tick and
+the longest one), plus the memory one projectile object takes.
+
+    python benchmarks/bench_client_churn.py [--ticks 3000] [--shots 8] [--lifetime 40] [--legacy]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from client import GameClient
+from snapshot import CANNON_TYPES, WorldState, encode_full_snapshot, quantize_position, quantize_velocity
+import cannon
+import player
+import powerup
+import projectile
+
+TICK_RATE = 20
+PLAYERS = 8
+ENTITY_CLASSES = (player.Player, cannon.Cannon, projectile.Projectile, powerup.PowerUp)
+
+
+class GcPauses:
+    """Collections per generation and how long each one stopped the program"""
+
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.pauses = []
+        self.started = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self.started = time.perf_counter()
+        elif self.started is not None:
+            self.pauses.append(time.perf_counter() - self.started)
+            self.collections[info['generation']] += 1
+            self.started = None
+
+
+def count_constructions():
+    """Wrap the entity constructors to count calls, returns the counter"""
+    counter = [0]
+    for entity_class in ENTITY_CLASSES:
+        original = entity_class.__init__
+
+        def counting(self, *args, original=original, **kwargs):
+            counter[0] += 1
+            original(self, *args, **kwargs)
+        entity_class.__init__ = counting
+    return counter
+
+
+def entity_size(entity):
+    """Bytes of an entity object, its attribute dict included"""
+    size = sys.getsizeof(entity)
+    if hasattr(entity, '__dict__'):
+        size += sys.getsizeof(entity.__dict__)
+    return size
+
+
+def projectile_data(projectile_id, handle, x, y, dx, dy, owner):
+    return {
+        'id': projectile_id, 'handle': handle, 'cannon_type': 'RAPID', 'x': x, 'y': y, 'dx': dx, 'dy': dy,
+        'damage': 10, 'radius': 5, 'color': [255, 0, 0], 'owner_id': owner, 'can_bounce': False, 'bounces': 0
+    }
+
+
+def build_stream(args):
+    """JSON messages per tick, (framed events and snapshot payload) or legacy updates"""
+    random.seed(args.seed)
+    players = {f"player_{i}": {
+        'id': f"player_{i}", 'handle': i + 1, 'x': random.uniform(50, 950), 'y': random.uniform(50, 750),
+        'color': [200, 100, 50], 'name': f"player_{i}", 'health': 100, 'alive': True,
+        'has_cannon': False, 'cannon_id': None
+    } for i in range(PLAYERS)}
+    ticks = []
+    projectiles = []  # (spawn tick, data)
+    powerups = []
+    next_id = 1
+    for tick in range(1, args.ticks + 1):
+        events = []
+        for _ in range(args.shots):
+            owner = f"player_{random.randrange(PLAYERS)}"
+            data = projectile_data(next_id, next_id % 0xFFFF + 1, random.uniform(50, 950), random.uniform(50, 750),
+                                   random.uniform(-400, 400), random.uniform(-400, 400), owner)
+            next_id += 1
+            projectiles.append((tick, data))
+            events.append({'type': 'cannon_shot', 'data': {'projectile': data, 'tick': tick}})
+        data = {'id': next_id, 'handle': next_id % 0xFFFF + 1, 'x': random.uniform(50, 950),
+                'y': random.uniform(50, 750), 'type': 'SPEED', 'radius': 10, 'color': [255, 255, 0]}
+        next_id += 1
+        powerups.append((tick, data))
+        events.append({'type': 'powerup_spawn', 'data': {'powerup': data, 'tick': tick}})
+        while powerups and tick - powerups[0][0] >= args.lifetime:
+            _, data = powerups.pop(0)
+            events.append({'type': 'powerup_pickup', 'data': {
+                'powerup_id': data['id'], 'player_id': 'player_1', 'type': 'HEALTH', 'tick': tick
+            }})
+        projectiles = [(spawned, data) for spawned, data in projectiles if tick - spawned < args.lifetime]
+        for _, data in projectiles:
+            data['x'] = (data['x'] + data['dx'] / TICK_RATE) % 1000
+            data['y'] = (data['y'] + data['dy'] / TICK_RATE) % 800
+
+        if args.legacy:
+            update = {'type': 'game_update', 'data': {
+                'type': 'game_update', 'tick': tick, 'players': players, 'cannons': [],
+                'projectiles': [data for _, data in projectiles], 'powerups': [data for _, data in powerups],
+                'sudden_death': False, 'sudden_death_timer': 120
+            }}
+            ticks.append(([json.dumps(update)], None))
+            continue
+        state = WorldState(tick, 0, 0, {
+            data['handle']: (data['handle'], quantize_position(data['x']), quantize_position(data['y']), 100, 1, 0)
+            for data in players.values()
+        }, {}, {
+            data['handle']: (data['handle'], quantize_position(data['x']), quantize_position(data['y']),
+                             quantize_velocity(data['dx']), quantize_velocity(data['dy']),
+                             CANNON_TYPES.index('RAPID'), 0, 1)
+            for _, data in projectiles
+        }, {
+            data['handle']: (data['handle'], quantize_position(data['x']), quantize_position(data['y']), 1)
+            for _, data in powerups
+        })
+        ticks.append(([json.dumps(event) for event in events], encode_full_snapshot(state)))
+    init = {'type': 'init', 'data': {
+        'client_id': 'player_0', 'map_width': 1000, 'map_height': 800, 'tick_rate': TICK_RATE,
+        'obstacles': [], 'players': players, 'cannons': [], 'projectiles': [], 'powerups': [],
+        'tables': {'cannon_types': [], 'powerup_types': []}
+    }}
+    return init, ticks
+
+
+def run(args):
+    init, ticks = build_stream(args)
+    client = GameClient(headless=True, player_name='bench')
+    client.handle_server_message(init)
+    size = entity_size(projectile.Projectile(projectile_data(0, 1, 0.0, 0.0, 0.0, 0.0, None)))
+    constructed = count_constructions()
+    pauses = GcPauses()
+    gc.collect()
+    gc.callbacks.append(pauses)
+    try:
+        start = time.perf_counter()
+        for messages, snapshot in ticks:
+            for message in messages:
+                client.handle_server_message(json.loads(message))
+            if snapshot is not None:
+                client.handle_snapshot('game_snapshot', snapshot)
+            client.update()
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.callbacks.remove(pauses)
+    return elapsed, constructed[0], pauses, size, len(client.projectiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client entity allocation and GC pause benchmark")
+    parser.add_argument('--ticks', type=int, default=3000, help="server ticks of traffic, 20 per second")
+    parser.add_argument('--shots', type=int, default=8, help="projectiles fired per tick")
+    parser.add_argument('--lifetime', type=int, default=40, help="ticks a projectile or powerup lasts")
+    parser.add_argument('--legacy', action='store_true', help="JSON game_update traffic instead of snapshots")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    elapsed, constructed, pauses, size, live = run(args)
+    seconds = args.ticks / TICK_RATE
+    mode = "legacy game_update" if args.legacy else "framed snapshots"
+    print(f"{mode}, {args.ticks} ticks, {args.shots} shots per tick, {live} projectiles in flight at the end")
+    print(f"  time per tick        {elapsed / args.ticks * 1e6:8.1f} us")
+    print(f"  entities constructed {constructed / seconds:8.1f} per second of match")
+    print(f"  projectile object    {size:8d} bytes")
+    print(f"  collections          gen0 {pauses.collections[0]}, gen1 {pauses.collections[1]}, "
+          f"gen2 {pauses.collections[2]}")
+    print(f"  GC pause per tick    {sum(pauses.pauses) / args.ticks * 1e6:8.2f} us, "
+          f"longest {max(pauses.pauses, default=0) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
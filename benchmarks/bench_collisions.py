@@ -0,0 +1,147 @@
+"""
+bench_collisions.py
+
+Server tick cost with many players and projectiles, no sockets involved.
+
+Runs the collision phases (update_projectiles + update_powerups) and the
+full simulation step of one room with the spatial hash broad phase, and
+again with a stand-in index that hands back every player, which is what
+the collision checks did before the broad phase existed. With numpy
+installed the batched projectile engine is timed as well.
+
+    python benchmarks/bench_collisions.py [--players 64] [--projectiles 500] [--open-map]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from room import GameRoom, CANNON_PROPERTIES, INPUT_BURST, PROJECTILES_DICT, PROJECTILES_NUMPY
+from entities import Player, PowerUp, Projectile
+from sweep import ObstacleGrid
+
+
+class AllPlayers:
+    """Index stand-in without a broad phase, every query returns every player"""
+
+    def __init__(self, players):
+        self.players = players
+
+    def query(self, x, y, radius):
+        return list(self.players)
+
+    def insert(self, key, x, y):
+        pass
+
+    def move(self, key, x, y):
+        pass
+
+    def remove(self, key):
+        pass
+
+
+def build_room(players, projectiles, powerups, seed, projectile_engine=PROJECTILES_DICT, open_map=False):
+    random.seed(seed)
+    room = GameRoom('bench', lambda delay, callback: None, projectile_engine=projectile_engine)
+    room.game_started = True
+    if open_map:
+        # no obstacles, projectiles live until they leave the arena or hit somebody
+        room.obstacles = []
+        room.obstacle_grid = ObstacleGrid([], room.grid_size, room.obstacle_grid.bounds)
+    for i in range(players):
+        client_id = f"player_{i}"
+        x = random.uniform(50, room.map_width - 50)
+        y = random.uniform(50, room.map_height - 50)
+        player = Player(client_id, i + 1, x, y, (255, 0, 0), client_id, INPUT_BURST)
+        # nobody dies, so the room keeps the same population for every tick
+        player.health = 10 ** 9
+        room.entities.add_player(player)
+        room.player_index.insert(client_id, x, y)
+    cannon_types = list(CANNON_PROPERTIES)
+    for i in range(projectiles):
+        cannon_type = random.choice(cannon_types)
+        properties = CANNON_PROPERTIES[cannon_type]
+        angle = random.uniform(0, 2 * math.pi)
+        x, y = random_free_point(room, 60)
+        room.projectiles.append(Projectile(
+            room.entities.next_id(), i + 1, cannon_type, x, y,
+            properties['speed'] * math.cos(angle), properties['speed'] * math.sin(angle),
+            properties['damage'], properties['radius'], properties['color'],
+            f"player_{random.randrange(players)}" if players else None,
+            cannon_type == 'BOUNCING', 3 if cannon_type == 'BOUNCING' else 0
+        ))
+    for i in range(powerups):
+        x = random.uniform(50, room.map_width - 50)
+        y = random.uniform(50, room.map_height - 50)
+        room.powerups.append(PowerUp(room.entities.next_id(), i + 1, x, y, 'SPEED', 10, (255, 255, 0)))
+    return room
+
+
+def random_free_point(room, margin):
+    """Random point in the arena outside every obstacle"""
+    while True:
+        x = random.uniform(margin, room.map_width - margin)
+        y = random.uniform(margin, room.map_height - margin)
+        if not room.obstacle_grid.boxes_near(x, y, x, y):
+            return x, y
+
+
+def time_ticks(args, broad_phase, full_step, projectile_engine=PROJECTILES_DICT):
+    """Best average seconds per tick over args.repeats runs of args.ticks ticks each"""
+    ticks = args.ticks
+    best = None
+    for _ in range(args.repeats):
+        # same seed, every run starts from the same world
+        room = build_room(args.players, args.projectiles, args.powerups, args.seed, projectile_engine,
+                          args.open_map)
+        if not broad_phase:
+            room.player_index = AllPlayers(room.players)
+        start = time.perf_counter()
+        for _ in range(ticks):
+            if full_step:
+                room.step()
+            else:
+                room.update_projectiles(room.tick_interval)
+                room.update_powerups(room.tick_interval)
+        elapsed = (time.perf_counter() - start) / ticks
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collision broad phase benchmark")
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--projectiles', type=int, default=500)
+    parser.add_argument('--powerups', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--open-map', action='store_true',
+                        help="drop the obstacles so projectiles stay in flight for the whole run")
+    args = parser.parse_args()
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    print(f"{args.players} players, {args.projectiles} projectiles, {args.powerups} powerups, "
+          f"{'open map' if args.open_map else 'obstacles'}, best of {args.repeats} x {args.ticks} ticks")
+    for label, full_step in (('collisions', False), ('full tick', True)):
+        brute = time_ticks(args, False, full_step)
+        grid = time_ticks(args, True, full_step)
+        line = (f"{label:>10}: all players {brute * 1000:8.3f} ms   grid {grid * 1000:8.3f} ms "
+                f"({brute / grid:4.1f}x)")
+        if numpy is not None:
+            arrays = time_ticks(args, True, full_step, PROJECTILES_NUMPY)
+            line += f"   numpy {arrays * 1000:8.3f} ms ({brute / arrays:4.1f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
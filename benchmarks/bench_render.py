@@ -0,0 +1,206 @@
+"""
+bench_render.py
+
+Client frame time without a window or a server.
+
+Fills a GameClient with the server's obstacle map and a crowd of moving
+players, cannons, projectiles and powerups, then times GameClient.draw with the
+cached background and full display updates, and with dirty rects. The
+background itself is timed both ways as well: drawing every obstacle each
+frame (what draw used to do) against blitting the cached surface.
+
+SDL's dummy video driver is used, so the display update is a memory copy
+rather than a real screen flip.
+
+With --check nothing is timed: the same scene, the local player aiming a
+cannon at a moving mouse, is drawn with dirty rects and with full redraws
+side by side and every frame has to come out pixel for pixel the same.
+
+    python benchmarks/bench_render.py [--players 8] [--cannons 6] [--projectiles 40] [--frames 300] [--check]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import pygame
+from client import GameClient, BLACK, WINDOW_WIDTH, WINDOW_HEIGHT
+from player import Player
+from projectile import Projectile
+from powerup import PowerUp
+from cannon import Cannon
+from obstacle import Obstacle
+from room import GameRoom, CANNON_PROPERTIES, POWERUP_PROPERTIES
+
+
+class BenchClient(GameClient):
+    """GameClient that skips the name prompt, it never connects"""
+
+    def get_player_name(self):
+        return "bench"
+
+
+def build_client(args, dirty_rects):
+    random.seed(args.seed)
+    client = BenchClient(dirty_rects=dirty_rects)
+    room = GameRoom('bench', lambda delay, callback: None)
+    client.obstacles = [Obstacle(obstacle) for obstacle in room.obstacles]
+    for i in range(args.players):
+        player = Player(random.uniform(70, WINDOW_WIDTH - 70), random.uniform(70, WINDOW_HEIGHT - 70),
+                        (random.randint(100, 255), random.randint(100, 255), random.randint(100, 255)),
+                        f"player_{i}", f"player_{i}")
+        client.players[player.id] = player
+    client.client_id = 'player_0'
+    client.local_player = client.players.get('player_0')
+    for i in range(args.projectiles):
+        properties = random.choice(list(CANNON_PROPERTIES.values()))
+        angle = random.uniform(0, 2 * math.pi)
+        client.projectiles[f"proj_{i}"] = Projectile({
+            'id': f"proj_{i}", 'x': random.uniform(60, WINDOW_WIDTH - 60), 'y': random.uniform(60, WINDOW_HEIGHT - 60),
+            'dx': properties['speed'] * math.cos(angle), 'dy': properties['speed'] * math.sin(angle),
+            'radius': properties['radius'], 'color': properties['color'],
+        })
+    for i in range(args.cannons):
+        cannon_type = random.choice(list(CANNON_PROPERTIES))
+        client.cannons[f"cannon_{i}"] = Cannon({
+            'id': f"cannon_{i}", 'type': cannon_type,
+            'x': random.uniform(60, WINDOW_WIDTH - 60), 'y': random.uniform(60, WINDOW_HEIGHT - 60),
+            'color': CANNON_PROPERTIES[cannon_type]['color'],
+            'controlled_by': None if i % 2 else f"player_{i}",
+        })
+    for i in range(args.powerups):
+        power_type = random.choice(list(POWERUP_PROPERTIES))
+        client.powerups[f"powerup_{i}"] = PowerUp({
+            'id': f"powerup_{i}", 'type': power_type,
+            'x': random.uniform(60, WINDOW_WIDTH - 60), 'y': random.uniform(60, WINDOW_HEIGHT - 60),
+            'radius': POWERUP_PROPERTIES[power_type]['radius'], 'color': POWERUP_PROPERTIES[power_type]['color'],
+        })
+    return client
+
+
+def move_entities(client, frame):
+    """Keep everything moving so every frame has fresh dirty areas"""
+    for i, player in enumerate(client.players.values()):
+        angle = frame * 0.05 + i
+        player.x = min(max(player.x + 3 * math.cos(angle), 70), WINDOW_WIDTH - 70)
+        player.y = min(max(player.y + 3 * math.sin(angle), 70), WINDOW_HEIGHT - 70)
+    for projectile in client.projectiles.values():
+        projectile.advance(1 / 60)
+        if not 50 < projectile.x < WINDOW_WIDTH - 50:
+            projectile.dx = -projectile.dx
+        if not 50 < projectile.y < WINDOW_HEIGHT - 50:
+            projectile.dy = -projectile.dy
+
+
+def time_frames(args, dirty_rects):
+    """Best average seconds per draw() over args.repeats runs"""
+    best = None
+    for _ in range(args.repeats):
+        client = build_client(args, dirty_rects)
+        client.draw()  # builds the background
+        start = time.perf_counter()
+        for frame in range(args.frames):
+            move_entities(client, frame)
+            client.draw()
+        elapsed = (time.perf_counter() - start) / args.frames
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def check_dirty_rects(args):
+    """Frames that differ between dirty rect and full redraw drawing, as (frame, pixels) pairs"""
+    dirty_client = build_client(args, True)
+    full_client = build_client(args, False)
+    # the display surface is shared, the full redraw goes to a surface of its own
+    full_client.window = pygame.Surface(dirty_client.window.get_size())
+    clients = (dirty_client, full_client)
+    for client in clients:
+        client.local_player.has_cannon = True
+
+    get_pos = pygame.mouse.get_pos
+    mismatches = []
+    try:
+        for frame in range(args.frames):
+            mouse = (int(WINDOW_WIDTH / 2 + 300 * math.cos(frame * 0.07)),
+                     int(WINDOW_HEIGHT / 2 + 200 * math.sin(frame * 0.11)))
+            pygame.mouse.get_pos = lambda: mouse
+            for client in clients:
+                move_entities(client, frame)
+                client.draw()
+            dirty_pixels = pygame.image.tostring(dirty_client.window, 'RGB')
+            full_pixels = pygame.image.tostring(full_client.window, 'RGB')
+            if dirty_pixels != full_pixels:
+                differing = sum(1 for i in range(0, len(full_pixels), 3)
+                                if dirty_pixels[i:i + 3] != full_pixels[i:i + 3])
+                mismatches.append((frame, differing))
+    finally:
+        pygame.mouse.get_pos = get_pos
+    return mismatches
+
+
+def time_background(args):
+    """Seconds per frame to draw the obstacles from scratch and to blit the cached background"""
+    client = build_client(args, False)
+    client.build_background()
+    window = client.window
+    frames = args.frames * args.repeats
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        window.fill(BLACK)
+        for obstacle in client.obstacles:
+            obstacle.draw(window)
+    redraw = (time.perf_counter() - start) / frames
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        window.blit(client.background, (0, 0))
+    cached = (time.perf_counter() - start) / frames
+    return redraw, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client frame time benchmark")
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--cannons', type=int, default=6)
+    parser.add_argument('--projectiles', type=int, default=40)
+    parser.add_argument('--powerups', type=int, default=5)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--check', action='store_true',
+                        help="compare dirty rect frames with full redraws instead of timing, exit 1 if they differ")
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches = check_dirty_rects(args)
+        if mismatches:
+            frame, differing = mismatches[0]
+            print(f"dirty rects differ from full redraws on {len(mismatches)} of {args.frames} frames, "
+                  f"first on frame {frame} ({differing} pixels)")
+            sys.exit(1)
+        print(f"dirty rects match full redraws on all {args.frames} frames")
+        return
+
+    redraw, cached = time_background(args)
+    full = time_frames(args, False)
+    dirty = time_frames(args, True)
+    print(f"{args.players} players, {args.cannons} cannons, {args.projectiles} projectiles, {args.powerups} powerups, "
+          f"video driver {pygame.display.get_driver()}, best of {args.repeats} x {args.frames} frames")
+    print(f"background: obstacles every frame {redraw * 1000:7.3f} ms   cached blit {cached * 1000:7.3f} ms "
+          f"({redraw / cached:4.1f}x)")
+    print(f"     frame: full update        {full * 1000:7.3f} ms   dirty rects {dirty * 1000:7.3f} ms "
+          f"({full / dirty:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+suite.py
+
+Benchmark suite with machine-readable results and a stored baseline.
+
+Cases, all seeded so every run measures the same work:
+
+    tick     GameRoom.step for a grid of player and projectile counts, no
+             sockets (the NumPy engine too when numpy is installed)
+    codec    snapshot capture, full and delta encode/decode of a populated
+             room, and the legacy JSON game_update, with their sizes
+    framing  parse throughput of the server's receive loops (framed
+             FrameBuffer and legacy split_legacy_messages) and the client's
+             (framed FrameBuffer and legacy GameClient.extract_json)
+    draw     GameClient.draw frame time for N entities, full and dirty rect
+             updates, on SDL's dummy video driver (needs pygame)
+
+Every case sets up its data once and then gives the suite a sampler that
+times a short run of it. The samplers are run in rounds, each round going
+through every case, and a case's result is its best sample. Slow spells of
+a busy machine last seconds, so spreading every case over the whole run
+means a spell costs each case a few samples instead of all of them.
+
+Every result has a name, a value, a unit and which direction is better.
+The results are printed as a table and, with --json, written as JSON. They
+are compared against benchmarks/baseline.json: a timing more than
+--tolerance worse than its baseline, or a size that grew at all, is a
+regression and the suite exits with status 1. Sizes don't depend on the
+machine, so one that shrank fails too: the baseline is out of date and has
+to be saved again along with the change that made the payload smaller.
+
+Timings depend on the machine, so regenerate the baseline on the machine
+that runs the comparison (--save-baseline) before relying on it.
+
+    python benchmarks/suite.py [--cases tick,codec] [--quick] [--json results.json]
+    python benchmarks/suite.py --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+from bench_collisions import build_room
+from room import PROJECTILES_DICT, PROJECTILES_NUMPY
+from protocol import FrameBuffer, encode_frame, encode_message, encode_legacy_message
+from snapshot import (
+    capture_snapshot, decode_delta_snapshot, decode_full_snapshot, encode_delta_snapshot, encode_full_snapshot
+)
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TOLERANCE = 0.25  # a timing may be this much worse than its baseline before it is a regression
+CASES = ('tick', 'codec', 'framing', 'draw')
+TICK_GRID = [(4, 20), (16, 100), (64, 500)]  # (players, projectiles) per room
+DRAW_GRID = [(8, 40), (16, 150)]  # (players, projectiles) on screen
+CHUNK_SIZE = 4096  # bytes per simulated recv, the BUFFER_SIZE of server and client
+TICKS = 10  # steps per tick sample
+CALLS = 5  # calls per codec sample
+FRAMES = 50  # draws per draw sample
+
+
+class Results:
+    """Named results plus the samplers that still have to produce theirs"""
+
+    def __init__(self):
+        self.values = {}
+        self.samplers = []  # (sample, report): sample() returns seconds, report(best seconds) records results
+
+    def add(self, name, value, unit, better='lower'):
+        self.values[name] = {'value': value, 'unit': unit, 'better': better}
+
+    def timer(self, sample, report):
+        self.samplers.append((sample, report))
+
+    def run(self, rounds):
+        best = [None] * len(self.samplers)
+        for _ in range(rounds):
+            for i, (sample, report) in enumerate(self.samplers):
+                elapsed = sample()
+                best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+        for (sample, report), elapsed in zip(self.samplers, best):
+            report(elapsed)
+        self.samplers = []
+
+
+def timed(function, number=1):
+    """Sampler timing number calls of function, in seconds per call"""
+    def sample():
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        return (time.perf_counter() - start) / number
+    return sample
+
+
+def bench_tick(results, args):
+    engines = [PROJECTILES_DICT]
+    try:
+        import numpy
+        engines.append(PROJECTILES_NUMPY)
+    except ImportError:
+        print("numpy not installed, skipping the numpy tick cases")
+    for engine in engines:
+        for players, projectiles in TICK_GRID:
+            def sample(players=players, projectiles=projectiles, engine=engine):
+                # a fresh, identical world for every sample, the old one has lost its projectiles
+                room = build_room(players, projectiles, 20, args.seed, engine, open_map=True)
+                return timed(room.step, TICKS)()
+            name = f"tick.{engine}.{players}p{projectiles}j"
+            results.timer(sample, lambda elapsed, name=name: results.add(name, elapsed * 1000, 'ms'))
+
+
+def bench_codec(results, args):
+    room = build_room(16, 100, 5, args.seed, open_map=True)
+
+    def capture():
+        return capture_snapshot(room.players, room.cannons, room.projectiles, room.powerups,
+                                room.sudden_death, room.sudden_death_timer, room.tick)
+
+    base, _ = capture()
+    room.step()
+    state, full = capture()
+    delta = encode_delta_snapshot(state, base)
+    # what legacy clients still get on every snapshot
+    update = {'type': 'game_update', 'data': room.legacy_update()}
+    legacy = encode_legacy_message(update)
+
+    for name, function in (
+        ('capture', capture),
+        ('full.encode', lambda: encode_full_snapshot(state)),
+        ('full.decode', lambda: decode_full_snapshot(full)),
+        ('delta.encode', lambda: encode_delta_snapshot(state, base)),
+        ('delta.decode', lambda: decode_delta_snapshot(delta, base)),
+        ('legacy.encode', lambda: encode_legacy_message(update)),
+        ('legacy.decode', lambda: json.loads(legacy)),
+    ):
+        results.timer(timed(function, CALLS),
+                      lambda elapsed, name=name: results.add(f"codec.{name}_us", elapsed * 1e6, 'us'))
+    results.add('codec.full.bytes', len(full), 'bytes')
+    results.add('codec.delta.bytes', len(delta), 'bytes')
+    results.add('codec.legacy.bytes', len(legacy), 'bytes')
+
+
+def client_messages(count, seed):
+    """What clients send: movement inputs, batches, acks and pings"""
+    rng = random.Random(seed)
+    messages = []
+    for seq in range(1, count + 1):
+        move = [rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))]
+        if seq % 10 == 0:
+            messages.append(('batch', {'messages': [
+                {'type': 'player_input', 'seq': seq, 'move': move, 'count': 3},
+                {'type': 'snapshot_ack', 'tick': seq},
+            ]}))
+        elif seq % 50 == 0:
+            messages.append(('ping', {}))
+        else:
+            messages.append(('player_input', {'seq': seq, 'move': move}))
+    return messages
+
+
+def chunks(data):
+    """data cut the way recv hands it over"""
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def parse_framed(pieces):
+    frames = FrameBuffer()
+    count = 0
+    for piece in pieces:
+        frames.feed(piece)
+        for message in frames.messages():
+            count += 1
+    return count
+
+
+def bench_framing(results, args):
+    from server import GameServer
+    from client import GameClient
+
+    def throughput(name, data, parse):
+        messages = parse()
+
+        def report(elapsed):
+            results.add(f"framing.{name}.mb_s", len(data) / elapsed / 1e6, 'MB/s', 'higher')
+            results.add(f"framing.{name}.msgs_s", messages / elapsed, 'msg/s', 'higher')
+        results.timer(timed(parse), report)
+
+    # server side: the handle_client receive loops
+    messages = client_messages(5000, args.seed)
+    framed = b''.join(encode_message(msg_type, body) for msg_type, body in messages)
+    framed_pieces = chunks(framed)
+    throughput('server_framed', framed, lambda: parse_framed(framed_pieces))
+
+    legacy = b''.join(encode_legacy_message(dict(body, type=msg_type)) for msg_type, body in messages)
+    legacy_pieces = [piece.decode('utf-8') for piece in chunks(legacy)]
+    # split_legacy_messages only needs the class, not a listening socket
+    server = GameServer.__new__(GameServer)
+
+    def split_legacy():
+        buffer = ""
+        count = 0
+        for piece in legacy_pieces:
+            buffer += piece
+            messages, buffer = server.split_legacy_messages('bench', buffer)
+            count += len(messages)
+        return count
+
+    throughput('server_legacy', legacy, split_legacy)
+
+    # client side: snapshots, deltas and acks from the server
+    room = build_room(16, 100, 5, args.seed, open_map=True)
+    frames = []
+    updates = []
+    base = None
+    for tick in range(200):
+        room.step()
+        state, full = capture_snapshot(room.players, room.cannons, room.projectiles, room.powerups,
+                                       room.sudden_death, room.sudden_death_timer, room.tick)
+        if base is None:
+            frames.append(encode_frame('game_snapshot', full))
+        else:
+            frames.append(encode_frame('game_delta', encode_delta_snapshot(state, base)))
+        frames.append(encode_message('input_ack', {'seq': tick, 'x': 100.0, 'y': 200.0}))
+        base = state
+        if tick % 10 == 0:
+            updates.append(encode_legacy_message({'type': 'game_update', 'data': room.legacy_update()}))
+    framed = b''.join(frames)
+    client_pieces = chunks(framed)
+    throughput('client_framed', framed, lambda: parse_framed(client_pieces))
+
+    legacy = b''.join(updates)
+    update_pieces = [piece.decode('utf-8') for piece in chunks(legacy)]
+    client = GameClient(headless=True, player_name='bench')
+
+    def extract_legacy():
+        # the receive_legacy_messages loop
+        buffer = ""
+        count = 0
+        for piece in update_pieces:
+            buffer += piece
+            while True:
+                message, buffer = client.extract_json(buffer)
+                if not message:
+                    break
+                count += 1
+        return count
+
+    throughput('client_legacy', legacy, extract_legacy)
+
+
+def bench_draw(results, args):
+    try:
+        import bench_render
+    except ImportError as e:
+        print(f"Skipping the draw cases: {e}")
+        return
+    for players, projectiles in DRAW_GRID:
+        settings = argparse.Namespace(players=players, cannons=6, projectiles=projectiles, powerups=5, seed=args.seed)
+        for mode, dirty_rects in (('full', False), ('dirty', True)):
+            client = bench_render.build_client(settings, dirty_rects)
+            client.draw()  # builds the background
+            frame = [0]
+
+            def draw(client=client, frame=frame):
+                frame[0] += 1
+                bench_render.move_entities(client, frame[0])
+                client.draw()
+
+            name = f"draw.{mode}.{players}p{projectiles}j"
+            results.timer(timed(draw, FRAMES), lambda elapsed, name=name: results.add(name, elapsed * 1000, 'ms'))
+
+
+def environment():
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine()}
+    for module in ('numpy', 'pygame'):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            info[module] = None
+    return info
+
+
+def compare(results, baseline, tolerance):
+    """Print every result against its baseline, returns the names that regressed
+    or, for sizes, no longer match it
+    """
+    regressions = []
+    print(f"{'benchmark':32s} {'value':>12s} {'baseline':>12s} {'change':>8s}")
+    for name, current in results.items():
+        value = current['value']
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:32s} {value:12.3f} {'-':>12s} {'new':>8s}  {current['unit']}")
+            continue
+        change = value / old['value'] - 1 if old['value'] else 0.0
+        flag = "  REGRESSION"
+        if current['unit'] == 'bytes':
+            # sizes don't depend on the machine, any growth is real and a stale baseline hides the next one
+            regressed = value != old['value']
+            if value < old['value']:
+                flag = "  STALE BASELINE"
+        elif current['better'] == 'lower':
+            regressed = change > tolerance
+        else:
+            regressed = change < -tolerance
+        if not regressed:
+            flag = ""
+        print(f"{name:32s} {value:12.3f} {old['value']:12.3f} {change * 100:+7.1f}%  {current['unit']}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite with baseline comparison")
+    parser.add_argument('--cases', default=','.join(CASES), help=f"comma separated subset of {', '.join(CASES)}")
+    parser.add_argument('--rounds', type=int, default=30, help="samples per case, the best one counts")
+    parser.add_argument('--quick', action='store_true', help="5 rounds, noisier numbers")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON to PATH ('-' for stdout)")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+    if args.quick:
+        args.rounds = 5
+
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    for case in cases:
+        if case not in CASES:
+            parser.error(f"unknown case {case}")
+
+    results = Results()
+    runners = {'tick': bench_tick, 'codec': bench_codec, 'framing': bench_framing, 'draw': bench_draw}
+    for case in cases:
+        runners[case](results, args)
+    started = time.perf_counter()
+    results.run(args.rounds)
+    print(f"{args.rounds} rounds in {time.perf_counter() - started:.1f}s")
+    # report in case order, whatever order the samplers finished in
+    values = {name: results.values[name] for case in cases for name in results.values if name.startswith(case + '.')}
+
+    report = {'environment': environment(), 'seed': args.seed, 'rounds': args.rounds, 'results': values}
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            # keep the cases that weren't run this time
+            stored['results'].update(values)
+            stored.update({key: report[key] for key in report if key != 'results'})
+            report = stored
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(values, baseline['results'], args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%} or sizes off the baseline "
+              f"(--save-baseline if they shrank on purpose): {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+bots.py
+
+Bot swarm load generator.
+
+Connects any number of headless GameClients to one server and plays them
+from a single driver loop: every step each bot picks its move, sends it
+through the same prediction and command batching as a real client, and
+runs the client's update(). Each bot keeps its own receive thread, like a
+real client does.
+
+Behaviors:
+    idle    connect and receive, never send an input
+    wander  walk in a random direction, picking a new one every few seconds
+    hunter  walk to the nearest free cannon, pick it up and shoot at the
+            nearest other player until the cannon is gone
+
+A report line is printed every --report seconds with the traffic of the last
+interval. At the end, RTT (from the clients' ping/pong), bytes and messages
+received are summarised over all bots, and --per-bot prints one line per bot.
+
+    python client/bots.py [server] --bots 200 --behavior hunter --duration 60
+"""
+
+import argparse
+import os
+import random
+import time
+
+from client import GameClient, DEFAULT_SERVER, DEFAULT_PORT, PLAYER_RADIUS
+
+BEHAVIORS = ('idle', 'wander', 'hunter')
+
+
+class Bot:
+    def __init__(self, client, behavior, rng, turn_interval=2.0, shoot_interval=0.5):
+        self.client = client
+        self.behavior = behavior
+        self.rng = rng
+        self.turn_interval = turn_interval
+        self.shoot_interval = shoot_interval
+        self.move = (0, 0)
+        self.next_turn = 0
+        self.next_shot = 0
+
+    def step(self, now):
+        """Decide this step's action, then let the client send and apply what came in"""
+        client = self.client
+        client.clock.tick()
+        player = client.local_player
+        if client.connected and player and player.alive and self.behavior != 'idle':
+            if self.behavior == 'hunter' and player.has_cannon:
+                self.shoot(now)
+            elif self.behavior == 'hunter' and self.seek_cannon():
+                client.try_pickup_cannon()
+            else:
+                self.wander(now)
+            if self.move != (0, 0) and not player.has_cannon:
+                client.send_input(*self.move)
+        client.update()
+
+    def wander(self, now):
+        if now >= self.next_turn:
+            self.next_turn = now + self.turn_interval * self.rng.uniform(0.5, 1.5)
+            self.move = (self.rng.choice((-1, 0, 1)), self.rng.choice((-1, 0, 1)))
+
+    def seek_cannon(self):
+        """Head for the nearest free cannon, False if there is none to go for"""
+        player = self.client.local_player
+        free = [cannon for cannon in self.client.cannons.values() if cannon.controlled_by is None]
+        if not free:
+            return False
+        target = min(free, key=lambda cannon: (cannon.x - player.x) ** 2 + (cannon.y - player.y) ** 2)
+        dx = target.x - player.x
+        dy = target.y - player.y
+        # stop once in pickup range instead of circling the cannon
+        near = PLAYER_RADIUS
+        self.move = ((dx > near) - (dx < -near), (dy > near) - (dy < -near))
+        return True
+
+    def shoot(self, now):
+        self.move = (0, 0)
+        if now < self.next_shot:
+            return
+        player = self.client.local_player
+        targets = [other for other in self.client.players.values() if other is not player and other.alive]
+        if not targets:
+            return
+        target = min(targets, key=lambda other: (other.x - player.x) ** 2 + (other.y - player.y) ** 2)
+        self.next_shot = now + self.shoot_interval
+        self.client.try_shoot_cannon(target.x, target.y)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def totals(bots):
+    return (sum(bot.client.bytes_received for bot in bots),
+            sum(sum(bot.client.message_counts.values()) for bot in bots))
+
+
+def report(bots, elapsed, previous, interval):
+    received, messages = totals(bots)
+    rtts = [rtt for bot in bots for rtt in list(bot.client.rtt_samples)[-1:]]
+    connected = sum(1 for bot in bots if bot.client.connected)
+    print(f"[{elapsed:6.1f}s] {connected}/{len(bots)} connected  "
+          f"{(received - previous[0]) / interval / 1024:8.1f} KB/s  "
+          f"{(messages - previous[1]) / interval:8.1f} msg/s  "
+          f"rtt p50 {percentile(rtts, 0.5):6.1f} ms  p95 {percentile(rtts, 0.95):6.1f} ms")
+    return received, messages
+
+
+def summary(bots, elapsed, per_bot):
+    rtts = [rtt for bot in bots for rtt in bot.client.rtt_samples]
+    received, messages = totals(bots)
+    print(f"{len(bots)} bots for {elapsed:.1f}s: {received / 1024:.1f} KB, {messages} messages received "
+          f"({received / elapsed / 1024 / len(bots):.2f} KB/s and {messages / elapsed / len(bots):.1f} msg/s per bot)")
+    print(f"rtt over {len(rtts)} pings: p50 {percentile(rtts, 0.5):.1f} ms  p95 {percentile(rtts, 0.95):.1f} ms  "
+          f"max {max(rtts, default=0.0):.1f} ms")
+    counts = {}
+    for bot in bots:
+        for msg_type, count in bot.client.message_counts.items():
+            counts[msg_type] = counts.get(msg_type, 0) + count
+    for msg_type, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {msg_type:16s} {count / elapsed:10.1f}/s")
+    if per_bot:
+        for bot in bots:
+            client = bot.client
+            samples = list(client.rtt_samples)
+            print(f"  {client.player_name:10s} {client.client_id or '-':12s} "
+                  f"{'up' if client.connected else 'down':4s} {client.bytes_received / 1024:9.1f} KB  "
+                  f"{sum(client.message_counts.values()) / elapsed:7.1f} msg/s  "
+                  f"rtt p50 {percentile(samples, 0.5):6.1f} ms  max {max(samples, default=0.0):6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot swarm load generator")
+    parser.add_argument('server', nargs='?', default=DEFAULT_SERVER)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--bots', type=int, default=50)
+    parser.add_argument('--behavior', choices=BEHAVIORS + ('mixed',), default='wander',
+                        help="what every bot does, mixed picks one per bot")
+    parser.add_argument('--rate', type=float, default=30, help="steps per second, one input per bot per step")
+    parser.add_argument('--duration', type=float, default=30, help="seconds, 0 runs until Ctrl+C")
+    parser.add_argument('--spawn-interval', type=float, default=0.02, help="seconds between connects")
+    parser.add_argument('--turn-interval', type=float, default=2.0)
+    parser.add_argument('--shoot-interval', type=float, default=0.5)
+    parser.add_argument('--ping-interval', type=float, default=1.0)
+    parser.add_argument('--report', type=float, default=5.0, help="seconds between report lines")
+    parser.add_argument('--tcp-only', action='store_true', help="don't take the server's UDP channel")
+    parser.add_argument('--per-bot', action='store_true')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    bots = []
+    for i in range(args.bots):
+        client = GameClient(args.server, args.port, headless=True, player_name=f"Bot_{i}", tcp_only=args.tcp_only)
+        client.ping_interval = args.ping_interval
+        # random ids collide by the hundred, and the server trusts whatever id it is given
+        client.client_id = f"bot_{os.getpid()}_{i}"
+        if not client.connect_to_server():
+            print(f"Bot_{i} failed to connect, stopping at {len(bots)} bots")
+            break
+        behavior = rng.choice(BEHAVIORS) if args.behavior == 'mixed' else args.behavior
+        bots.append(Bot(client, behavior, random.Random(rng.random()), args.turn_interval, args.shoot_interval))
+        time.sleep(args.spawn_interval)
+    if not bots:
+        return
+
+    step_interval = 1.0 / args.rate
+    start = time.time()
+    last_report = start
+    previous = totals(bots)
+    next_step = start
+    try:
+        while True:
+            now = time.time()
+            if args.duration and now - start >= args.duration:
+                break
+            for bot in bots:
+                bot.step(now)
+            if now - last_report >= args.report:
+                previous = report(bots, now - start, previous, now - last_report)
+                last_report = now
+            next_step += step_interval
+            delay = next_step - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # can't keep up, don't try to catch up with a burst
+                next_step = time.time()
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.time() - start
+    summary(bots, elapsed, args.per_bot)
+    for bot in bots:
+        bot.client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,48 @@
 import pygame
 from pygame.locals import *
 from projectile import Projectile
+from sprites import atlas
 
 class Cannon:
+    __slots__ = ('id', 'x', 'y', 'type', 'shots_left', 'radius', 'color', 'controlled_by', 'use_timer',
+                 'last_shot_time')
+
     def __init__(self, data_or_x, y=None):
         if y is None and isinstance(data_or_x, dict):
             # Initialize from server data
-            data = data_or_x
-            self.id = data.get('id', '')
-            self.x = data.get('x', 0)
-            self.y = data.get('y', 0)
-            self.type = data.get('type', 'RAPID')
-            self.shots_left = data.get('shots_left', 10)
-            self.radius = data.get('radius', 20)
-            self.color = tuple(data['color']) if isinstance(data['color'], list) else data.get('color', (128, 128, 128))
-            self.controlled_by = data.get('controlled_by')
-            self.use_timer = data.get('use_timer', 0)
-            self.last_shot_time = data.get('last_shot_time', 0)
+            self.reset(data_or_x)
         else:
-            self.id = ''
-            self.x = data_or_x
-            self.y = y
-            self.type = 'RAPID'
-            self.shots_left = 10
-            self.radius = 20
-            self.color = (128, 128, 128)
-            self.controlled_by = None
-            self.use_timer = 0
-            self.last_shot_time = 0
+            self.reset({'x': data_or_x, 'y': y})
+
+    def reset(self, data):
+        """Set every field from server data"""
+        get = data.get
+        self.id = get('id', '')
+        self.x = get('x', 0)
+        self.y = get('y', 0)
+        self.type = get('type', 'RAPID')
+        self.shots_left = get('shots_left', 10)
+        self.radius = get('radius', 20)
+        self.color = tuple(get('color', (128, 128, 128)))
+        self.controlled_by = get('controlled_by')
+        self.use_timer = get('use_timer', 0)
+        self.last_shot_time = get('last_shot_time', 0)
+
+    def update(self, data):
+        """Update cannon state from a whole cannon dict as the server sends it"""
+        self.x = data['x']
+        self.y = data['y']
+        self.shots_left = data['shots_left']
+        self.controlled_by = data['controlled_by']
+        self.use_timer = data['use_timer']
+        self.last_shot_time = data['last_shot_time']
+        self.color = tuple(data['color'])
+
+    def sprite(self):
+        """(sprite surface, top left position) to blit, free cannons are outlined"""
+        image, offset = atlas.cannon(self.type, self.controlled_by is None)
+        return image, (int(self.x) - offset, int(self.y) - offset)
 
-    def update(self, data=None):
-        """Update cannon state from server data"""
-        if data:
-            if 'x' in data:
-                self.x = data['x']
-            if 'y' in data:
-                self.y = data['y']
-            if 'shots_left' in data:
-                self.shots_left = data['shots_left']
-            if 'controlled_by' in data:
-                self.controlled_by = data['controlled_by']
-            if 'use_timer' in data:
-                self.use_timer = data['use_timer']
-            if 'last_shot_time' in data:
-                self.last_shot_time = data['last_shot_time']
-            if 'color' in data:
-                self.color = tuple(data['color']) if isinstance(data['color'], list) else data['color']
\ No newline at end of file
+    def draw(self, surface):
+        """Draw the cannon, returns the Rect it touched"""
+        return surface.blit(*self.sprite())
@@ -6,13 +6,32 @@ import pygame
 from pygame.locals import *
 import sys
 import random
-import math
+import os
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from protocol import (
+    PROTOCOL_HELLO, PROTOCOL_FRAMED, PROTOCOL_LEGACY,
+    FrameBuffer, ProtocolError, encode_message, encode_legacy_message, parse_hello
+)
+from snapshot import (
+    CANNON_TYPES, ENTITY_KINDS, PLAYER_ALIVE, PLAYER_HAS_CANNON, FLAG_SUDDEN_DEATH,
+    POSITION_SCALE, VELOCITY_SCALE, TIMER_SCALE,
+    SnapshotHistory, decode_full_snapshot, decode_delta_snapshot, delta_ticks
+)
+from movement import apply_move
 from player import Player
 from cannon import Cannon
 from projectile import Projectile
 from obstacle import Obstacle
 from powerup import PowerUp
+from entity_pool import EntityPool
 from text_input import TextInput
+from commands import CommandAggregator
+from interpolation import InterpolationBuffer
+from text_cache import get_font, text_cache
+from sprites import atlas
+from udp_link import UdpLink
 
 # Constants we need 
 WINDOW_WIDTH = 1000
@@ -20,6 +39,10 @@ WINDOW_HEIGHT = 700
 GRID_SIZE = 50
 PLAYER_RADIUS = 20
 PLAYER_MAX_HEALTH = 100
+FONT_SIZE = 36
+SMALL_FONT_SIZE = 24
+INPUT_BUFFER_SIZE = 128  # unacked movement inputs kept for replay, about 2 seconds at 60 fps
+RTT_HISTORY = 1000  # ping round trips kept per client
 
 # colors
 BLACK = (0, 0, 0)
@@ -35,25 +58,56 @@ DEFAULT_PORT = 5555
 BUFFER_SIZE = 4096
 
 class GameClient:
-    def __init__(self, server_address=DEFAULT_SERVER, port=DEFAULT_PORT):
+    def __init__(self, server_address=DEFAULT_SERVER, port=DEFAULT_PORT, dirty_rects=False,
+                 headless=False, player_name=None, tcp_only=False):
         self.last_ping_time = 0
         self.ping_interval = 5  # seconds
         self.ping_sent_time = 0
         self.latency_ms = None
-        pygame.init()
-        self.window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        pygame.display.set_caption("Cannon Chaos - Client")
+        # Headless clients open no window and read no keyboard, whoever
+        # created them (a bot, a load test) calls update() and the send_* methods
+        self.headless = headless
+        if headless:
+            self.window = None
+            self.font = None
+            self.small_font = None
+        else:
+            pygame.init()
+            self.window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+            pygame.display.set_caption("Cannon Chaos - Client")
+            self.font = get_font(FONT_SIZE)
+            self.small_font = get_font(SMALL_FONT_SIZE)
+            atlas.preload()
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont(None, 36)
-        self.small_font = pygame.font.SysFont(None, 24)
+        
+        # Traffic seen by this client, for load tests
+        self.bytes_received = 0
+        self.message_counts = {}  # msg_type -> messages received
+        self.rtt_samples = deque(maxlen=RTT_HISTORY)  # ms, one per pong
+        
+        # Rendering: the arena and obstacles are drawn once into a background
+        # surface. In dirty rect mode only the screen areas sprites covered
+        # last frame or cover this frame are restored and pushed to the display.
+        self.background = None  # rebuilt when the map changes
+        self.dirty_rects = dirty_rects
+        self.previous_dirty = []  # areas drawn on last frame
         
         # Network settings
         self.server_address = server_address
         self.port = port
         self.socket = None
+        self.protocol = PROTOCOL_FRAMED
+        self.frames = None
         self.connected = False
         self.client_id = None
-        self.player_name = self.get_player_name()  # Get player name before connecting
+        # Snapshots and inputs move to the server's UDP channel when it offers one,
+        # unless tcp_only. The TCP and UDP receive threads apply messages under receive_lock.
+        self.tcp_only = tcp_only
+        self.udp_link = None
+        self.udp_notice = None  # 'udp_ready' or 'udp_close' for the server, sent from update()
+        self.receive_lock = threading.Lock()
+        # Get player name before connecting, unless we were given one
+        self.player_name = player_name if player_name is not None else self.get_player_name()
         
         # Game state
         self.players = {}
@@ -62,6 +116,30 @@ class GameClient:
         self.projectiles = {}
         self.powerups = {}
         self.obstacles = []
+        # Entity dict and object pool per kind, projectiles and powerups come and go
+        # all match so their objects get reused
+        self.entity_stores = {
+            'players': (self.players, None),
+            'cannons': (self.cannons, None),
+            'projectiles': (self.projectiles, EntityPool(Projectile)),
+            'powerups': (self.powerups, EntityPool(PowerUp))
+        }
+        
+        # Snapshot handle -> entity id per entity kind, filled from init and the spawn events
+        self.entity_handles = {kind: {} for kind in ENTITY_KINDS}
+        # Last record written into each entity object, so unchanged ones are skipped
+        self.applied_records = {kind: {} for kind in ENTITY_KINDS}
+        # Tick of the event that introduced a handle, snapshots older than that don't remove it
+        self.handle_ticks = {kind: {} for kind in ENTITY_KINDS}
+        self.snapshot_tick = None  # newest snapshot applied, older ones arriving late are dropped
+        # Recent snapshot states, the baselines the server sends deltas against
+        self.snapshot_history = SnapshotHistory(size=64)
+        self.snapshot_ack_tick = None
+        self.snapshot_ack_pending = False
+        self.cannon_styles = {}
+        self.powerup_styles = {}
+        # Remote entities are drawn from buffered snapshots, set up on init (framed protocol only)
+        self.interpolation = None
         
         # Game settings
         self.running = False
@@ -73,23 +151,30 @@ class GameClient:
         self.winner_id = None
         self.messages = []
         self.message_timeout = 3  # seconds
+        self.help_text = "WASD: Move | E: Pick up cannon | SPACE: Shoot"  # bottom line of the HUD
         
         # Player input state
         self.input_x = 0
         self.input_y = 0
         self.last_send_time = 0
         self.input_update_rate = 0.05  # 20 updates per second
+        # Commands wait here and go out together once per input_update_rate
+        self.commands = CommandAggregator()
+        # Client-side prediction: inputs are numbered, applied locally right away
+        # and kept until the server acks them, then replayed on top of its position
+        self.input_seq = 0
+        self.pending_inputs = deque(maxlen=INPUT_BUFFER_SIZE)  # (seq, move_x, move_y, speed)
     
     def get_player_name(self):
         text_input = TextInput(max_length=15)
         background = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
         background.fill(BLACK)
         
-        title_font = pygame.font.SysFont(None, 48)
+        title_font = get_font(48)
         title_text = title_font.render("Enter Your Name:", True, WHITE)
         title_rect = title_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 - 60))
         
-        instruction_font = pygame.font.SysFont(None, 24)
+        instruction_font = get_font(SMALL_FONT_SIZE)
         instruction_text = instruction_font.render("Press ENTER when done", True, WHITE)
         instruction_rect = instruction_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 + 40))
         
@@ -135,11 +220,9 @@ class GameClient:
     
     def connect_to_server(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.server_address, self.port))
-            
-            # generate random client ID and remember it
-            self.client_id = f"player_{random.randint(1000, 9999)}"
+            # generate random client ID and remember it, unless one was picked for us
+            if self.client_id is None:
+                self.client_id = f"player_{random.randint(1000, 9999)}"
             
             # Generate random player color 
             color = (random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
@@ -150,7 +233,14 @@ class GameClient:
                 'color': color,
                 'name': self.player_name      # Send player name with registration
             }
-            self.socket.sendall(json.dumps(registration).encode('utf-8'))
+            
+            # Try the framed protocol first, fall back to plain JSON for old servers
+            if not self.open_framed_connection(registration):
+                print("Server doesn't speak the framed protocol, falling back to JSON")
+                self.protocol = PROTOCOL_LEGACY
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.connect((self.server_address, self.port))
+                self.socket.sendall(encode_legacy_message(registration))
             
             # Pre-make our local player with the ID we've chosen
             # have a player to move regardless of server behavior
@@ -171,7 +261,118 @@ class GameClient:
             print(f"Error connecting to server: {e}")
             return False
     
+    def open_framed_connection(self, registration):
+        """Connect and negotiate the framed protocol, False if the server is too old"""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect((self.server_address, self.port))
+        self.socket.sendall(PROTOCOL_HELLO + encode_message('register', registration))
+        
+        # Old servers choke on the hello and drop the connection
+        self.frames = FrameBuffer()
+        self.socket.settimeout(5.0)
+        try:
+            while self.frames.end - self.frames.start < len(PROTOCOL_HELLO):
+                if not self.frames.recv_from(self.socket):
+                    break
+        except (socket.timeout, ConnectionError):
+            pass
+        finally:
+            self.socket.settimeout(None)
+        
+        hello = bytes(self.frames.buffer[self.frames.start:self.frames.end])
+        if parse_hello(hello) is None:
+            self.socket.close()
+            self.frames = None
+            return False
+        self.frames.start += len(PROTOCOL_HELLO)
+        self.protocol = PROTOCOL_FRAMED
+        return True
+    
+    def send_message(self, msg_type, body):
+        """Send one message to the server in whichever protocol was negotiated"""
+        if self.protocol == PROTOCOL_FRAMED:
+            message_bytes = encode_message(msg_type, body)
+        else:
+            message_bytes = encode_legacy_message(dict(body, type=msg_type))
+        self.socket.sendall(message_bytes)
+    
     def receive_messages(self):
+        if self.protocol == PROTOCOL_FRAMED:
+            self.receive_framed_messages()
+        else:
+            self.receive_legacy_messages()
+    
+    def receive_framed_messages(self):
+        frames = self.frames
+        
+        while self.connected:
+            try:
+                for message in frames.messages():
+                    try:
+                        with self.receive_lock:
+                            self.handle_server_message(message)
+                    except Exception as e:
+                        print(f"Error processing server message: {e}")
+                
+                received = frames.recv_from(self.socket, BUFFER_SIZE)
+                if not received:
+                    self.disconnect()
+                    break
+                self.bytes_received += received
+            
+            except ProtocolError as e:
+                print(f"Protocol error from server: {e}")
+                self.disconnect()
+                break
+            except ConnectionError:
+                self.disconnect()
+                break
+            except Exception as e:
+                print(f"Error receiving data: {e}")
+                self.disconnect()
+                break
+    
+    def open_udp_link(self, port, token):
+        """Bring up the UDP channel the server offered and receive on it, TCP carries on if it fails"""
+        try:
+            link = UdpLink(self.server_address, port, token)
+        except OSError as e:
+            print(f"No UDP channel, staying on TCP: {e}")
+            return
+        if not link.handshake():
+            print("Server's UDP channel doesn't answer, staying on TCP")
+            link.close()
+            return
+        print("Snapshots and inputs now go over UDP")
+        self.udp_link = link
+        self.udp_notice = 'udp_ready'
+        self.receive_datagrams(link)
+    
+    def receive_datagrams(self, link):
+        while self.connected and self.udp_link is link:
+            try:
+                message, size = link.receive(0.5)
+            except OSError:
+                break  # closed by disconnect()
+            if message is None:
+                if link.silent():
+                    # lost on the way (a NAT timing out, a firewall), take everything over TCP again
+                    print("UDP channel went quiet, falling back to TCP")
+                    self.udp_link = None
+                    self.udp_notice = 'udp_close'
+                    break
+                continue
+            self.bytes_received += size
+            if message.get('type') not in ('game_snapshot', 'game_delta'):
+                continue  # late hello echoes
+            try:
+                with self.receive_lock:
+                    self.handle_server_message(message)
+            except Exception as e:
+                print(f"Error processing server message: {e}")
+        link.close()
+    
+    def receive_legacy_messages(self):
         buffer = ""  # incomplete messages
         
         while self.connected:
@@ -180,6 +381,7 @@ class GameClient:
                 if not data:
                     self.disconnect()
                     break
+                self.bytes_received += len(data)
                 
                 buffer += data.decode('utf-8')
                 
@@ -237,22 +439,36 @@ class GameClient:
     def handle_server_message(self, message):
         msg_type = message.get('type')
         data = message.get('data', {})
+        self.message_counts[msg_type] = self.message_counts.get(msg_type, 0) + 1
         
         if msg_type == 'init':
             # initial game state
             self.client_id = data.get('client_id')
             print(f"Received init message with client_id: {self.client_id}")
+            if data.get('room_id') is not None:
+                print(f"Joined room {data['room_id']}")
+            if self.protocol == PROTOCOL_FRAMED:
+                self.interpolation = InterpolationBuffer(data.get('tick_rate', 20))
+            
+            # Per-type colors and sizes for snapshot decoding
+            tables = data.get('tables', {})
+            for style in tables.get('cannon_types', []):
+                self.cannon_styles[style['type']] = (tuple(style['color']), style['radius'])
+            for style in tables.get('powerup_types', []):
+                self.powerup_styles[style['type']] = (tuple(style['color']), style['radius'])
             
             # Process players
             for player_id, player_data in data.get('players', {}).items():
                 if player_id not in self.players:
                     color = tuple(player_data['color']) if isinstance(player_data['color'], list) else player_data['color']
-                    self.players[player_id] = Player(player_data['x'], player_data['y'], color, player_id)
+                    self.players[player_id] = Player(player_data['x'], player_data['y'], color, player_id,
+                                                     player_data.get('name', "Player"))
                     if player_id == self.client_id:
                         self.local_player = self.players[player_id]
                         print(f"LOCAL PLAYER SET: id={player_id}, pos=({self.local_player.x}, {self.local_player.y})")
                 else:
                     self.players[player_id].update(player_data)
+                self.remember_handle('players', player_data)
             
             # Check if local_player was set, if not this is a critical error
             if not self.local_player and self.client_id:
@@ -271,14 +487,48 @@ class GameClient:
                     # Send this player to the server
                     self.send_update()
             
-            # Process obstacles
-            for obstacle_data in data.get('obstacles', []):
-                self.obstacles.append(Obstacle(obstacle_data))
+            # Process obstacles, the background gets redrawn with them
+            self.obstacles = [Obstacle(obstacle_data) for obstacle_data in data.get('obstacles', [])]
+            self.background = None
                 
             # Process initial cannons if any
             for cannon_data in data.get('cannons', []):
                 cannon_id = cannon_data.get('id', 'unknown')
                 self.cannons[cannon_id] = Cannon(cannon_data)
+                self.remember_handle('cannons', cannon_data)
+            
+            # Projectiles and powerups already in flight
+            for projectile_data in data.get('projectiles', []):
+                self.spawn('projectiles', projectile_data)
+                self.remember_handle('projectiles', projectile_data)
+            for powerup_data in data.get('powerups', []):
+                self.spawn('powerups', powerup_data)
+                self.remember_handle('powerups', powerup_data)
+        
+        elif msg_type in ('game_snapshot', 'game_delta'):
+            self.handle_snapshot(msg_type, message['payload'])
+
+        elif msg_type == 'input_ack':
+            self.reconcile(data.get('seq', 0), data['x'], data['y'])
+
+        elif msg_type == 'udp_offer':
+            if not self.tcp_only and self.udp_link is None:
+                udp_thread = threading.Thread(target=self.open_udp_link, args=(data['port'], data['token']))
+                udp_thread.daemon = True
+                udp_thread.start()
+
+        elif msg_type == 'interest':
+            # Entities that came into or went out of our area of interest
+            self.handle_interest(data.get('enter', {}), data.get('leave', {}), data.get('tick'))
+
+        elif msg_type == 'player_joined':
+            player_data = data.get('player')
+            if player_data:
+                player_id = player_data['id']
+                if player_id not in self.players:
+                    self.players[player_id] = Player(player_data['x'], player_data['y'], tuple(player_data['color']),
+                                                     player_id, player_data.get('name', "Player"))
+                self.remember_handle('players', player_data, data.get('tick'))
                 
         elif msg_type == 'game_update':
             # update game state and players
@@ -289,31 +539,21 @@ class GameClient:
                     if player_id == self.client_id:
                         self.local_player = self.players[player_id]
                 else:
+                    player = self.players[player_id]
                     if player_id != self.client_id:
-                        if hasattr(self.players[player_id], 'x') and hasattr(self.players[player_id], 'y'):
-                            self.players[player_id].prev_x = self.players[player_id].x
-                            self.players[player_id].prev_y = self.players[player_id].y
-                            self.players[player_id].interp_start_time = time.time()
-                        else:
-                            self.players[player_id].prev_x = player_data['x']
-                            self.players[player_id].prev_y = player_data['y']
-                            self.players[player_id].interp_start_time = time.time()
+                        player.prev_x = player.x
+                        player.prev_y = player.y
+                        player.interp_start_time = time.time()
                             
                         # Set target position from server
-                        self.players[player_id].target_x = player_data['x']
-                        self.players[player_id].target_y = player_data['y']
+                        player.target_x = player_data['x']
+                        player.target_y = player_data['y']
                         
                         # Update other properties immediately
-                        player_copy = player_data.copy()
-                        if 'x' in player_copy: del player_copy['x']
-                        if 'y' in player_copy: del player_copy['y']
-                        self.players[player_id].update(player_copy)
+                        player.update(player_data, position=False)
                     else:
                         # For local player, only update non-position properties
-                        local_data = player_data.copy()
-                        if 'x' in local_data: del local_data['x']
-                        if 'y' in local_data: del local_data['y']
-                        self.local_player.update(local_data)
+                        self.local_player.update(player_data, position=False)
               # Update cannons
             current_cannons = set()
             for cannon_data in data.get('cannons', []):
@@ -342,14 +582,14 @@ class GameClient:
                 current_projectiles.add(projectile_id)
                 
                 if projectile_id not in self.projectiles:
-                    self.projectiles[projectile_id] = Projectile(projectile_data)
+                    self.spawn('projectiles', projectile_data)
                 else:
                     self.projectiles[projectile_id].update(projectile_data)
             
             # Remove projectiles that no longer exist
             for projectile_id in list(self.projectiles.keys()):
                 if projectile_id not in current_projectiles:
-                    del self.projectiles[projectile_id]
+                    self.despawn('projectiles', projectile_id)
             
             # Update powerups
             current_powerups = set()
@@ -358,12 +598,12 @@ class GameClient:
                 current_powerups.add(powerup_id)
                 
                 if powerup_id not in self.powerups:
-                    self.powerups[powerup_id] = PowerUp(powerup_data)
+                    self.spawn('powerups', powerup_data)
             
             # Remove powerups that no longer exist
             for powerup_id in list(self.powerups.keys()):
                 if powerup_id not in current_powerups:
-                    del self.powerups[powerup_id]
+                    self.despawn('powerups', powerup_id)
             
             # Update game settings
             if 'sudden_death' in data:
@@ -381,6 +621,7 @@ class GameClient:
                 cannon_id = cannon_data.get('id', 'unknown')
                 try:
                     self.cannons[cannon_id] = Cannon(cannon_data)
+                    self.remember_handle('cannons', cannon_data, data.get('tick'))
                     self.add_message(f"New {cannon_data.get('type', 'unknown')} cannon spawned!")
                 except Exception as e:
                     pass 
@@ -405,8 +646,8 @@ class GameClient:
         elif msg_type == 'cannon_shot':
             projectile_data = data.get('projectile')
             if projectile_data:
-                projectile_id = projectile_data['id']
-                self.projectiles[projectile_id] = Projectile(projectile_data)
+                self.spawn('projectiles', projectile_data)
+                self.remember_handle('projectiles', projectile_data, data.get('tick'))
 
         elif msg_type == 'player_hit':
             player_id = data.get('player_id')
@@ -434,8 +675,8 @@ class GameClient:
         elif msg_type == 'powerup_spawn':
             powerup_data = data.get('powerup')
             if powerup_data:
-                powerup_id = powerup_data['id']
-                self.powerups[powerup_id] = PowerUp(powerup_data)
+                self.spawn('powerups', powerup_data)
+                self.remember_handle('powerups', powerup_data, data.get('tick'))
         elif msg_type == 'powerup_pickup':
             powerup_id = data.get('powerup_id')
             player_id = data.get('player_id')
@@ -454,8 +695,7 @@ class GameClient:
                         self.players[player_id].apply_speed_boost()
                 
                 # remove powerup
-                if powerup_id in self.powerups:
-                    del self.powerups[powerup_id]
+                self.despawn('powerups', powerup_id)
         
         elif msg_type == 'sudden_death':
             self.sudden_death = True
@@ -480,6 +720,7 @@ class GameClient:
             player_id = data.get('player_id')
             
             if player_id in self.players:
+                self.forget_handles('players', {player_id})
                 del self.players[player_id]
                 self.add_message("A player left the game.")
 
@@ -488,6 +729,246 @@ class GameClient:
             # Round-trip time in ms
             rtt = (now - self.ping_sent_time) * 1000  
             self.latency_ms = int(rtt)
+            self.rtt_samples.append(rtt)
+    
+    def spawn(self, kind, entity_data):
+        """Add a projectile or powerup from server data, taking the object from its pool"""
+        entities, pool = self.entity_stores[kind]
+        entity = entities.get(entity_data['id'])
+        if entity is None:
+            entities[entity_data['id']] = pool.acquire(entity_data)
+        else:
+            entity.reset(entity_data)
+    
+    def despawn(self, kind, entity_id):
+        """Remove an entity, projectiles and powerups go back to their pool"""
+        entities, pool = self.entity_stores[kind]
+        entity = entities.pop(entity_id, None)
+        if entity is not None and pool is not None:
+            pool.release(entity)
+    
+    def remember_handle(self, kind, entity_data, tick=None):
+        handle = entity_data.get('handle')
+        if handle:
+            self.entity_handles[kind][handle] = entity_data['id']
+            # make sure the next snapshot writes this entity even if its record is unchanged
+            self.applied_records[kind].pop(handle, None)
+            if tick is not None:
+                # snapshots come over UDP and can be overtaken by this event
+                self.handle_ticks[kind][handle] = tick
+    
+    def forget_handles(self, kind, entity_ids):
+        handles = self.entity_handles[kind]
+        for handle, entity_id in list(handles.items()):
+            if entity_id in entity_ids:
+                del handles[handle]
+                self.applied_records[kind].pop(handle, None)
+                self.handle_ticks[kind].pop(handle, None)
+    
+    def handle_interest(self, entered, left, tick=None):
+        for player_data in entered.get('players', []):
+            player_id = player_data['id']
+            if player_id in self.players:
+                self.players[player_id].update(player_data)
+            else:
+                self.players[player_id] = Player(player_data['x'], player_data['y'], tuple(player_data['color']),
+                                                 player_id, player_data.get('name', "Player"))
+            self.remember_handle('players', player_data, tick)
+        for cannon_data in entered.get('cannons', []):
+            self.cannons[cannon_data['id']] = Cannon(cannon_data)
+            self.remember_handle('cannons', cannon_data, tick)
+        for kind in ('projectiles', 'powerups'):
+            for entity_data in entered.get(kind, []):
+                self.spawn(kind, entity_data)
+                self.remember_handle(kind, entity_data, tick)
+
+        for kind in ENTITY_KINDS:
+            entity_ids = set(left.get(kind, [])) - {self.client_id}
+            if entity_ids:
+                self.forget_handles(kind, entity_ids)
+                for entity_id in entity_ids:
+                    self.despawn(kind, entity_id)
+
+    def handle_snapshot(self, msg_type, payload):
+        """Rebuild the world state from a full or delta snapshot and apply it"""
+        if msg_type == 'game_snapshot':
+            state = decode_full_snapshot(payload)
+            if self.snapshot_tick is not None and state.tick <= self.snapshot_tick:
+                return
+        else:
+            tick, base_tick = delta_ticks(payload)
+            if self.snapshot_tick is not None and tick <= self.snapshot_tick:
+                # overtaken by a newer one on the other channel
+                return
+            base = self.snapshot_history.get(base_tick)
+            if base is None:
+                # We lost the baseline, ask the server for a full snapshot
+                self.snapshot_ack_tick = None
+                self.snapshot_ack_pending = True
+                return
+            state = decode_delta_snapshot(payload, base)
+        
+        self.snapshot_history.add(state)
+        self.apply_world_state(state)
+        self.snapshot_tick = state.tick
+        self.snapshot_ack_tick = state.tick
+        self.snapshot_ack_pending = True
+    
+    def apply_world_state(self, state):
+        """Write the records that changed since the last applied state into the entity objects"""
+        now = time.time()
+        
+        applied = self.applied_records['players']
+        handles = self.entity_handles['players']
+        for handle, record in state.players.items():
+            if applied.get(handle) == record:
+                continue
+            player = self.players.get(handles.get(handle))
+            if player is None:
+                continue
+            applied[handle] = record
+            _, x, y, health, flags, cannon_handle = record
+            player.health = health
+            player.alive = bool(flags & PLAYER_ALIVE)
+            player.has_cannon = bool(flags & PLAYER_HAS_CANNON)
+            player.cannon_id = self.entity_handles['cannons'].get(cannon_handle)
+            if player is not self.local_player and self.interpolation is None:
+                # interpolate remote players towards the new position
+                player.prev_x = player.x
+                player.prev_y = player.y
+                player.interp_start_time = now
+                player.target_x = x / POSITION_SCALE
+                player.target_y = y / POSITION_SCALE
+            player.refresh_timers()
+        for handle in applied.keys() - state.players.keys():
+            del applied[handle]
+        
+        # Entities we haven't seen a spawn event for yet are skipped until it arrives
+        applied = self.applied_records['cannons']
+        handles = self.entity_handles['cannons']
+        for handle, record in state.cannons.items():
+            if applied.get(handle) == record:
+                continue
+            cannon = self.cannons.get(handles.get(handle))
+            if cannon is None:
+                continue
+            applied[handle] = record
+            _, x, y, type_id, shots_left, controller, use_timer = record
+            cannon.x = x / POSITION_SCALE
+            cannon.y = y / POSITION_SCALE
+            cannon.type = CANNON_TYPES[type_id]
+            cannon.shots_left = shots_left
+            cannon.controlled_by = self.entity_handles['players'].get(controller)
+            cannon.use_timer = use_timer / TIMER_SCALE
+            if cannon.type in self.cannon_styles:
+                cannon.color = self.cannon_styles[cannon.type][0]
+            if cannon.controlled_by in self.players:
+                self.players[cannon.controlled_by].cannon_use_timer = cannon.use_timer
+        
+        applied = self.applied_records['projectiles']
+        handles = self.entity_handles['projectiles']
+        for handle, record in state.projectiles.items():
+            if applied.get(handle) == record:
+                continue
+            projectile = self.projectiles.get(handles.get(handle))
+            if projectile is None:
+                continue
+            applied[handle] = record
+            _, x, y, dx, dy, type_id, bounces, owner = record
+            projectile.x = x / POSITION_SCALE
+            projectile.y = y / POSITION_SCALE
+            projectile.dx = dx / VELOCITY_SCALE
+            projectile.dy = dy / VELOCITY_SCALE
+            projectile.bounces = bounces
+        
+        # Anything we know a handle for that isn't in the state anymore is gone
+        for kind in ('cannons', 'projectiles', 'powerups'):
+            handles = self.entity_handles[kind]
+            applied = self.applied_records[kind]
+            ticks = self.handle_ticks[kind]
+            for handle in handles.keys() - getattr(state, kind).keys():
+                if ticks.get(handle, 0) > state.tick:
+                    continue  # its spawn event is newer than this snapshot
+                self.despawn(kind, handles.pop(handle))
+                applied.pop(handle, None)
+                ticks.pop(handle, None)
+        
+        self.sudden_death = bool(state.flags & FLAG_SUDDEN_DEATH)
+        self.sudden_death_timer = state.timer / TIMER_SCALE
+        
+        if self.interpolation is not None:
+            self.buffer_positions(state, now)
+    
+    def buffer_positions(self, state, now):
+        """Hand the entity positions of a state to the interpolation buffer"""
+        self.interpolation.add(
+            state.tick,
+            {handle: (record[1] / POSITION_SCALE, record[2] / POSITION_SCALE)
+             for handle, record in state.players.items()},
+            {handle: (record[1] / POSITION_SCALE, record[2] / POSITION_SCALE)
+             for handle, record in state.cannons.items()},
+            {handle: (record[1] / POSITION_SCALE, record[2] / POSITION_SCALE,
+                      record[3] / VELOCITY_SCALE, record[4] / VELOCITY_SCALE)
+             for handle, record in state.projectiles.items()},
+            now
+        )
+    
+    def apply_interpolated(self, now, delta_time):
+        """Move remote entities to where the snapshot buffer says they are at playback time"""
+        sampled = self.interpolation.sample(now)
+        if sampled is None:
+            return
+        players, cannons, projectiles = sampled
+        for kind, entities, positions in (('players', self.players, players),
+                                          ('cannons', self.cannons, cannons),
+                                          ('projectiles', self.projectiles, projectiles)):
+            handles = self.entity_handles[kind]
+            for handle, position in positions.items():
+                entity = entities.get(handles.get(handle))
+                if entity is None or entity is self.local_player:
+                    continue
+                entity.x = position[0]
+                entity.y = position[1]
+        
+        # Projectiles the snapshots haven't caught up with yet fly on from their spawn data
+        handles = self.entity_handles['projectiles']
+        sampled_ids = {handles.get(handle) for handle in projectiles}
+        for projectile_id, projectile in self.projectiles.items():
+            if projectile_id not in sampled_ids:
+                projectile.advance(delta_time)
+    
+    def reconcile(self, acked_seq, x, y):
+        """Take the server's position for our player and replay the inputs it hasn't seen yet"""
+        if not self.local_player:
+            return
+        while self.pending_inputs and self.pending_inputs[0][0] <= acked_seq:
+            self.pending_inputs.popleft()
+        for seq, move_x, move_y, speed in self.pending_inputs:
+            x, y = apply_move(x, y, move_x, move_y, speed, WINDOW_WIDTH, WINDOW_HEIGHT)
+        self.local_player.x = x
+        self.local_player.y = y
+    
+    def send_input(self, move_x, move_y):
+        """Move the local player by one input and send the input to the server"""
+        speed = self.local_player.speed
+        self.local_player.x, self.local_player.y = apply_move(
+            self.local_player.x, self.local_player.y, move_x, move_y, speed, WINDOW_WIDTH, WINDOW_HEIGHT
+        )
+        if self.protocol != PROTOCOL_FRAMED:
+            # legacy servers take absolute positions
+            self.send_update()
+            return
+        
+        self.input_seq += 1
+        self.pending_inputs.append((self.input_seq, move_x, move_y, speed))
+        self.commands.add('player_input', {'seq': self.input_seq, 'move': [move_x, move_y]})
+    
+    def flush_commands(self):
+        try:
+            self.commands.flush(self.socket, self.protocol, self.udp_link)
+        except Exception as e:
+            print(f"Error sending commands: {e}")
+            self.disconnect()
     
     def send_update(self):
         if not self.connected or not self.local_player or not self.local_player.alive:
@@ -495,18 +976,13 @@ class GameClient:
         
         # Send current position to server
         update = {
-            'type': 'player_update',
             'data': {
                 'x': self.local_player.x,
                 'y': self.local_player.y,
             }
         }
         
-        try:
-            self.socket.sendall(json.dumps(update).encode('utf-8'))
-        except Exception as e:
-            print(f"Error sending update: {e}")
-            self.disconnect()
+        self.commands.add('player_update', update)
     
     def try_pickup_cannon(self):
         if not self.connected or not self.local_player or not self.local_player.alive or self.local_player.has_cannon:
@@ -520,17 +996,7 @@ class GameClient:
                 
                 if distance < PLAYER_RADIUS + 20:
                     # Send pickup request to server
-                    message = {
-                        'type': 'cannon_pickup',
-                        'cannon_id': cannon_id
-                    }
-                    
-                    try:
-                        self.socket.sendall(json.dumps(message).encode('utf-8'))
-                    except Exception as e:
-                        print(f"Error sending pickup request: {e}")
-                        self.disconnect()
-                    
+                    self.commands.add('cannon_pickup', {'cannon_id': cannon_id})
                     return
     
     def try_shoot_cannon(self, target_x, target_y):
@@ -548,16 +1014,11 @@ class GameClient:
                     
         # Send shoot request to server
         message = {
-            'type': 'cannon_shoot',
             'target_x': target_x,
             'target_y': target_y
         }
         
-        try:
-            self.socket.sendall(json.dumps(message).encode('utf-8'))
-        except Exception as e:
-            print(f"Error sending shoot request: {e}")
-            self.disconnect()
+        self.commands.add('cannon_shoot', message)
 
     def add_message(self, text):
         self.messages.append({
@@ -588,11 +1049,6 @@ class GameClient:
                     mouse_x, mouse_y = pygame.mouse.get_pos()
                     self.try_shoot_cannon(mouse_x, mouse_y)
                 
-            # DEBUG: Force teleport player with T key
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_t and self.local_player:
-                self.local_player.x = 500
-                self.local_player.y = 500
-                self.send_update()
         
         # Check if local player exists
         if not self.local_player:
@@ -616,6 +1072,7 @@ class GameClient:
                 dy -= 1
             if keys[K_DOWN] or keys[K_s]:
                 dy += 1
+            move_x, move_y = dx, dy
             
             # diagonal movement
             if dx != 0 and dy != 0:
@@ -626,105 +1083,50 @@ class GameClient:
             self.input_x = dx
             self.input_y = dy
             
-            # FORCE PLAYER MOVEMENT regardless of network conditions
+            # Predict the move right away, the server applies the same input and acks it
             if dx != 0 or dy != 0:
-                old_x = self.local_player.x
-                old_y = self.local_player.y
-                
-                # Force movement with speed factor
-                speed = self.local_player.speed
-                new_x = old_x + dx * speed
-                new_y = old_y + dy * speed
-                
-                # Wall collision - keep player within bounds
-                new_x = max(PLAYER_RADIUS+50, min(WINDOW_WIDTH-50 - PLAYER_RADIUS, new_x))
-                new_y = max(PLAYER_RADIUS+50, min(WINDOW_HEIGHT-50 - PLAYER_RADIUS, new_y))
-                
-                # Directly update player position
-                self.local_player.x = new_x
-                self.local_player.y = new_y
-                
-                # Send update to server
-                self.send_update()
+                self.send_input(move_x, move_y)
         else:
             # Reset input values when player has a cannon (can't move)
             self.input_x = 0
             self.input_y = 0
     
-    def draw(self):
-        # Clear the screen
-        self.window.fill(BLACK)
-        
-        # Draw obstacles
+    def build_background(self):
+        """Draw the arena and obstacles once, they only change with the map"""
+        self.background = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT)).convert()
+        self.background.fill(BLACK)
         for obstacle in self.obstacles:
-            obstacle.draw(self.window)
+            obstacle.draw(self.background)
+    
+    def draw(self):
+        # Clear the screen: the whole background, or in dirty rect mode only
+        # where something was drawn last frame
+        full_frame = not self.dirty_rects or self.background is None
+        if self.background is None:
+            self.build_background()
+        if full_frame:
+            self.window.blit(self.background, (0, 0))
+        else:
+            for rect in self.previous_dirty:
+                self.window.blit(self.background, rect, rect)
+        dirty = []  # every area drawn on this frame
+        mark = dirty.append
         
+        # Every sprite is pre-rendered, each group goes to the window in one blits call
         # Draw powerups
-        for powerup_id, powerup in self.powerups.items():
-            powerup.draw(self.window)        
-        for cannon_id, cannon in self.cannons.items():
-            try:
-                standard_radius = 15
-                
-                # Set cannon color based on type
-                if cannon.type == "EXPLOSIVE":
-                    cannon_color = (255, 255, 0)  
-                elif cannon.type == "BOUNCING":
-                    cannon_color = (0, 255, 0)   
-                elif cannon.type == "RAPID":
-                    cannon_color = (255, 0, 0)    
-                else:
-                    cannon_color = (255, 255, 0)
-                
-                # Draw the cannon base circle with type-specific color
-                pygame.draw.circle(self.window, cannon_color, (int(cannon.x), int(cannon.y)), standard_radius)
-                
-                if cannon.type == "EXPLOSIVE":
-                    # explosion-like icon (asterisk shape)
-                    for angle in range(0, 360, 45):
-                        rad_angle = math.radians(angle)
-                        start_x = int(cannon.x + (standard_radius * 0.4 * math.cos(rad_angle)))
-                        start_y = int(cannon.y + (standard_radius * 0.4 * math.sin(rad_angle)))
-                        end_x = int(cannon.x + (standard_radius * 0.9 * math.cos(rad_angle)))
-                        end_y = int(cannon.y + (standard_radius * 0.9 * math.sin(rad_angle)))
-                        pygame.draw.line(self.window, (0, 0, 0), (start_x, start_y), (end_x, end_y), 2)
-                
-                elif cannon.type == "BOUNCING":
-                    # bounce icon (zigzag line)
-                    points = [
-                        (int(cannon.x - standard_radius * 0.7), int(cannon.y)),
-                        (int(cannon.x - standard_radius * 0.35), int(cannon.y - standard_radius * 0.5)),
-                        (int(cannon.x + standard_radius * 0.35), int(cannon.y + standard_radius * 0.5)),
-                        (int(cannon.x + standard_radius * 0.7), int(cannon.y))
-                    ]
-                    pygame.draw.lines(self.window, (0, 0, 0), False, points, 2)
-                
-                elif cannon.type == "RAPID":
-                    # rapid fire icon (three parallel lines)
-                    line_length = standard_radius * 0.8
-                    for i in range(-1, 2):
-                        offset = i * 4
-                        pygame.draw.line(
-                            self.window,
-                            (0, 0, 0),
-                            (int(cannon.x - line_length/2), int(cannon.y + offset)),
-                            (int(cannon.x + line_length/2), int(cannon.y + offset)),
-                            2
-                        )
-                
-                # white outline around free cannons
-                if cannon.controlled_by is None:
-                    pygame.draw.circle(self.window, (255, 255, 255), (int(cannon.x), int(cannon.y)), standard_radius + 2, 2)
-            except Exception as e:
-                print(f"Error drawing cannon {cannon_id}: {e}")
+        dirty.extend(self.window.blits([powerup.sprite() for powerup in self.powerups.values()]))
+        
+        # Draw cannons
+        dirty.extend(self.window.blits([cannon.sprite() for cannon in self.cannons.values()]))
         
         # Draw players
         for player_id, player in self.players.items():
-            player.draw(self.window)
+            rect = player.draw(self.window)
+            if rect:
+                mark(rect)
         
         # Draw projectiles
-        for projectile_id, projectile in self.projectiles.items():
-            projectile.draw(self.window)
+        dirty.extend(self.window.blits([projectile.sprite() for projectile in self.projectiles.values()]))
         
         # Draw aiming crosshair when player has a cannon
         if self.local_player and self.local_player.has_cannon:
@@ -733,62 +1135,66 @@ class GameClient:
             player_x, player_y = int(self.local_player.x), int(self.local_player.y)
             
             # Draw a line from player to mouse cursor
-            pygame.draw.line(self.window, (255, 255, 255), (player_x, player_y), (mouse_x, mouse_y), 2)
+            mark(pygame.draw.line(self.window, (255, 255, 255), (player_x, player_y), (mouse_x, mouse_y), 2))
             
             # Draw crosshair at mouse position for aiming
-            pygame.draw.circle(self.window, (255, 0, 0), (mouse_x, mouse_y), 10, 2)
-            pygame.draw.line(self.window, (255, 0, 0), (mouse_x - 15, mouse_y), (mouse_x + 15, mouse_y), 2)
-            pygame.draw.line(self.window, (255, 0, 0), (mouse_x, mouse_y - 15), (mouse_x, mouse_y + 15), 2)
+            mark(pygame.draw.circle(self.window, (255, 0, 0), (mouse_x, mouse_y), 10, 2))
+            mark(pygame.draw.line(self.window, (255, 0, 0), (mouse_x - 15, mouse_y), (mouse_x + 15, mouse_y), 2))
+            mark(pygame.draw.line(self.window, (255, 0, 0), (mouse_x, mouse_y - 15), (mouse_x, mouse_y + 15), 2))
         
         if self.sudden_death:
-            text = self.font.render("SUDDEN DEATH", True, RED)
-            self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, 10))
+            text = text_cache.render("SUDDEN DEATH", RED, FONT_SIZE)
+            mark(self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, 10)))
         else:
             # Draw timer until sudden death
             minutes = max(0, int(self.sudden_death_timer // 60))
             seconds = max(0, int(self.sudden_death_timer % 60))
-            text = self.font.render(f"Sudden Death: {minutes}:{seconds:02d}", True, WHITE)
-            self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, 10))
+            text = text_cache.label('timer', f"Sudden Death: {minutes}:{seconds:02d}", WHITE, FONT_SIZE)
+            mark(self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, 10)))
         
         # Draw player count
         max_players = 4  
         alive_players = sum(1 for player in self.players.values() if player.alive)
-        text = self.small_font.render(f"Players: {alive_players}/{max_players}", True, WHITE)
-        self.window.blit(text, (10, 10))
+        text = text_cache.label('players', f"Players: {alive_players}/{max_players}", WHITE, SMALL_FONT_SIZE)
+        mark(self.window.blit(text, (10, 10)))
 
         if self.latency_ms is not None:
-            text = self.small_font.render(f"Ping: {self.latency_ms} ms", True, WHITE)
-            self.window.blit(text, (10, 30))
+            text = text_cache.label('ping', f"Ping: {self.latency_ms} ms", WHITE, SMALL_FONT_SIZE)
+            mark(self.window.blit(text, (10, 30)))
         
         # Draw controls help - updated to reflect the new Space key shooting
-        text = self.small_font.render("WASD: Move | E: Pick up cannon | SPACE: Shoot", True, WHITE)
-        self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, WINDOW_HEIGHT - 30))
+        text = text_cache.label('help', self.help_text, WHITE, SMALL_FONT_SIZE)
+        mark(self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, WINDOW_HEIGHT - 30)))
         
         # Draw messages
         message_y = 50
         for message in self.messages:
-            text = self.small_font.render(message['text'], True, WHITE)
-            self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, message_y))
+            text = text_cache.render(message['text'], WHITE, SMALL_FONT_SIZE)
+            mark(self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, message_y)))
             message_y += 25
         
         # Draw game over screen
         if self.game_over:
             overlay = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA)
             overlay.fill((0, 0, 0, 128))
-            self.window.blit(overlay, (0, 0))
+            mark(self.window.blit(overlay, (0, 0)))
             
             if self.winner_id == self.client_id:
-                text = self.font.render("YOU WIN!", True, GREEN)
+                text = text_cache.render("YOU WIN!", GREEN, FONT_SIZE)
             else:
-                text = self.font.render("GAME OVER", True, RED)
+                text = text_cache.render("GAME OVER", RED, FONT_SIZE)
             
             self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, WINDOW_HEIGHT//2 - text.get_height()//2))
             
-            text = self.small_font.render("New game starting soon...", True, WHITE)
+            text = text_cache.render("New game starting soon...", WHITE, SMALL_FONT_SIZE)
             self.window.blit(text, (WINDOW_WIDTH//2 - text.get_width()//2, WINDOW_HEIGHT//2 + 50))
         
         # Update display
-        pygame.display.update()
+        if full_frame:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.previous_dirty + dirty)
+        self.previous_dirty = dirty
     
     def update(self):
         delta_time = self.clock.get_time() / 1000.0
@@ -797,34 +1203,56 @@ class GameClient:
         self.update_messages()
         
         current_time = time.time()
+        if self.interpolation is not None:
+            self.apply_interpolated(current_time, delta_time)
         for player_id, player in self.players.items():
-            if player_id == self.client_id:
+            # snapshots only touch players whose state changed, so expire boosts here
+            player.refresh_timers()
+            if player_id == self.client_id or self.interpolation is not None:
                 continue
-            if not hasattr(player, 'interp_start_time') or not hasattr(player, 'target_x'):
+            if player.interp_start_time is None:
                 continue
             interp_duration = 0.1
             time_since_update = current_time - player.interp_start_time
             progress = min(time_since_update / interp_duration, 1.0)
             
-            if hasattr(player, 'prev_x') and hasattr(player, 'prev_y'):
-                player.x = player.prev_x + (player.target_x - player.prev_x) * progress
-                player.y = player.prev_y + (player.target_y - player.prev_y) * progress
+            player.x = player.prev_x + (player.target_x - player.prev_x) * progress
+            player.y = player.prev_y + (player.target_y - player.prev_y) * progress
         
-        # Send periodic ping for latency measurement
-        if self.connected and current_time - self.last_ping_time > self.ping_interval:
-            self.last_ping_time = current_time
-            self.ping_sent_time = current_time
+        # Switching transports goes over TCP on its own (the server doesn't look into batches for it),
+        # sent from here rather than from the UDP thread so writes to the socket don't interleave
+        if self.connected and self.udp_notice is not None:
+            notice = self.udp_notice
+            self.udp_notice = None
             try:
-                self.socket.sendall(json.dumps({'type': 'ping'}).encode('utf-8'))
+                self.send_message(notice, {})
             except Exception as e:
-                pass
+                print(f"Error sending {notice}: {e}")
+                self.disconnect()
         
-        # Update cannon objects
-        for cannon_id, cannon in self.cannons.items():
-            cannon.update()
+        # Tell the server which snapshot we applied last so it can send deltas against it
+        if self.connected and self.snapshot_ack_pending:
+            self.snapshot_ack_pending = False
+            self.commands.add('snapshot_ack', {'tick': self.snapshot_ack_tick})
+        
+        # Send periodic ping for latency measurement, right away so the queue doesn't count as lag
+        if self.connected and current_time - self.last_ping_time > self.ping_interval:
+            self.last_ping_time = current_time
+            self.commands.add('ping', {})
+            # stamped before sending, the pong can be back before flush_commands returns
+            self.ping_sent_time = time.time()
+            self.flush_commands()
+        
+        # Everything queued since the last network tick goes out in one write
+        if self.connected and current_time - self.last_send_time >= self.input_update_rate:
+            self.last_send_time = current_time
+            self.flush_commands()
     
     def disconnect(self):
         self.connected = False
+        if self.udp_link is not None:
+            self.udp_link.close()
+            self.udp_link = None
         if self.socket:
             try:
                 self.socket.close()
@@ -841,6 +1269,12 @@ class GameClient:
         
         self.running = True
         while self.running:
+            if self.headless:
+                # nothing to read or draw, just keep up with the server
+                self.update()
+                self.clock.tick(60)
+                continue
+            
             # Handle user input
             self.handle_input()
             
@@ -855,13 +1289,18 @@ class GameClient:
         
         # Clean up
         self.disconnect()
-        pygame.quit()
+        if not self.headless:
+            pygame.quit()
 
 if __name__ == "__main__":
     # Get server address from command line args if provided
     server_address = DEFAULT_SERVER
-    if len(sys.argv) > 1:
-        server_address = sys.argv[1]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if args:
+        server_address = args[0]
     
-    client = GameClient(server_address)
+    # --dirty-rects: only redraw and flip the parts of the screen that changed
+    # --tcp-only: ignore the server's UDP channel, everything over the TCP connection
+    client = GameClient(server_address, dirty_rects='--dirty-rects' in sys.argv[1:],
+                        tcp_only='--tcp-only' in sys.argv[1:])
     client.run()
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+commands.py
+
+Outbound command aggregator for the client.
+
+Everything the client tells the server is queued here and written out once
+per network tick instead of one sendall per message. While commands wait:
+
+- movement inputs in the same direction with consecutive sequence numbers
+  merge into one input with a repeat count,
+- commands where only the newest one matters (absolute positions, snapshot
+  acks) replace the queued one,
+
+and the whole queue goes out as a single 'batch' frame (concatenated JSON
+messages on the legacy protocol), one syscall per flush.
+
+While a UDP link is up, movement inputs and snapshot acks go out as one
+datagram per flush instead, which also repeats the inputs of the previous
+datagram in case it was lost (the server skips inputs it has already seen).
+"""
+
+from protocol import DATAGRAM_MESSAGE_TYPES, PROTOCOL_FRAMED, encode_message, encode_legacy_message
+
+# Commands where a newer one makes the queued one pointless
+LATEST_ONLY = {'player_update', 'snapshot_ack'}
+
+
+class CommandAggregator:
+    def __init__(self):
+        self.commands = []  # [msg_type, body] in the order they were queued
+        self.queued = 0  # commands handed to add()
+        self.coalesced = 0  # of those, merged into or replaced by another one
+        self.flushes = 0  # sendall calls
+        self.last_inputs = []  # movement inputs of the last datagram, sent again with the next one
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, msg_type, body):
+        self.queued += 1
+        if msg_type == 'player_input' and self.merge_input(body):
+            self.coalesced += 1
+            return
+        if msg_type in LATEST_ONLY:
+            for command in self.commands:
+                if command[0] == msg_type:
+                    # keep its place in the queue, just send the newer body
+                    command[1] = body
+                    self.coalesced += 1
+                    return
+        self.commands.append([msg_type, body])
+
+    def merge_input(self, body):
+        """Fold a movement input into the last queued one if it continues it"""
+        if not self.commands or self.commands[-1][0] != 'player_input':
+            return False
+        last = self.commands[-1][1]
+        if last['move'] != body['move'] or body['seq'] != last['seq'] + 1:
+            return False
+        last['seq'] = body['seq']
+        last['count'] = last.get('count', 1) + 1
+        return True
+
+    def encode(self, protocol, commands=None):
+        """Every queued command (or the given ones) as the bytes of one write"""
+        if commands is None:
+            commands = self.commands
+        if protocol != PROTOCOL_FRAMED:
+            return b''.join(encode_legacy_message(dict(body, type=msg_type)) for msg_type, body in commands)
+        if len(commands) == 1:
+            msg_type, body = commands[0]
+            return encode_message(msg_type, body)
+        return encode_message('batch', {
+            'messages': [dict(body, type=msg_type) for msg_type, body in commands]
+        })
+
+    def flush(self, sock, protocol, link=None):
+        """Send everything queued with a single sendall (and one datagram over link), returns whether anything was sent"""
+        if not self.commands:
+            return False
+        commands = self.commands
+        self.commands = []
+        self.flushes += 1
+        if link is not None:
+            unreliable = [command for command in commands if command[0] in DATAGRAM_MESSAGE_TYPES]
+            if unreliable and link.send(self.encode(protocol, self.last_inputs + unreliable)):
+                self.last_inputs = [command for command in unreliable if command[0] == 'player_input']
+                commands = [command for command in commands if command[0] not in DATAGRAM_MESSAGE_TYPES]
+        if commands:
+            sock.sendall(self.encode(protocol, commands))
+        return True
@@ -0,0 +1,38 @@
+"""
+entity_pool.py
+
+Object reuse for the client entities that come and go all match.
+
+Projectiles live for a second or two and powerups not much longer, so
+their objects are recycled: an EntityPool keeps the ones that left the
+world on a free list and the next spawn reset()s one of those instead of
+allocating a new object.
+"""
+
+POOL_LIMIT = 512  # free objects kept per pool, a burst beyond that is left to the GC
+
+
+class EntityPool:
+    """Free list of one entity class, objects are reset from server data on reuse"""
+
+    def __init__(self, entity_class, limit=POOL_LIMIT):
+        self.entity_class = entity_class
+        self.limit = limit
+        self.free = []
+
+    def acquire(self, data):
+        if self.free:
+            entity = self.free.pop()
+            entity.reset(data)
+            return entity
+        return self.entity_class(data)
+
+    def release(self, entity):
+        if len(self.free) < self.limit:
+            self.free.append(entity)
+
+    def release_all(self, entities):
+        """Take back every entity of an id -> entity dict and empty it"""
+        for entity in entities.values():
+            self.release(entity)
+        entities.clear()
@@ -0,0 +1,120 @@
+"""
+interpolation.py
+
+Snapshot interpolation buffer for remote entities.
+
+Snapshots are stamped with the server tick they were taken on. Instead of
+chasing each snapshot the moment it arrives, remote entities are drawn at a
+playback time a little behind the newest snapshot, blending between the
+two buffered snapshots around it. The delay adapts: it is one snapshot
+interval plus a multiple of the measured arrival jitter, so a steady
+connection plays close to live and a jittery one buys itself more slack.
+
+When the buffer runs dry (a late or lost snapshot) projectiles keep flying
+along their dx/dy for a short while and everything else holds still. When
+snapshots pile up faster than they are played back, the buffer drops the
+oldest and jumps the playback clock forward.
+"""
+
+from collections import deque, namedtuple
+
+MIN_DELAY = 0.05  # seconds of playback delay at the least
+MAX_DELAY = 0.5
+JITTER_SCALE = 2.0  # delay = snapshot interval + JITTER_SCALE * jitter
+SMOOTHING = 0.1  # weight of a new sample in the running averages
+MAX_EXTRAPOLATION = 0.25  # seconds projectiles keep moving without a snapshot
+MAX_FRAMES = 32
+
+# Entity positions at one server time: handle -> (x, y) for players and
+# cannons, handle -> (x, y, dx, dy) for projectiles
+SnapshotFrame = namedtuple('SnapshotFrame', ['server_time', 'players', 'cannons', 'projectiles'])
+
+
+def lerp_positions(old, new, alpha):
+    """Positions blended between two frames, entities only in the old one are gone"""
+    blended = {}
+    for handle, position in new.items():
+        previous = old.get(handle)
+        if previous is None:
+            blended[handle] = position
+        else:
+            blended[handle] = (previous[0] + (position[0] - previous[0]) * alpha,
+                               previous[1] + (position[1] - previous[1]) * alpha)
+    return blended
+
+
+class InterpolationBuffer:
+    def __init__(self, tick_rate):
+        self.tick_interval = 1.0 / tick_rate
+        self.frames = deque()
+        self.offset = None  # local time minus server time, smoothed
+        self.jitter = 0.0  # mean deviation of arrivals from that offset
+        self.send_interval = self.tick_interval  # server time between snapshots, smoothed
+        self.delay = MIN_DELAY
+        self.dropped = 0  # frames thrown away before they were played
+
+    def add(self, tick, players, cannons, projectiles, now):
+        """Buffer the entity positions of the snapshot for tick, received at local time now"""
+        server_time = tick * self.tick_interval
+        frames = self.frames
+        if frames and server_time <= frames[-1].server_time:
+            # out of date already, a newer snapshot got here first
+            self.dropped += 1
+            return
+
+        sample = now - server_time
+        if self.offset is None:
+            self.offset = sample
+        else:
+            deviation = sample - self.offset
+            self.jitter += SMOOTHING * (abs(deviation) - self.jitter)
+            self.offset += SMOOTHING * deviation
+        if frames:
+            self.send_interval += SMOOTHING * (server_time - frames[-1].server_time - self.send_interval)
+        self.delay = min(MAX_DELAY, max(MIN_DELAY, self.send_interval + JITTER_SCALE * self.jitter))
+
+        frames.append(SnapshotFrame(server_time, players, cannons, projectiles))
+        while len(frames) > MAX_FRAMES:
+            frames.popleft()
+            self.dropped += 1
+
+        # Fallen behind (the clock estimate lagged a drop in latency, or we
+        # stalled): skip ahead instead of playing the backlog in slow motion
+        if server_time - self.playback_time(now) > MAX_DELAY + self.send_interval:
+            self.offset = sample
+            while len(frames) > 2 and frames[1].server_time <= self.playback_time(now):
+                frames.popleft()
+                self.dropped += 1
+
+    def playback_time(self, now):
+        """Server time to draw remote entities at"""
+        return now - self.offset - self.delay
+
+    def sample(self, now):
+        """(players, cannons, projectiles) positions at the playback time, None before the first snapshot"""
+        frames = self.frames
+        if not frames:
+            return None
+        render_time = self.playback_time(now)
+        # frames before the pair we are between won't be needed again
+        while len(frames) > 2 and frames[1].server_time <= render_time:
+            frames.popleft()
+
+        old = frames[0]
+        if len(frames) == 1 or render_time >= frames[1].server_time:
+            # Ran past the newest snapshot: projectiles carry on, the rest waits
+            newest = frames[-1]
+            ahead = min(max(0.0, render_time - newest.server_time), MAX_EXTRAPOLATION)
+            projectiles = {
+                handle: (x + dx * ahead, y + dy * ahead)
+                for handle, (x, y, dx, dy) in newest.projectiles.items()
+            }
+            return newest.players, newest.cannons, projectiles
+        if render_time <= old.server_time:
+            return old.players, old.cannons, old.projectiles
+
+        new = frames[1]
+        alpha = (render_time - old.server_time) / (new.server_time - old.server_time)
+        return (lerp_positions(old.players, new.players, alpha),
+                lerp_positions(old.cannons, new.cannons, alpha),
+                lerp_positions(old.projectiles, new.projectiles, alpha))
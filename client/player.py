@@ -1,6 +1,8 @@
 import pygame
 from pygame.locals import *
 import time
+from text_cache import text_cache
+from sprites import atlas
 
 # Colors
 RED = (255, 0, 0)
@@ -14,8 +16,13 @@ PLAYER_RADIUS = 20
 PLAYER_MAX_HEALTH = 100
 PLAYER_NORMAL_SPEED = 5
 PLAYER_BOOST_SPEED = 7.5 
+NAME_FONT_SIZE = 24
 
 class Player:
+    __slots__ = ('x', 'y', 'color', 'id', 'name', 'health', 'speed', 'alive', 'has_cannon', 'cannon_id',
+                 'cannon_use_timer', 'speed_boosted', 'speed_boost_end_time',
+                 'prev_x', 'prev_y', 'target_x', 'target_y', 'interp_start_time')
+
     def __init__(self, x, y, color, player_id, name="Player"):
         self.x = x
         self.y = y
@@ -30,25 +37,30 @@ class Player:
         self.cannon_use_timer = 0 
         self.speed_boosted = False
         self.speed_boost_end_time = 0
-        self.boost_particles = []
-        self.font = pygame.font.SysFont(None, 24)
-    def update(self, data):
-        """Update player state from server data"""
-        if 'x' in data:
+        # Remote players slide from prev to target, legacy updates only
+        self.prev_x = None
+        self.prev_y = None
+        self.target_x = None
+        self.target_y = None
+        self.interp_start_time = None
+    
+    def update(self, data, position=True):
+        """Update player state from a whole player dict as the server sends it,
+        x and y only if position
+        """
+        if position:
             self.x = data['x']
-        if 'y' in data:
             self.y = data['y']
-        if 'health' in data:
-            self.health = data['health']
-        if 'alive' in data:
-            self.alive = data['alive']
-        if 'has_cannon' in data:
-            self.has_cannon = data['has_cannon']
-        if 'cannon_id' in data:
-            self.cannon_id = data['cannon_id']
-        if 'name' in data:
-            self.name = data['name']
+        self.health = data['health']
+        self.alive = data['alive']
+        self.has_cannon = data['has_cannon']
+        self.cannon_id = data['cannon_id']
+        self.name = data['name']
         
+        self.refresh_timers()
+    
+    def refresh_timers(self):
+        """Expire the speed boost and cannon timer after a state change"""
         # check for speed boost timeout
         current_time = time.time()
         if self.speed_boosted and current_time > self.speed_boost_end_time:
@@ -65,42 +77,37 @@ class Player:
         self.speed = PLAYER_BOOST_SPEED
         self.speed_boost_end_time = time.time() + 10 
     def draw(self, surface):
+        """Draw the player, returns the Rect of the surface area it touched (None if nothing)"""
         if not self.alive:
-            return
+            return None
         
-        # Draw player
-        pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), PLAYER_RADIUS)
+        boost_remaining = self.speed_boost_end_time - time.time() if self.speed_boosted else 0
+        # Calculate remaining time (10 seconds max before explosion)
+        cannon_remaining = 10 - self.cannon_use_timer if self.has_cannon else 0
+        
+        # Draw player, with a yellow ring while boosted and an orange one while holding a cannon
+        image, offset = atlas.player(self.color, boost_remaining > 0, cannon_remaining > 0)
+        dirty = surface.blit(image, (int(self.x) - offset, int(self.y) - offset))
         
         # Draw name above health bar
-        name_text = self.font.render(self.name, True, WHITE)
+        name_text = text_cache.render(self.name, WHITE, NAME_FONT_SIZE)
         name_width = name_text.get_width()
-        surface.blit(name_text, (self.x - name_width // 2, self.y - 50))
+        dirty.union_ip(surface.blit(name_text, (self.x - name_width // 2, self.y - 50)))
         
         # Draw health bar
         health_width = 40 * (self.health / PLAYER_MAX_HEALTH)
-        pygame.draw.rect(surface, RED, (self.x - 20, self.y - 30, 40, 5))
+        dirty.union_ip(pygame.draw.rect(surface, RED, (self.x - 20, self.y - 30, 40, 5)))
         pygame.draw.rect(surface, GREEN, (self.x - 20, self.y - 30, health_width, 5))
-          # Draw speed boost indicator if active
-        if self.speed_boosted:
-            time_remaining = self.speed_boost_end_time - time.time()
-            if time_remaining > 0:
-                # Draw a yellow ring around the player
-                pygame.draw.circle(surface, YELLOW, (int(self.x), int(self.y)), PLAYER_RADIUS + 3, 2)
-                
-                # Draw boost timer indicator
-                boost_width = 40 * (time_remaining / 10)
-                pygame.draw.rect(surface, YELLOW, (self.x - 20, self.y - 25, boost_width, 3))
+        # Draw boost timer indicator if active
+        if boost_remaining > 0:
+            boost_width = 40 * (boost_remaining / 10)
+            pygame.draw.rect(surface, YELLOW, (self.x - 20, self.y - 25, boost_width, 3))
         
         # Draw cannon timer indicator if player has a cannon
-        if self.has_cannon and hasattr(self, 'cannon_use_timer'):
-            # Calculate remaining time (10 seconds max before explosion)
-            time_remaining = 10 - self.cannon_use_timer
-            if time_remaining > 0:
-                # Draw an orange ring around the player
-                pygame.draw.circle(surface, ORANGE, (int(self.x), int(self.y)), PLAYER_RADIUS + 6, 2)
-                
-                # Draw cannon timer indicator
-                # If speed boost is active, position the cannon timer below it
-                y_offset = -20 if self.speed_boosted else -25
-                cannon_width = 40 * (time_remaining / 10)
-                pygame.draw.rect(surface, ORANGE, (self.x - 20, self.y + y_offset, cannon_width, 3))
\ No newline at end of file
+        if cannon_remaining > 0:
+            # If speed boost is active, position the cannon timer below it
+            y_offset = -20 if self.speed_boosted else -25
+            cannon_width = 40 * (cannon_remaining / 10)
+            pygame.draw.rect(surface, ORANGE, (self.x - 20, self.y + y_offset, cannon_width, 3))
+        
+        return dirty
@@ -1,14 +1,26 @@
-import pygame
 from pygame.locals import *
+from sprites import atlas
 
 class PowerUp:
+    __slots__ = ('id', 'x', 'y', 'type', 'radius', 'color')
+
     def __init__(self, data):
+        self.reset(data)
+    
+    def reset(self, data):
+        """Set every field from server data, pooled objects are reused through this"""
         self.id = data['id']
         self.x = data['x']
         self.y = data['y']
         self.type = data['type']
         self.radius = data.get('radius', 10)
-        self.color = tuple(data['color']) if isinstance(data['color'], list) else data['color']
+        self.color = tuple(data['color'])
+    
+    def sprite(self):
+        """(sprite surface, top left position) to blit"""
+        image, offset = atlas.circle(self.radius, self.color)
+        return image, (int(self.x) - offset, int(self.y) - offset)
     
     def draw(self, surface):
-        pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), self.radius)
\ No newline at end of file
+        """Draw the powerup, returns the Rect it touched"""
+        return surface.blit(*self.sprite())
@@ -1,52 +1,50 @@
-import pygame
 from pygame.locals import *
+from sprites import atlas
 
 class Projectile:
+    __slots__ = ('id', 'x', 'y', 'dx', 'dy', 'radius', 'color', 'damage', 'owner_id', 'can_bounce', 'bounces')
+
     def __init__(self, data_or_x, y=None, dx=None, dy=None):
         # Handle both initialization methods: with data dict or with coordinates
         if y is None and isinstance(data_or_x, dict):
             # Initialize from server data
-            data = data_or_x
-            self.id = data.get('id', '')
-            self.x = data.get('x', 0)
-            self.y = data.get('y', 0)
-            self.dx = data.get('dx', 0)
-            self.dy = data.get('dy', 0)
-            self.radius = data.get('radius', 5)
-            self.color = tuple(data['color']) if isinstance(data['color'], list) else data.get('color', (255, 0, 0))
-            self.damage = data.get('damage', 10)
-            self.owner_id = data.get('owner_id')
-            self.can_bounce = data.get('can_bounce', False)
-            self.bounces = data.get('bounces', 0)
+            self.reset(data_or_x)
         else:
             # Initialize with coordinates
-            self.id = ''
-            self.x = data_or_x
-            self.y = y
-            self.dx = dx if dx is not None else 0
-            self.dy = dy if dy is not None else 0
-            self.radius = 5
-            self.color = (255, 0, 0)  # Red color for projectiles
-            self.damage = 10
-            self.owner_id = None
-            self.can_bounce = False
-            self.bounces = 0
+            self.reset({'x': data_or_x, 'y': y, 'dx': dx if dx is not None else 0, 'dy': dy if dy is not None else 0})
 
-    def update(self, data=None):
-        if data:
-            # Update from server data
-            if 'x' in data:
-                self.x = data['x']
-            if 'y' in data:
-                self.y = data['y']
-            if 'dx' in data:
-                self.dx = data['dx']
-            if 'dy' in data:
-                self.dy = data['dy']
-        else:
-            # Update position with current velocity
-            self.x += self.dx
-            self.y += self.dy
+    def reset(self, data):
+        """Set every field from server data, pooled objects are reused through this"""
+        get = data.get
+        self.id = get('id', '')
+        self.x = get('x', 0)
+        self.y = get('y', 0)
+        self.dx = get('dx', 0)
+        self.dy = get('dy', 0)
+        self.radius = get('radius', 5)
+        self.color = tuple(get('color', (255, 0, 0)))  # Red color for projectiles
+        self.damage = get('damage', 10)
+        self.owner_id = get('owner_id')
+        self.can_bounce = get('can_bounce', False)
+        self.bounces = get('bounces', 0)
+
+    def update(self, data):
+        """Update the flight from a whole projectile dict as the server sends it"""
+        self.x = data['x']
+        self.y = data['y']
+        self.dx = data['dx']
+        self.dy = data['dy']
+
+    def advance(self, delta_time):
+        """Fly on for delta_time seconds, dx/dy are in pixels per second"""
+        self.x += self.dx * delta_time
+        self.y += self.dy * delta_time
+
+    def sprite(self):
+        """(sprite surface, top left position) to blit"""
+        image, offset = atlas.circle(self.radius, self.color)
+        return image, (int(self.x) - offset, int(self.y) - offset)
 
     def draw(self, surface):
-        pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), self.radius)
\ No newline at end of file
+        """Draw the projectile, returns the Rect it touched"""
+        return surface.blit(*self.sprite())
@@ -0,0 +1,190 @@
+"""
+replay_player.py
+
+Plays a replay file written by a server started with --record.
+
+The file is memory mapped and fed to a GameClient that never connects: the
+keyframe before the playback position stands in for 'init', snapshots and
+events go through the same handlers as live traffic and the frame is drawn
+by GameClient.draw. The remote entity interpolation runs at the replay
+speed, so movement stays smooth from 1x to 16x.
+
+    SPACE       pause / resume
+    LEFT/RIGHT  seek SEEK_STEP seconds back / forward
+    UP/DOWN     double / halve the speed
+    HOME        back to the start
+    ESC         quit
+
+    python client/replay_player.py replays/room-1-20260101-120000.replay [--speed 4] [--start 30]
+"""
+
+import argparse
+import sys
+import time
+
+import pygame
+
+from client import GameClient
+from interpolation import InterpolationBuffer
+from protocol import decode_message
+from replay import RECORD_EVENT, RECORD_KEYFRAME, ReplayError, ReplayReader, decode_keyframe
+
+MIN_SPEED = 1
+MAX_SPEED = 16
+SEEK_STEP = 10  # seconds
+
+
+class ReplayClient(GameClient):
+    """GameClient fed from a replay file instead of a server"""
+
+    def __init__(self, reader, speed=1, dirty_rects=False):
+        super().__init__(dirty_rects=dirty_rects, player_name='replay')
+        self.reader = reader
+        self.tick_rate = reader.header.get('tick_rate', 20)
+        self.speed = speed
+        self.paused = False
+        self.position = reader.first_tick  # playback tick, fractional
+        self.offset = reader.records_start  # next record to apply
+        pygame.display.set_caption("Cannon Chaos - Replay")
+
+    def reset_world(self):
+        """Forget everything, the next keyframe rebuilds it"""
+        for entities, pool in self.entity_stores.values():
+            if pool is not None:
+                pool.release_all(entities)
+            else:
+                entities.clear()
+        for kind in self.entity_handles:
+            self.entity_handles[kind].clear()
+            self.applied_records[kind].clear()
+            self.handle_ticks[kind].clear()
+        self.snapshot_history.clear()
+        self.snapshot_tick = None
+        self.messages = []
+        self.game_over = False
+        self.winner_id = None
+
+    def seek(self, tick):
+        """Rebuild the world from the keyframe before tick and play forward to it"""
+        tick = min(max(tick, self.reader.first_tick), self.reader.last_tick)
+        self.reset_world()
+        _, _, payload, self.offset = self.reader.record_at(self.reader.seek(tick))
+        entities, snapshot_payload = decode_keyframe(payload)
+        header = self.reader.header
+        self.handle_server_message({'type': 'init', 'data': dict(
+            entities, map_width=header['map_width'], map_height=header['map_height'], tick_rate=self.tick_rate,
+            obstacles=header['obstacles'], tables=header['tables']
+        )})
+        self.handle_snapshot('game_snapshot', snapshot_payload)
+        self.position = tick
+        self.play_until(tick)
+        self.restart_interpolation()
+
+    def play_until(self, tick):
+        """Apply every record up to tick"""
+        while True:
+            record = self.reader.record_at(self.offset)
+            if record is None or record[1] > tick:
+                return
+            kind, _, payload, self.offset = record
+            if kind == RECORD_EVENT:
+                self.handle_server_message(decode_message(payload[0], payload[1:]))
+            elif kind == RECORD_KEYFRAME:
+                # playing on from the previous snapshot, only its full snapshot is needed
+                self.handle_snapshot('game_snapshot', decode_keyframe(payload)[1])
+            else:
+                self.handle_snapshot('game_delta', payload)
+
+    def restart_interpolation(self):
+        """Interpolate at the replay speed, starting from the state shown now"""
+        self.interpolation = InterpolationBuffer(self.tick_rate * self.speed)
+        state = self.snapshot_history.get(self.snapshot_tick)
+        if state is not None:
+            now = time.time()
+            self.buffer_positions(state, now)
+            # place everything now, a paused replay doesn't run update()
+            self.apply_interpolated(now, 0)
+
+    def set_speed(self, speed):
+        self.speed = min(max(speed, MIN_SPEED), MAX_SPEED)
+        self.restart_interpolation()
+
+    def advance(self, delta_time):
+        """Move the playback position on by delta_time seconds of wall time"""
+        self.position = min(self.position + delta_time * self.tick_rate * self.speed, self.reader.last_tick)
+        self.play_until(int(self.position))
+        if self.position >= self.reader.last_tick:
+            self.paused = True
+
+    def handle_input(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    self.running = False
+                elif event.key == pygame.K_SPACE:
+                    if self.position >= self.reader.last_tick:
+                        self.seek(self.reader.first_tick)
+                    self.paused = not self.paused
+                    self.restart_interpolation()
+                elif event.key == pygame.K_LEFT:
+                    self.seek(self.position - SEEK_STEP * self.tick_rate)
+                elif event.key == pygame.K_RIGHT:
+                    self.seek(self.position + SEEK_STEP * self.tick_rate)
+                elif event.key == pygame.K_UP:
+                    self.set_speed(self.speed * 2)
+                elif event.key == pygame.K_DOWN:
+                    self.set_speed(self.speed / 2)
+                elif event.key == pygame.K_HOME:
+                    self.seek(self.reader.first_tick)
+
+    def clock_text(self, tick):
+        seconds = int((tick - self.reader.first_tick) / self.tick_rate)
+        return f"{seconds // 60}:{seconds % 60:02d}"
+
+    def run(self):
+        self.running = True
+        self.seek(self.position)
+        while self.running:
+            self.handle_input()
+            if not self.paused:
+                self.advance(self.clock.get_time() / 1000.0)
+                self.update()
+            state = "PAUSED" if self.paused else f"{self.speed:g}x"
+            self.help_text = (f"{self.clock_text(self.position)} / {self.clock_text(self.reader.last_tick)} {state}"
+                              " | SPACE: Pause | LEFT/RIGHT: Seek | UP/DOWN: Speed")
+            self.draw()
+            self.clock.tick(60)
+        pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a recorded Cannon Chaos match")
+    parser.add_argument('replay', help="replay file written by server.py --record")
+    parser.add_argument('--speed', type=float, default=1, help=f"playback speed, {MIN_SPEED} to {MAX_SPEED}")
+    parser.add_argument('--start', type=float, default=0, metavar='SECONDS',
+                        help="start this many seconds into the match")
+    parser.add_argument('--dirty-rects', action='store_true',
+                        help="only redraw and push the parts of the window that changed")
+    args = parser.parse_args()
+    if not MIN_SPEED <= args.speed <= MAX_SPEED:
+        parser.error(f"--speed must be between {MIN_SPEED} and {MAX_SPEED}")
+
+    try:
+        reader = ReplayReader(args.replay)
+    except (OSError, ReplayError) as e:
+        print(f"Can't play {args.replay}: {e}")
+        sys.exit(1)
+    if not reader.complete:
+        print("The recording was never finished, playing what was written")
+    player = ReplayClient(reader, args.speed, args.dirty_rects)
+    player.position = reader.first_tick + args.start * player.tick_rate
+    try:
+        player.run()
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
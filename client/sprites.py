@@ -0,0 +1,146 @@
+"""
+sprites.py
+
+Pre-rendered sprites for everything the client draws many times per frame.
+
+Cannons (with their type icon, with and without the free cannon outline),
+projectiles and powerups (one per radius and color) and player bodies (one
+per color and ring combination) are drawn once onto small surfaces with a
+transparent color key. Drawing an entity is then a single blit, and a whole group can go
+to the window in one Surface.blits call.
+
+Each sprite is square and centred on the entity, so it is blitted at
+(x - offset, y - offset).
+"""
+
+import math
+import pygame
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+YELLOW = (255, 255, 0)
+ORANGE = (255, 165, 0)
+
+CANNON_RADIUS = 15
+CANNON_COLORS = {
+    'EXPLOSIVE': (255, 255, 0),
+    'BOUNCING': (0, 255, 0),
+    'RAPID': (255, 0, 0),
+}
+DEFAULT_CANNON_COLOR = (255, 255, 0)
+
+# Sprites are opaque surfaces with a transparent color key rather than per
+# pixel alpha: run length encoded colorkey blits are several times faster.
+# Player colors come from the server, so sprites of exactly this color use
+# ALT_COLORKEY instead.
+COLORKEY = (255, 0, 255)
+ALT_COLORKEY = (0, 1, 0)
+
+PLAYER_RADIUS = 20
+BOOST_RING_RADIUS = PLAYER_RADIUS + 3
+CANNON_RING_RADIUS = PLAYER_RADIUS + 6
+
+
+def new_sprite(radius, color):
+    """Blank transparent sprite with room for a circle of radius in color, and its centre offset"""
+    offset = radius + 1
+    surface = pygame.Surface((offset * 2 + 1, offset * 2 + 1))
+    surface.fill(ALT_COLORKEY if tuple(color) == COLORKEY else COLORKEY)
+    return surface, offset
+
+
+def draw_cannon_icon(surface, cannon_type, center, radius):
+    """The black icon of a cannon type, on a base circle at center"""
+    cx, cy = center
+    if cannon_type == "EXPLOSIVE":
+        # explosion-like icon (asterisk shape)
+        for angle in range(0, 360, 45):
+            rad_angle = math.radians(angle)
+            start = (int(cx + radius * 0.4 * math.cos(rad_angle)), int(cy + radius * 0.4 * math.sin(rad_angle)))
+            end = (int(cx + radius * 0.9 * math.cos(rad_angle)), int(cy + radius * 0.9 * math.sin(rad_angle)))
+            pygame.draw.line(surface, BLACK, start, end, 2)
+
+    elif cannon_type == "BOUNCING":
+        # bounce icon (zigzag line)
+        points = [
+            (int(cx - radius * 0.7), int(cy)),
+            (int(cx - radius * 0.35), int(cy - radius * 0.5)),
+            (int(cx + radius * 0.35), int(cy + radius * 0.5)),
+            (int(cx + radius * 0.7), int(cy))
+        ]
+        pygame.draw.lines(surface, BLACK, False, points, 2)
+
+    elif cannon_type == "RAPID":
+        # rapid fire icon (three parallel lines)
+        line_length = radius * 0.8
+        for i in range(-1, 2):
+            offset = i * 4
+            pygame.draw.line(surface, BLACK, (int(cx - line_length/2), int(cy + offset)),
+                             (int(cx + line_length/2), int(cy + offset)), 2)
+
+
+class SpriteAtlas:
+    def __init__(self):
+        self.sprites = {}  # key -> (surface, offset)
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def get(self, key, build):
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            surface, offset = build()
+            # the corner is always outside the circle, so it holds the color key
+            surface.set_colorkey(surface.get_at((0, 0)), pygame.RLEACCEL)
+            if pygame.display.get_surface() is not None:
+                # same pixel format as the window, so blits don't convert every frame
+                surface = surface.convert()
+            sprite = (surface, offset)
+            self.sprites[key] = sprite
+        return sprite
+
+    def preload(self):
+        """Render every cannon sprite up front, they are known before any map arrives"""
+        for cannon_type in CANNON_COLORS:
+            self.cannon(cannon_type, True)
+            self.cannon(cannon_type, False)
+
+    def circle(self, radius, color):
+        """Filled circle, for projectiles and powerups"""
+        color = tuple(color)
+
+        def build():
+            surface, offset = new_sprite(radius, color)
+            pygame.draw.circle(surface, color, (offset, offset), radius)
+            return surface, offset
+        return self.get(('circle', radius, color), build)
+
+    def cannon(self, cannon_type, free):
+        """Cannon base and icon, free cannons get a white outline"""
+        def build():
+            color = CANNON_COLORS.get(cannon_type, DEFAULT_CANNON_COLOR)
+            surface, offset = new_sprite(CANNON_RADIUS + 2, color)
+            pygame.draw.circle(surface, color, (offset, offset), CANNON_RADIUS)
+            draw_cannon_icon(surface, cannon_type, (offset, offset), CANNON_RADIUS)
+            if free:
+                pygame.draw.circle(surface, WHITE, (offset, offset), CANNON_RADIUS + 2, 2)
+            return surface, offset
+        return self.get(('cannon', cannon_type, free), build)
+
+    def player(self, color, boosted, has_cannon):
+        """Player body with the speed boost and cannon timer rings"""
+        color = tuple(color)
+
+        def build():
+            surface, offset = new_sprite(CANNON_RING_RADIUS, color)
+            pygame.draw.circle(surface, color, (offset, offset), PLAYER_RADIUS)
+            if boosted:
+                pygame.draw.circle(surface, YELLOW, (offset, offset), BOOST_RING_RADIUS, 2)
+            if has_cannon:
+                pygame.draw.circle(surface, ORANGE, (offset, offset), CANNON_RING_RADIUS, 2)
+            return surface, offset
+        return self.get(('player', color, boosted, has_cannon), build)
+
+
+# One atlas for the whole client
+atlas = SpriteAtlas()
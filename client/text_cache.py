@@ -0,0 +1,93 @@
+"""
+text_cache.py
+
+Shared fonts and rendered text surfaces for the client.
+
+Building a SysFont is slow and font.render is not free, yet most of the text
+on screen (player names, the controls help, messages) is the same from one
+frame to the next. Fonts are created once per (name, size) and kept in a
+registry; rendered surfaces live in an LRU cache keyed by the font, text and
+color, which drops the least recently drawn surfaces once it holds more than
+max_bytes of pixels.
+
+Text that changes over time but is drawn in one place, like the sudden
+death timer or the ping, goes through label() instead: each label keeps its
+last surface and renders again only when its text actually changes, so
+every old value of a countdown does not pile up in the LRU cache.
+"""
+
+from collections import OrderedDict
+import pygame
+
+MAX_TEXT_BYTES = 4 * 1024 * 1024  # pixel memory the LRU cache may hold
+
+_fonts = {}
+
+
+def get_font(size, name=None):
+    """The shared font for (name, size), created on first use"""
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pygame.font.SysFont(name, size)
+        _fonts[key] = font
+    return font
+
+
+def surface_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class TextCache:
+    def __init__(self, max_bytes=MAX_TEXT_BYTES):
+        self.max_bytes = max_bytes
+        self.surfaces = OrderedDict()  # (size, name, text, color) -> surface, least recently used first
+        self.bytes = 0
+        self.labels = {}  # label -> ((size, name, text, color), surface)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def render(self, text, color, size, name=None):
+        """Surface with text drawn antialiased in color, rendered once and reused"""
+        key = (size, name, text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = get_font(size, name).render(text, True, color)
+        self.surfaces[key] = surface
+        self.bytes += surface_bytes(surface)
+        # always keep the surface just rendered, even if it alone is over budget
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.bytes -= surface_bytes(evicted)
+            self.evictions += 1
+        return surface
+
+    def label(self, label, text, color, size, name=None):
+        """Surface for a piece of text drawn in one place, rendered again only when it changes"""
+        key = (size, name, text, tuple(color))
+        cached = self.labels.get(label)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        surface = get_font(size, name).render(text, True, color)
+        self.labels[label] = (key, surface)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.labels.clear()
+        self.bytes = 0
+
+
+# One cache for the whole client, the HUD and every player draw from it
+text_cache = TextCache()
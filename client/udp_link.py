@@ -0,0 +1,93 @@
+"""
+udp_link.py
+
+Client end of the server's optional UDP channel (see server/udp_channel.py).
+
+The server offers the channel over TCP with a port and a session token.
+The link says hello from a UDP socket until the server echoes it, which
+proves datagrams get through both ways, and from then on carries the
+snapshots coming in and the movement inputs and snapshot acks going out.
+"""
+
+import socket
+import time
+
+from protocol import (
+    MAX_DATAGRAM_FRAME, MAX_DATAGRAM_SIZE, ProtocolError, decode_datagram, encode_datagram, encode_message
+)
+
+HELLO_INTERVAL = 0.2  # seconds between hellos while waiting for the echo
+HELLO_TIMEOUT = 2.0  # seconds without an echo before we give up and stay on TCP
+SILENCE_TIMEOUT = 3.0  # seconds without a datagram before the channel counts as broken
+
+
+class UdpLink:
+    def __init__(self, server_address, port, token):
+        self.token = token
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # connected, so only the server's datagrams are delivered to us
+        self.socket.connect((server_address, port))
+        self.send_seq = 0
+        self.recv_seq = 0
+        self.last_received = None
+
+    def send(self, frame):
+        """Send a frame as one datagram, False if it is too big or the send failed"""
+        if len(frame) > MAX_DATAGRAM_FRAME:
+            return False
+        self.send_seq += 1
+        try:
+            self.socket.send(encode_datagram(self.token, self.send_seq, frame))
+        except OSError:
+            return False
+        return True
+
+    def receive(self, timeout):
+        """(message, datagram size) from the server, (None, 0) if nothing arrived within timeout seconds.
+
+        Duplicates and datagrams older than the newest one received are skipped.
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None, 0
+            self.socket.settimeout(remaining)
+            try:
+                data = self.socket.recv(MAX_DATAGRAM_SIZE)
+            except socket.timeout:
+                return None, 0
+            except ConnectionError:
+                # ICMP port unreachable from an earlier send, keep listening until the timeout
+                continue
+            try:
+                token, seq, message = decode_datagram(data)
+            except ProtocolError:
+                continue
+            if token != self.token or seq <= self.recv_seq:
+                continue
+            self.recv_seq = seq
+            self.last_received = time.time()
+            return message, len(data)
+
+    def handshake(self):
+        """Say hello until the server echoes it, False if it never does"""
+        hello = encode_message('udp_hello', {})
+        deadline = time.time() + HELLO_TIMEOUT
+        while time.time() < deadline:
+            if not self.send(hello):
+                return False
+            message, _ = self.receive(HELLO_INTERVAL)
+            if message is not None and message.get('type') == 'udp_hello':
+                return True
+        return False
+
+    def silent(self):
+        """Whether the server hasn't been heard from for too long"""
+        return self.last_received is None or time.time() - self.last_received > SILENCE_TIMEOUT
+
+    def close(self):
+        try:
+            self.socket.close()
+        except OSError:
+            pass
@@ -0,0 +1,39 @@
+"""
+movement.py
+
+Player movement rules, shared by the server, which applies every input and
+owns the real position, and the client, which predicts its own player with
+the same code so the two end up in the same place.
+
+An input is one frame of movement: a direction with each axis in -1, 0, 1.
+"""
+
+PLAYER_RADIUS = 20
+PLAYER_SPEED = 5  # pixels per input
+PLAYER_BOOST_SPEED = 7.5
+SPEED_BOOST_DURATION = 10  # seconds
+ARENA_MARGIN = 50  # nothing moves closer than this to the map edge
+DIAGONAL_SCALE = 0.7071  # 1/sqrt(2)
+
+
+def clamp_direction(value):
+    """One axis of an input as -1, 0 or 1, whatever the sender put in it"""
+    if not isinstance(value, (int, float)):
+        return 0
+    return (value > 0) - (value < 0)
+
+
+def apply_move(x, y, move_x, move_y, speed, map_width, map_height):
+    """Position after one input from (x, y)"""
+    dx = clamp_direction(move_x)
+    dy = clamp_direction(move_y)
+
+    # diagonal movement
+    if dx != 0 and dy != 0:
+        dx *= DIAGONAL_SCALE
+        dy *= DIAGONAL_SCALE
+
+    # Wall collision - keep player within bounds
+    new_x = max(PLAYER_RADIUS + ARENA_MARGIN, min(map_width - ARENA_MARGIN - PLAYER_RADIUS, x + dx * speed))
+    new_y = max(PLAYER_RADIUS + ARENA_MARGIN, min(map_height - ARENA_MARGIN - PLAYER_RADIUS, y + dy * speed))
+    return new_x, new_y
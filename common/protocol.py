@@ -0,0 +1,210 @@
+"""
+protocol.py
+
+Framed wire protocol shared by the server and the client.
+
+Every message on the wire is a fixed 5 byte header (payload length as an
+unsigned 32 bit int, message type id as an unsigned byte) followed by the
+payload. A connection opts in by sending PROTOCOL_HELLO before anything else;
+the server answers with the same hello. Connections that start with a raw
+JSON object ('{') are treated as legacy clients and keep the old
+brace-delimited JSON stream.
+
+Framed clients can additionally open a UDP channel. A datagram is an 8 byte
+header (the session token the server handed out over TCP and a per
+direction sequence number) followed by exactly one frame. Only traffic where
+the newest message supersedes the older ones travels this way, everything
+else stays on the TCP stream.
+"""
+
+import json
+import struct
+
+PROTOCOL_VERSION = 1
+PROTOCOL_MAGIC = b'CCAR'
+PROTOCOL_HELLO = PROTOCOL_MAGIC + struct.pack('!H', PROTOCOL_VERSION)
+
+HEADER = struct.Struct('!IB')
+HEADER_SIZE = HEADER.size
+MAX_FRAME_SIZE = 1 << 20  # 1 MiB, anything bigger is a broken or hostile peer
+
+# Connection protocols
+PROTOCOL_FRAMED = 'framed'
+PROTOCOL_LEGACY = 'legacy'
+
+# Message type ids, the position in this list is the id on the wire (1-based).
+# Only ever append to this list, reordering breaks old peers.
+MESSAGE_TYPES = [
+    'register',
+    'init',
+    'game_update',
+    'game_start',
+    'cannon_spawn',
+    'cannon_pickup',
+    'cannon_shot',
+    'cannon_shoot',
+    'cannon_depleted',
+    'cannon_exploded',
+    'player_update',
+    'player_hit',
+    'player_eliminated',
+    'powerup_spawn',
+    'powerup_pickup',
+    'sudden_death',
+    'game_over',
+    'game_reset',
+    'player_left',
+    'ping',
+    'pong',
+    'game_snapshot',
+    'player_joined',
+    'game_delta',
+    'snapshot_ack',
+    'interest',
+    'player_input',
+    'input_ack',
+    'batch',
+    'udp_offer',
+    'udp_hello',
+    'udp_ready',
+    'udp_close',
+]
+MESSAGE_TYPE_IDS = {name: i for i, name in enumerate(MESSAGE_TYPES, 1)}
+
+# Message types whose payload is raw bytes rather than JSON
+BINARY_MESSAGE_TYPES = {'game_snapshot', 'game_delta'}
+
+# Datagrams: session token and sequence number, then one frame
+DATAGRAM_HEADER = struct.Struct('!II')
+# Kept under common path MTUs, a bigger frame takes the TCP stream instead of being fragmented
+MAX_DATAGRAM_SIZE = 1200
+MAX_DATAGRAM_FRAME = MAX_DATAGRAM_SIZE - DATAGRAM_HEADER.size
+
+# Client commands allowed over UDP (on their own or in a batch), losing one
+# only delays the state it carries until the next one
+DATAGRAM_MESSAGE_TYPES = {'player_input', 'snapshot_ack'}
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends something that can't be framed or decoded"""
+
+
+def encode_message(msg_type, body):
+    """Encode a message body (a dict without its 'type') into one frame"""
+    return encode_frame(msg_type, json.dumps(body, separators=(',', ':')).encode('utf-8'))
+
+
+def encode_frame(msg_type, payload):
+    """Wrap an already encoded payload (bytes) in a frame"""
+    return HEADER.pack(len(payload), MESSAGE_TYPE_IDS[msg_type]) + payload
+
+
+def encode_legacy_message(message):
+    """Encode a full message dict for a legacy JSON stream"""
+    return json.dumps(message).encode('utf-8')
+
+
+def decode_message(type_id, payload):
+    """Decode a frame payload back into a message dict with its 'type' set.
+
+    Binary message types are not decoded here, their raw bytes are passed
+    along under 'payload'.
+    """
+    if not 1 <= type_id <= len(MESSAGE_TYPES):
+        raise ProtocolError(f"Unknown message type id {type_id}")
+    msg_type = MESSAGE_TYPES[type_id - 1]
+    if msg_type in BINARY_MESSAGE_TYPES:
+        return {'type': msg_type, 'payload': payload}
+    message = json.loads(payload)
+    message['type'] = msg_type
+    return message
+
+
+def encode_datagram(token, seq, frame):
+    return DATAGRAM_HEADER.pack(token, seq) + frame
+
+
+def decode_datagram(data):
+    """(token, seq, message) of a received datagram"""
+    if len(data) < DATAGRAM_HEADER.size + HEADER_SIZE:
+        raise ProtocolError(f"Datagram of {len(data)} bytes is too short")
+    token, seq = DATAGRAM_HEADER.unpack_from(data)
+    length, type_id = HEADER.unpack_from(data, DATAGRAM_HEADER.size)
+    if length != len(data) - DATAGRAM_HEADER.size - HEADER_SIZE:
+        raise ProtocolError("Datagram length doesn't match its frame")
+    try:
+        return token, seq, decode_message(type_id, data[DATAGRAM_HEADER.size + HEADER_SIZE:])
+    except ValueError as e:
+        raise ProtocolError(f"Undecodable datagram: {e}")
+
+
+def parse_hello(data):
+    """Return the peer's protocol version from a hello, or None if it isn't one"""
+    if len(data) < len(PROTOCOL_HELLO) or not data.startswith(PROTOCOL_MAGIC):
+        return None
+    return struct.unpack_from('!H', data, len(PROTOCOL_MAGIC))[0]
+
+
+class FrameBuffer:
+    """Reusable receive buffer that splits a byte stream into frames.
+
+    Data is read straight into a preallocated bytearray with recv_into, so a
+    received chunk costs one header unpack per frame instead of a scan over
+    the whole buffer.
+    """
+
+    def __init__(self, capacity=65536, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray(capacity)
+        self.start = 0  # first unread byte
+        self.end = 0  # one past the last received byte
+        self.max_frame_size = max_frame_size
+
+    def _reserve(self, size):
+        """Make room for at least size more bytes after self.end"""
+        if len(self.buffer) - self.end >= size:
+            return
+        pending = self.end - self.start
+        if self.start:
+            # compact unread bytes to the front
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        if len(self.buffer) - self.end < size:
+            self.buffer.extend(bytes(size - (len(self.buffer) - self.end)))
+
+    def recv_from(self, sock, size=4096):
+        """Receive into the buffer, returns the byte count (0 means EOF)"""
+        self._reserve(size)
+        with memoryview(self.buffer) as view:
+            received = sock.recv_into(view[self.end:])
+        self.end += received
+        return received
+
+    def feed(self, data):
+        """Append bytes that were received some other way"""
+        self._reserve(len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def frames(self):
+        """Yield (type_id, payload) for every complete frame in the buffer"""
+        buffer = self.buffer
+        while self.end - self.start >= HEADER_SIZE:
+            length, type_id = HEADER.unpack_from(buffer, self.start)
+            if length > self.max_frame_size:
+                raise ProtocolError(f"Frame of {length} bytes exceeds limit")
+            frame_end = self.start + HEADER_SIZE + length
+            if frame_end > self.end:
+                # make sure the rest of a large frame fits
+                self._reserve(frame_end - self.end)
+                break
+            payload = bytes(buffer[self.start + HEADER_SIZE:frame_end])
+            self.start = frame_end
+            yield type_id, payload
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def messages(self):
+        """Yield decoded message dicts for every complete frame"""
+        for type_id, payload in self.frames():
+            yield decode_message(type_id, payload)
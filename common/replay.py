@@ -0,0 +1,169 @@
+"""
+replay.py
+
+Binary replay files of a recorded match.
+
+    header    MAGIC, format version and length, then a JSON object with what
+              never changes during the match (map, obstacles, tables, tick rate)
+    records   kind (byte), tick, payload length, payload
+    index     (tick, file offset) of every keyframe record
+    trailer   keyframe count, last tick, index offset, TRAILER_MAGIC
+
+A keyframe carries the entities of its tick as JSON (what a client gets
+with 'init', zlib compressed) and a full snapshot. The snapshots in between
+are deltas against the snapshot recorded just before them, and events are
+stored as the type id and JSON payload of the frame clients got.
+
+To start playing at some tick a reader finds the last keyframe at or before
+it with a binary search of the index and applies the records from there on.
+A file whose trailer never got written (the server was killed) is still
+readable, the index is rebuilt by walking its records.
+"""
+
+import json
+import mmap
+import struct
+import zlib
+
+REPLAY_VERSION = 1
+MAGIC = b'CCRP'
+TRAILER_MAGIC = b'CCRX'
+
+FILE_HEADER = struct.Struct('!4sHI')  # magic, version, header JSON length
+RECORD = struct.Struct('!BII')  # kind, tick, payload length
+INDEX_ENTRY = struct.Struct('!IQ')  # tick, offset of the keyframe record
+TRAILER = struct.Struct('!IIQ4s')  # keyframe count, last tick, index offset, magic
+KEYFRAME_HEADER = struct.Struct('!I')  # compressed entity JSON length
+
+RECORD_KEYFRAME = 1
+RECORD_DELTA = 2
+RECORD_EVENT = 3
+
+
+class ReplayError(Exception):
+    """Raised for a file that isn't a replay or can't be played"""
+
+
+def encode_keyframe(entities, snapshot_payload):
+    packed = zlib.compress(json.dumps(entities, separators=(',', ':')).encode('utf-8'))
+    return KEYFRAME_HEADER.pack(len(packed)) + packed + snapshot_payload
+
+
+def decode_keyframe(payload):
+    """(entities, full snapshot payload) of a keyframe record"""
+    (length,) = KEYFRAME_HEADER.unpack_from(payload)
+    start = KEYFRAME_HEADER.size
+    return json.loads(zlib.decompress(payload[start:start + length])), payload[start + length:]
+
+
+def encode_event(frame):
+    """Event record payload from a framed message: the frame without its length"""
+    return frame[4:]
+
+
+class ReplayWriter:
+    """Appends records to a new replay file, the index goes in on close()"""
+
+    def __init__(self, path, header):
+        self.file = open(path, 'wb')
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        self.file.write(FILE_HEADER.pack(MAGIC, REPLAY_VERSION, len(header_bytes)))
+        self.file.write(header_bytes)
+        self.offset = FILE_HEADER.size + len(header_bytes)
+        self.index = []  # packed INDEX_ENTRY per keyframe
+        self.last_tick = 0
+
+    def write(self, kind, tick, payload):
+        if kind == RECORD_KEYFRAME:
+            self.index.append(INDEX_ENTRY.pack(tick, self.offset))
+        self.file.write(RECORD.pack(kind, tick, len(payload)))
+        self.file.write(payload)
+        self.offset += RECORD.size + len(payload)
+        self.last_tick = max(self.last_tick, tick)
+
+    def close(self):
+        self.file.write(b''.join(self.index))
+        self.file.write(TRAILER.pack(len(self.index), self.last_tick, self.offset, TRAILER_MAGIC))
+        self.file.close()
+
+
+class ReplayReader:
+    """Memory mapped replay file"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ReplayError(f"{path} is empty")
+        data = self.data
+        if len(data) < FILE_HEADER.size:
+            self.close()
+            raise ReplayError(f"{path} is not a replay file")
+        magic, version, header_length = FILE_HEADER.unpack_from(data)
+        if magic != MAGIC or version != REPLAY_VERSION:
+            self.close()
+            raise ReplayError(f"{path} is not a version {REPLAY_VERSION} replay file")
+        self.records_start = FILE_HEADER.size + header_length
+        self.header = json.loads(data[FILE_HEADER.size:self.records_start])
+
+        self.complete = False
+        if len(data) >= self.records_start + TRAILER.size:
+            count, last_tick, index_offset, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+            self.complete = magic == TRAILER_MAGIC
+        if self.complete:
+            self.records_end = index_offset
+            self.index = data[index_offset:index_offset + count * INDEX_ENTRY.size]
+            self.last_tick = last_tick
+        else:
+            self.rebuild_index()
+        self.keyframes = len(self.index) // INDEX_ENTRY.size
+        if not self.keyframes:
+            self.close()
+            raise ReplayError(f"{path} has no keyframes, nothing was recorded")
+        self.first_tick = self.keyframe(0)[0]
+
+    def rebuild_index(self):
+        """Walk the records of an unfinished file, it ends after the last complete one"""
+        data = self.data
+        index = []
+        offset = self.records_start
+        self.last_tick = 0
+        while offset + RECORD.size <= len(data):
+            kind, tick, length = RECORD.unpack_from(data, offset)
+            if offset + RECORD.size + length > len(data):
+                break
+            if kind == RECORD_KEYFRAME:
+                index.append(INDEX_ENTRY.pack(tick, offset))
+            self.last_tick = max(self.last_tick, tick)
+            offset += RECORD.size + length
+        self.records_end = offset
+        self.index = b''.join(index)
+
+    def keyframe(self, i):
+        """(tick, offset) of the i-th keyframe"""
+        return INDEX_ENTRY.unpack_from(self.index, i * INDEX_ENTRY.size)
+
+    def seek(self, tick):
+        """Offset of the last keyframe at or before tick (the first one for an earlier tick)"""
+        low, high = 0, self.keyframes
+        while low < high:
+            middle = (low + high) // 2
+            if self.keyframe(middle)[0] <= tick:
+                low = middle + 1
+            else:
+                high = middle
+        return self.keyframe(max(0, low - 1))[1]
+
+    def record_at(self, offset):
+        """(kind, tick, payload, offset of the next record), None past the last record"""
+        if offset >= self.records_end:
+            return None
+        kind, tick, length = RECORD.unpack_from(self.data, offset)
+        start = offset + RECORD.size
+        return kind, tick, self.data[start:start + length], start + length
+
+    def close(self):
+        self.data.close()
+        self.file.close()
@@ -0,0 +1,360 @@
+"""
+snapshot.py
+
+Versioned binary codec for game_update snapshots.
+
+Entities are referenced by small integer handles instead of their string
+ids, positions are quantized to fixed point and everything that never
+changes (names, colors, projectile radius) lives in the tables sent once
+with 'init' and the spawn events.
+
+The server first captures its entities into a WorldState: quantized
+record tuples keyed by handle. A WorldState is sent either whole (a full
+snapshot: header plus fixed size records) or as a delta against an older
+WorldState the client has acknowledged, which only carries the fields
+that changed and the handles that went away.
+"""
+
+import struct
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+
+SNAPSHOT_VERSION = 2
+
+POSITION_SCALE = 4  # quarter pixel precision
+VELOCITY_SCALE = 4
+TIMER_SCALE = 100  # centiseconds
+
+CANNON_TYPES = ['RAPID', 'EXPLOSIVE', 'BOUNCING']
+CANNON_TYPE_IDS = {name: i for i, name in enumerate(CANNON_TYPES)}
+POWERUP_TYPES = ['HEALTH', 'SPEED']
+POWERUP_TYPE_IDS = {name: i for i, name in enumerate(POWERUP_TYPES)}
+
+PLAYER_ALIVE = 0x01
+PLAYER_HAS_CANNON = 0x02
+
+FLAG_SUDDEN_DEATH = 0x01
+
+NO_HANDLE = 0
+MAX_HANDLE = 0xFFFF
+
+# version, flags, sudden death timer, tick, player/cannon/projectile/powerup counts
+HEADER = struct.Struct('!BBHIHHHH')
+# version, flags, sudden death timer, tick, baseline tick
+DELTA_HEADER = struct.Struct('!BBHII')
+COUNT = struct.Struct('!H')
+DELTA_RECORD_HEADER = struct.Struct('!HB')
+
+# Record fields after the handle, per entity kind:
+# players:     x, y, health, flags, cannon handle
+# cannons:     x, y, type, shots left, controller handle, use timer
+# projectiles: x, y, dx, dy, cannon type, bounces left, owner handle
+# powerups:    x, y, type
+ENTITY_KINDS = ('players', 'cannons', 'projectiles', 'powerups')
+RECORD_FIELDS = {
+    'players': 'HHBBH',
+    'cannons': 'HHBBHH',
+    'projectiles': 'HHhhBBH',
+    'powerups': 'HHB',
+}
+RECORD_STRUCTS = {kind: struct.Struct('!H' + fields) for kind, fields in RECORD_FIELDS.items()}
+
+# Quantized world at one tick. Each entity field maps handle -> record tuple
+# (handle first, then the fields above).
+WorldState = namedtuple('WorldState', ['tick', 'flags', 'timer'] + list(ENTITY_KINDS))
+
+
+class HandleAllocator:
+    """Hands out 16 bit entity handles, wrapping around and skipping live ones.
+
+    Handles keep counting up instead of being reused right away, so a
+    client that still remembers a removed entity won't mistake a new one
+    for it.
+    """
+
+    def __init__(self):
+        self.next_handle = 1
+
+    def allocate(self, live_entities=()):
+        in_use = {entity.handle for entity in live_entities}
+        for _ in range(MAX_HANDLE):
+            handle = self.next_handle
+            self.next_handle = handle + 1 if handle < MAX_HANDLE else 1
+            if handle not in in_use:
+                return handle
+        raise RuntimeError("Out of entity handles")
+
+
+class SnapshotHistory:
+    """The most recent WorldStates by tick, used as delta baselines"""
+
+    def __init__(self, size=32):
+        self.size = size
+        self.states = OrderedDict()
+
+    def add(self, state):
+        self.states[state.tick] = state
+        while len(self.states) > self.size:
+            self.states.popitem(last=False)
+
+    def get(self, tick):
+        return self.states.get(tick)
+
+    def clear(self):
+        self.states.clear()
+
+
+def quantize_position(value):
+    return min(max(int(value * POSITION_SCALE), 0), 0xFFFF)
+
+
+def quantize_velocity(value):
+    return min(max(int(value * VELOCITY_SCALE), -0x8000), 0x7FFF)
+
+
+def quantize_timer(value):
+    return min(max(int(value * TIMER_SCALE), 0), 0xFFFF)
+
+
+def quantize_byte(value):
+    return min(max(int(value), 0), 0xFF)
+
+
+@lru_cache(maxsize=256)
+def snapshot_struct(n_players, n_cannons, n_projectiles, n_powerups):
+    """Struct for a whole snapshot with the given entity counts"""
+    return struct.Struct(
+        HEADER.format
+        + ('H' + RECORD_FIELDS['players']) * n_players
+        + ('H' + RECORD_FIELDS['cannons']) * n_cannons
+        + ('H' + RECORD_FIELDS['projectiles']) * n_projectiles
+        + ('H' + RECORD_FIELDS['powerups']) * n_powerups
+    )
+
+
+@lru_cache(maxsize=1024)
+def delta_record_struct(kind, mask):
+    """Struct for a delta record: handle, mask, then the masked fields"""
+    fields = RECORD_FIELDS[kind]
+    return struct.Struct('!HB' + ''.join(field for i, field in enumerate(fields) if mask >> i & 1))
+
+
+def capture_state(players, cannons, projectiles, powerups, sudden_death, sudden_death_timer, tick):
+    """Quantize the server's entities into a WorldState.
+
+    No range checks are done here, which is what makes this cheap enough
+    to run every tick. Use capture_snapshot, which falls back to
+    capture_state_clamped when a value doesn't fit its field.
+    """
+    player_handles = {player_id: player.handle for player_id, player in players.items()}
+    cannon_handles = {cannon.id: cannon.handle for cannon in cannons}
+    # local names, these loops run for every entity on every tick
+    player_handle = player_handles.get
+    cannon_handle = cannon_handles.get
+    cannon_type_ids = CANNON_TYPE_IDS
+    scale = POSITION_SCALE
+    velocity_scale = VELOCITY_SCALE
+
+    return WorldState(
+        tick, FLAG_SUDDEN_DEATH if sudden_death else 0, quantize_timer(sudden_death_timer),
+        {
+            player.handle: (
+                player.handle, int(player.x * scale), int(player.y * scale), int(player.health),
+                (PLAYER_ALIVE if player.alive else 0) | (PLAYER_HAS_CANNON if player.has_cannon else 0),
+                cannon_handle(player.cannon_id, NO_HANDLE)
+            )
+            for player in players.values()
+        },
+        {
+            cannon.handle: (
+                cannon.handle, int(cannon.x * scale), int(cannon.y * scale),
+                cannon_type_ids[cannon.type], cannon.shots_left,
+                player_handle(cannon.controlled_by, NO_HANDLE), int(cannon.use_timer * TIMER_SCALE)
+            )
+            for cannon in cannons
+        },
+        {
+            projectile.handle: (
+                projectile.handle, int(projectile.x * scale), int(projectile.y * scale),
+                int(projectile.dx * velocity_scale), int(projectile.dy * velocity_scale),
+                cannon_type_ids[projectile.cannon_type], projectile.bounces,
+                player_handle(projectile.owner_id, NO_HANDLE)
+            )
+            for projectile in projectiles
+        },
+        {
+            powerup.handle: (
+                powerup.handle, int(powerup.x * scale), int(powerup.y * scale),
+                POWERUP_TYPE_IDS[powerup.type]
+            )
+            for powerup in powerups
+        }
+    )
+
+
+def capture_state_clamped(players, cannons, projectiles, powerups, sudden_death, sudden_death_timer, tick):
+    """Slow path of capture_state that clamps every value into its field's range"""
+    player_handles = {player_id: player.handle for player_id, player in players.items()}
+    cannon_handles = {cannon.id: cannon.handle for cannon in cannons}
+
+    return WorldState(
+        tick, FLAG_SUDDEN_DEATH if sudden_death else 0, quantize_timer(sudden_death_timer),
+        {
+            player.handle: (
+                player.handle, quantize_position(player.x), quantize_position(player.y),
+                quantize_byte(player.health),
+                (PLAYER_ALIVE if player.alive else 0) | (PLAYER_HAS_CANNON if player.has_cannon else 0),
+                cannon_handles.get(player.cannon_id, NO_HANDLE)
+            )
+            for player in players.values()
+        },
+        {
+            cannon.handle: (
+                cannon.handle, quantize_position(cannon.x), quantize_position(cannon.y),
+                CANNON_TYPE_IDS[cannon.type], quantize_byte(cannon.shots_left),
+                player_handles.get(cannon.controlled_by, NO_HANDLE), quantize_timer(cannon.use_timer)
+            )
+            for cannon in cannons
+        },
+        {
+            projectile.handle: (
+                projectile.handle, quantize_position(projectile.x), quantize_position(projectile.y),
+                quantize_velocity(projectile.dx), quantize_velocity(projectile.dy),
+                CANNON_TYPE_IDS[projectile.cannon_type], quantize_byte(projectile.bounces),
+                player_handles.get(projectile.owner_id, NO_HANDLE)
+            )
+            for projectile in projectiles
+        },
+        {
+            powerup.handle: (
+                powerup.handle, quantize_position(powerup.x), quantize_position(powerup.y),
+                POWERUP_TYPE_IDS[powerup.type]
+            )
+            for powerup in powerups
+        }
+    )
+
+
+def capture_snapshot(players, cannons, projectiles, powerups, sudden_death, sudden_death_timer, tick):
+    """Capture a WorldState and encode it as a full snapshot.
+
+    Returns (state, payload). The full encode doubles as the range check:
+    if any value doesn't fit its field the state is recaptured with
+    clamping, so every returned state is safe to delta-encode.
+    """
+    args = (players, cannons, projectiles, powerups, sudden_death, sudden_death_timer, tick)
+    state = capture_state(*args)
+    try:
+        return state, encode_full_snapshot(state)
+    except struct.error:
+        state = capture_state_clamped(*args)
+        return state, encode_full_snapshot(state)
+
+
+def encode_full_snapshot(state):
+    """Pack a WorldState with a single struct call"""
+    values = [
+        SNAPSHOT_VERSION, state.flags, state.timer, state.tick,
+        len(state.players), len(state.cannons), len(state.projectiles), len(state.powerups)
+    ]
+    extend = values.extend
+    for records in (state.players, state.cannons, state.projectiles, state.powerups):
+        for record in records.values():
+            extend(record)
+    return snapshot_struct(
+        len(state.players), len(state.cannons), len(state.projectiles), len(state.powerups)
+    ).pack(*values)
+
+
+def encode_delta_snapshot(state, base):
+    """Encode the difference between state and an older baseline state.
+
+    Per entity kind: a count of changed records, each with its handle, a
+    bit mask of changed fields and just those fields (new entities have
+    every bit set), then a count of removed handles and the handles.
+    """
+    parts = [DELTA_HEADER.pack(SNAPSHOT_VERSION, state.flags, state.timer, state.tick, base.tick)]
+    for kind in ENTITY_KINDS:
+        current = getattr(state, kind)
+        previous = getattr(base, kind)
+        field_count = len(RECORD_FIELDS[kind])
+        full_mask = (1 << field_count) - 1
+        updates = []
+        for handle, record in current.items():
+            old = previous.get(handle)
+            if old == record:
+                continue
+            if old is None:
+                updates.append(delta_record_struct(kind, full_mask).pack(handle, full_mask, *record[1:]))
+                continue
+            mask = 0
+            values = []
+            for i in range(1, field_count + 1):
+                if record[i] != old[i]:
+                    mask |= 1 << (i - 1)
+                    values.append(record[i])
+            updates.append(delta_record_struct(kind, mask).pack(handle, mask, *values))
+        removed = previous.keys() - current.keys()
+        parts.append(COUNT.pack(len(updates)))
+        parts.extend(updates)
+        parts.append(struct.pack(f'!H{len(removed)}H', len(removed), *removed))
+    return b''.join(parts)
+
+
+def decode_full_snapshot(payload):
+    """Unpack a full snapshot into a WorldState"""
+    version, flags, timer, tick, n_players, n_cannons, n_projectiles, n_powerups = HEADER.unpack_from(payload, 0)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+    offset = HEADER.size
+    records = {}
+    for kind, count in zip(ENTITY_KINDS, (n_players, n_cannons, n_projectiles, n_powerups)):
+        record_struct = RECORD_STRUCTS[kind]
+        end = offset + record_struct.size * count
+        records[kind] = {record[0]: record for record in record_struct.iter_unpack(payload[offset:end])}
+        offset = end
+    return WorldState(tick, flags, timer, **records)
+
+
+def delta_ticks(payload):
+    """Return (tick, baseline tick) of a delta snapshot"""
+    version, flags, timer, tick, base_tick = DELTA_HEADER.unpack_from(payload, 0)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+    return tick, base_tick
+
+
+def decode_delta_snapshot(payload, base):
+    """Rebuild the WorldState a delta was encoded from, given its baseline"""
+    version, flags, timer, tick, base_tick = DELTA_HEADER.unpack_from(payload, 0)
+    if base.tick != base_tick:
+        raise ValueError(f"Delta against tick {base_tick} applied to tick {base.tick}")
+    offset = DELTA_HEADER.size
+    records = {}
+    for kind in ENTITY_KINDS:
+        field_count = len(RECORD_FIELDS[kind])
+        current = dict(getattr(base, kind))
+        (count,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            handle, mask = DELTA_RECORD_HEADER.unpack_from(payload, offset)
+            record_struct = delta_record_struct(kind, mask)
+            values = record_struct.unpack_from(payload, offset)[2:]
+            offset += record_struct.size
+            old = current.get(handle)
+            if old is None:
+                current[handle] = (handle,) + values
+                continue
+            record = list(old)
+            changed = iter(values)
+            for i in range(field_count):
+                if mask >> i & 1:
+                    record[i + 1] = next(changed)
+            current[handle] = tuple(record)
+        (removed,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        for handle in struct.unpack_from(f'!{removed}H', payload, offset):
+            current.pop(handle, None)
+        offset += 2 * removed
+        records[kind] = current
+    return WorldState(tick, flags, timer, **records)
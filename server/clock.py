@@ -0,0 +1,46 @@
+"""
+clock.py
+
+Fixed timestep scheduling for the simulation.
+
+Real time is fed into an accumulator and paid out in whole steps of a
+fixed length, so the simulation advances by exactly the same amount every
+tick no matter how late the thread woke up. If the server falls too far
+behind only a limited number of steps is caught up, the rest is dropped
+instead of spiralling into ever longer catch-up bursts.
+"""
+
+import time
+
+MAX_CATCHUP_TICKS = 5
+
+
+class FixedStepClock:
+    def __init__(self, rate, max_catchup=MAX_CATCHUP_TICKS):
+        self.interval = 1.0 / rate
+        self.max_catchup = max_catchup
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.dropped_ticks = 0  # ticks skipped because the server fell behind
+
+    def reset(self, now):
+        self.accumulator = 0.0
+        self.last_time = now
+
+    def advance(self, now):
+        """Returns how many fixed steps are due at time now (perf_counter)"""
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = int(self.accumulator / self.interval)
+        if steps > self.max_catchup:
+            self.dropped_ticks += steps - self.max_catchup
+            steps = self.max_catchup
+            # keep the fraction towards the next tick, forget the rest of the backlog
+            self.accumulator %= self.interval
+        else:
+            self.accumulator -= steps * self.interval
+        return steps
+
+    def next_deadline(self):
+        """perf_counter time at which the next step becomes due"""
+        return self.last_time + self.interval - self.accumulator
@@ -0,0 +1,253 @@
+"""
+entities.py
+
+Server side entities and the registry that indexes them.
+
+Players, cannons, projectiles and powerups are __slots__ objects rather
+than dicts: smaller, faster attribute access, and a typo is an error
+instead of a new key. Cannons, projectiles and powerups get integer ids
+from one counter per room that only counts up, players keep their
+client id. Each entity also has its 16 bit snapshot handle. wire() gives
+the fields clients know about as the dict the JSON messages carry.
+
+EntityRegistry holds a room's entities:
+
+- players by id, the other kinds in EntityStores (a dense list to iterate
+  plus an id -> position map, removal swaps the last entity into the gap),
+- which cannon each player controls, kept up to date by take_cannon and
+  remove_cannon,
+- the number of players alive, kept up to date by set_alive.
+"""
+
+from movement import PLAYER_SPEED
+from snapshot import HandleAllocator
+
+
+class Player:
+    __slots__ = ('id', 'handle', 'x', 'y', 'color', 'name', 'health', 'alive', 'has_cannon', 'cannon_id',
+                 'speed', 'speed_boost_end', 'input_seq', 'input_budget')
+
+    def __init__(self, player_id, handle, x, y, color, name, input_budget):
+        self.id = player_id
+        self.handle = handle
+        self.x = x
+        self.y = y
+        self.color = color
+        self.name = name
+        self.health = 100
+        self.alive = True
+        self.has_cannon = False
+        self.cannon_id = None
+        self.speed = PLAYER_SPEED
+        self.speed_boost_end = 0  # simulation time the speed boost runs out
+        self.input_seq = 0  # last movement input applied (or refused)
+        self.input_budget = input_budget
+
+    def wire(self):
+        return {
+            'id': self.id, 'handle': self.handle, 'x': self.x, 'y': self.y, 'color': self.color,
+            'name': self.name, 'health': self.health, 'alive': self.alive,
+            'has_cannon': self.has_cannon, 'cannon_id': self.cannon_id
+        }
+
+
+class Cannon:
+    __slots__ = ('id', 'handle', 'x', 'y', 'type', 'shots_left', 'damage', 'speed', 'cooldown', 'radius',
+                 'color', 'controlled_by', 'use_timer', 'last_shot_time')
+
+    def __init__(self, cannon_id, handle, x, y, cannon_type, properties):
+        self.id = cannon_id
+        self.handle = handle
+        self.x = x
+        self.y = y
+        self.type = cannon_type
+        self.shots_left = properties['shots']
+        self.damage = properties['damage']
+        self.speed = properties['speed']
+        self.cooldown = properties['cooldown']
+        self.radius = properties['radius']
+        self.color = properties['color']
+        self.controlled_by = None  # player id
+        self.use_timer = 0
+        self.last_shot_time = None  # simulation time
+
+    def wire(self):
+        return {
+            'id': self.id, 'handle': self.handle, 'x': self.x, 'y': self.y, 'type': self.type,
+            'shots_left': self.shots_left, 'radius': self.radius, 'color': self.color,
+            'controlled_by': self.controlled_by, 'use_timer': self.use_timer, 'last_shot_time': self.last_shot_time
+        }
+
+
+class Projectile:
+    __slots__ = ('id', 'handle', 'cannon_type', 'x', 'y', 'dx', 'dy', 'damage', 'radius', 'color', 'owner_id',
+                 'can_bounce', 'bounces')
+
+    def __init__(self, projectile_id, handle, cannon_type, x, y, dx, dy, damage, radius, color, owner_id,
+                 can_bounce, bounces):
+        self.id = projectile_id
+        self.handle = handle
+        self.cannon_type = cannon_type
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.damage = damage
+        self.radius = radius
+        self.color = color
+        self.owner_id = owner_id
+        self.can_bounce = can_bounce
+        self.bounces = bounces
+
+    def wire(self):
+        return {
+            'id': self.id, 'handle': self.handle, 'cannon_type': self.cannon_type, 'x': self.x, 'y': self.y,
+            'dx': self.dx, 'dy': self.dy, 'damage': self.damage, 'radius': self.radius, 'color': self.color,
+            'owner_id': self.owner_id, 'can_bounce': self.can_bounce, 'bounces': self.bounces
+        }
+
+
+class PowerUp:
+    __slots__ = ('id', 'handle', 'x', 'y', 'type', 'radius', 'color')
+
+    def __init__(self, powerup_id, handle, x, y, power_type, radius, color):
+        self.id = powerup_id
+        self.handle = handle
+        self.x = x
+        self.y = y
+        self.type = power_type
+        self.radius = radius
+        self.color = color
+
+    def wire(self):
+        return {
+            'id': self.id, 'handle': self.handle, 'x': self.x, 'y': self.y, 'type': self.type,
+            'radius': self.radius, 'color': self.color
+        }
+
+
+class EntityStore:
+    """Entities of one kind, O(1) lookup by id and removal, in no particular order"""
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}  # id -> index in items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def get(self, entity_id):
+        position = self.positions.get(entity_id)
+        return None if position is None else self.items[position]
+
+    def append(self, entity):
+        self.positions[entity.id] = len(self.items)
+        self.items.append(entity)
+
+    def remove(self, entity):
+        """Remove an entity, False if it wasn't here (anymore)"""
+        position = self.positions.pop(entity.id, None)
+        if position is None:
+            return False
+        last = self.items.pop()
+        if last is not entity:
+            self.items[position] = last
+            self.positions[last.id] = position
+        return True
+
+    def clear(self):
+        self.items.clear()
+        self.positions.clear()
+
+
+class EntityRegistry:
+    def __init__(self, projectiles=None):
+        self.players = {}  # player id -> Player
+        self.cannons = EntityStore()
+        # anything with append, clear, len and iteration, the NumPy engine brings its own
+        self.projectiles = projectiles if projectiles is not None else EntityStore()
+        self.powerups = EntityStore()
+        self.controlled_cannons = {}  # player id -> Cannon
+        self.alive_count = 0
+        self.last_id = 0
+
+        # Small integer handles used by the binary snapshot codec
+        self.player_handles = HandleAllocator()
+        self.cannon_handles = HandleAllocator()
+        self.projectile_handles = HandleAllocator()
+        self.powerup_handles = HandleAllocator()
+
+    def next_id(self):
+        """Id for a new cannon, projectile or powerup"""
+        self.last_id += 1
+        return self.last_id
+
+    def add_player(self, player):
+        self.remove_player(player.id)
+        self.players[player.id] = player
+        if player.alive:
+            self.alive_count += 1
+
+    def remove_player(self, player_id):
+        """Take a player out, returns it (None if it wasn't here). Its cannon is left to the caller."""
+        player = self.players.pop(player_id, None)
+        if player is not None and player.alive:
+            self.alive_count -= 1
+        return player
+
+    def set_alive(self, player, alive):
+        if player.alive != alive:
+            player.alive = alive
+            self.alive_count += 1 if alive else -1
+
+    def survivor(self):
+        """The one player still alive, None if there is no such player"""
+        if self.alive_count != 1:
+            return None
+        return next((player for player in self.players.values() if player.alive), None)
+
+    def take_cannon(self, player, cannon):
+        cannon.controlled_by = player.id
+        player.has_cannon = True
+        player.cannon_id = cannon.id
+        self.controlled_cannons[player.id] = cannon
+
+    def cannon_of(self, player_id):
+        return self.controlled_cannons.get(player_id)
+
+    def remove_cannon(self, cannon):
+        """Take a cannon out of the game, whoever held it lets go"""
+        if cannon.controlled_by is not None:
+            if self.controlled_cannons.get(cannon.controlled_by) is cannon:
+                del self.controlled_cannons[cannon.controlled_by]
+            player = self.players.get(cannon.controlled_by)
+            if player is not None and player.cannon_id == cannon.id:
+                player.has_cannon = False
+                player.cannon_id = None
+            cannon.controlled_by = None
+        self.cannons.remove(cannon)
+
+    def clear_items(self):
+        """Remove every cannon, projectile and powerup, players stay"""
+        for player_id in self.controlled_cannons:
+            player = self.players.get(player_id)
+            if player is not None:
+                player.has_cannon = False
+                player.cannon_id = None
+        self.controlled_cannons.clear()
+        self.cannons.clear()
+        self.projectiles.clear()
+        self.powerups.clear()
+
+
+def wire_entities(players, cannons, projectiles, powerups):
+    """Entities as 'init' carries them: players by id, the other kinds as lists"""
+    return {
+        'players': {player.id: player.wire() for player in players},
+        'cannons': [cannon.wire() for cannon in cannons],
+        'projectiles': [projectile.wire() for projectile in projectiles],
+        'powerups': [powerup.wire() for powerup in powerups]
+    }
@@ -0,0 +1,279 @@
+"""
+event_loop.py
+
+Single threaded server engine built on selectors.
+
+Accepting, reading, framing, message dispatch, outbound writes, the game
+ticks of every room and the reset timers all run on one loop, so there is
+no thread per connection and no lock contention between them. Each room
+keeps its own tick deadline. Game logic is shared with the threaded
+GameServer, only the I/O plumbing differs.
+"""
+
+import heapq
+import itertools
+import selectors
+import time
+
+from protocol import PROTOCOL_HELLO, PROTOCOL_VERSION, PROTOCOL_FRAMED, PROTOCOL_LEGACY, FrameBuffer, ProtocolError, parse_hello
+from outbound import LoopSender
+from lobby import receive_client
+from server import (
+    GameServer, BUFFER_SIZE, OUTBOUND_QUEUE_SIZE, OUTBOUND_RELIABLE_LIMIT,
+    OUTBOUND_DROP_POLICY, OUTBOUND_RELIABLE_POLICY
+)
+
+IDLE_TIMEOUT = 0.5  # longest select() when no room or timer is due
+
+
+class Connection:
+    """Per-socket read state, the protocol is unknown until the handshake"""
+
+    def __init__(self, sock, addr, room_id):
+        self.socket = sock
+        self.addr = addr
+        self.room_id = room_id  # assigned by the lobby on accept
+        self.client_id = None
+        self.protocol = None
+        self.handshake = b''  # bytes received before the protocol is known
+        self.frames = None  # FrameBuffer once framed
+        self.legacy_buffer = ""  # text stream once legacy
+        self.sender = None  # LoopSender once registered
+
+
+class EventLoopServer(GameServer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.selector = selectors.DefaultSelector()
+        self.connections = {}  # socket -> Connection
+        self.timers = []  # heap of (when, seq, callback)
+        self.timer_seq = itertools.count()
+
+    def start(self):
+        self.running = True
+        self.start_metrics()
+        if self.start_udp():
+            self.selector.register(self.udp.socket, selectors.EVENT_READ, self.udp)
+        intake = self.socket if self.handoff is None else self.handoff
+        intake.setblocking(False)
+        self.selector.register(intake, selectors.EVENT_READ, None)
+
+        try:
+            while self.running:
+                # Sleep until the next room tick or timer, whichever is first
+                current_time = time.perf_counter()
+                deadline = current_time + IDLE_TIMEOUT
+                for room in self.rooms.values():
+                    deadline = min(deadline, room.clock.next_deadline())
+                if self.timers:
+                    deadline = min(deadline, self.timers[0][0])
+                timeout = max(0, deadline - current_time)
+
+                for key, mask in self.selector.select(timeout):
+                    if key.data is None:
+                        self.accept()
+                        continue
+                    if key.data is self.udp:
+                        self.udp.receive()
+                        continue
+                    connection = key.data
+                    if mask & selectors.EVENT_READ:
+                        self.read(connection)
+                    if mask & selectors.EVENT_WRITE:
+                        if connection.sender is not None:
+                            connection.sender.flush()
+
+                current_time = time.perf_counter()
+                while self.timers and self.timers[0][0] <= current_time:
+                    _, _, callback = heapq.heappop(self.timers)
+                    callback()
+
+                for room in list(self.rooms.values()):
+                    room.advance(current_time)
+                self.check_inactivity(current_time)
+        except Exception as e:
+            print(f"Server error: {e}")
+        finally:
+            self.close()
+
+    def schedule(self, delay, callback):
+        """Run callback on the loop after delay seconds"""
+        heapq.heappush(self.timers, (time.perf_counter() + delay, next(self.timer_seq), callback))
+
+    def start_room(self, room):
+        # ticked by the loop, rooms are due at their own deadlines
+        room.clock.reset(time.perf_counter())
+
+    def create_sender(self, client_id, client_socket):
+        sender = LoopSender(
+            client_id, client_socket, self.handle_disconnect, self.want_write,
+            max_frames=OUTBOUND_QUEUE_SIZE, max_reliable_frames=OUTBOUND_RELIABLE_LIMIT,
+            drop_policy=OUTBOUND_DROP_POLICY, reliable_policy=OUTBOUND_RELIABLE_POLICY
+        )
+        self.connections[client_socket].sender = sender
+        return sender
+
+    def want_write(self, sender, writing):
+        connection = self.connections.get(sender.socket)
+        if connection is None:
+            return
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if writing else selectors.EVENT_READ
+        self.selector.modify(sender.socket, events, connection)
+
+    def accept(self):
+        try:
+            if self.handoff is None:
+                client_socket, addr = self.socket.accept()
+                room_id = self.lobby.assign()
+            else:
+                client = receive_client(self.handoff, BUFFER_SIZE)
+                if client is None:
+                    self.running = False  # pool master went away
+                    return
+                client_socket, addr, room_id = client
+        except BlockingIOError:
+            return
+        except Exception as e:
+            if self.running:
+                print(f"Socket accept error: {e}")
+            return
+        print(f"New connection from {addr}")
+        client_socket.setblocking(False)
+        connection = Connection(client_socket, addr, room_id)
+        self.connections[client_socket] = connection
+        self.selector.register(client_socket, selectors.EVENT_READ, connection)
+
+    def read(self, connection):
+        if connection.socket not in self.connections:
+            # dropped earlier in this round of events
+            return
+        try:
+            if connection.protocol == PROTOCOL_FRAMED:
+                received = connection.frames.recv_from(connection.socket, BUFFER_SIZE)
+                data = None
+            else:
+                data = connection.socket.recv(BUFFER_SIZE)
+                received = len(data)
+            if not received:
+                self.drop_connection(connection)
+                return
+            traffic = self.traffic.get(connection.client_id)
+            if traffic is not None:
+                traffic.bytes_in += received
+
+            if connection.protocol is None:
+                self.read_handshake(connection, data)
+            elif connection.protocol == PROTOCOL_FRAMED:
+                self.read_framed(connection)
+            else:
+                self.read_legacy(connection, data)
+        except BlockingIOError:
+            return
+        except ConnectionError:
+            print(f"Connection error with client {connection.client_id}")
+            self.drop_connection(connection)
+        except ProtocolError as e:
+            print(f"Protocol error from client {connection.client_id}: {e}")
+            self.drop_connection(connection)
+        except Exception as e:
+            print(f"Client handler error: {e}")
+            self.drop_connection(connection)
+
+    def read_handshake(self, connection, data):
+        # First bytes are either a protocol hello or a legacy JSON registration
+        connection.handshake += data
+        if connection.handshake.startswith(b'{'):
+            # Old client, JSON registration and brace-delimited stream
+            connection.protocol = PROTOCOL_LEGACY
+            self.read_legacy(connection, connection.handshake)
+            return
+
+        if len(connection.handshake) < len(PROTOCOL_HELLO):
+            return
+        version = parse_hello(connection.handshake)
+        if version is None:
+            print(f"Unknown handshake from {connection.addr}, closing")
+            self.drop_connection(connection)
+            return
+        if version != PROTOCOL_VERSION:
+            print(f"Client {connection.addr} speaks protocol v{version}, server speaks v{PROTOCOL_VERSION}")
+            self.drop_connection(connection)
+            return
+        # a fresh socket always has room for the few bytes of the hello
+        connection.socket.send(PROTOCOL_HELLO)
+
+        connection.protocol = PROTOCOL_FRAMED
+        connection.frames = FrameBuffer()
+        connection.frames.feed(connection.handshake[len(PROTOCOL_HELLO):])
+        connection.handshake = b''
+        self.read_framed(connection)
+
+    def read_framed(self, connection):
+        for message in connection.frames.messages():
+            if connection.client_id is None:
+                # Wait for the framed registration
+                if message.get('type') == 'register':
+                    connection.client_id = self.register_player(connection.socket, message, PROTOCOL_FRAMED, connection.room_id)
+                continue
+            self.traffic[connection.client_id].messages_in += 1
+            self.handle_client_message(connection.client_id, message)
+            if connection.socket not in self.connections:
+                return
+
+    def read_legacy(self, connection, data):
+        connection.legacy_buffer += data.decode('utf-8')
+        messages, connection.legacy_buffer = self.split_legacy_messages(
+            connection.client_id, connection.legacy_buffer)
+        for message in messages:
+            if connection.client_id is None:
+                # the first object on a legacy stream is the registration
+                connection.client_id = self.register_player(connection.socket, message, PROTOCOL_LEGACY, connection.room_id)
+                continue
+            self.traffic[connection.client_id].messages_in += 1
+            try:
+                self.handle_client_message(connection.client_id, message)
+            except Exception as e:
+                print(f"Error processing message: {e}")
+            if connection.socket not in self.connections:
+                return
+
+    def drop_connection(self, connection):
+        if connection.client_id:
+            self.handle_disconnect(connection.client_id)
+        else:
+            # never made it into its room
+            if connection.socket in self.connections:
+                self.lobby.release(connection.room_id)
+            self.unregister(connection.socket)
+            try:
+                connection.socket.close()
+            except:
+                pass
+
+    def unregister(self, client_socket):
+        if self.connections.pop(client_socket, None) is not None:
+            try:
+                self.selector.unregister(client_socket)
+            except (KeyError, ValueError):
+                pass
+
+    def handle_disconnect(self, client_id):
+        client_socket = self.clients.get(client_id)
+        if client_socket:
+            self.unregister(client_socket)
+        super().handle_disconnect(client_id)
+
+    def close(self):
+        for client_socket in list(self.connections):
+            self.unregister(client_socket)
+            try:
+                client_socket.close()
+            except:
+                pass
+        for intake in (self.socket, self.handoff, self.udp.socket if self.udp else None):
+            try:
+                self.selector.unregister(intake)
+            except (KeyError, ValueError):
+                pass
+        super().close()
+        self.selector.close()
@@ -0,0 +1,110 @@
+"""
+interest.py
+
+Area of interest filtering for snapshots and events.
+
+Each framed client only hears about the entities within a radius of its
+own player. Every snapshot the room buckets its entities by cell once
+(InterestGrid), then each client's ClientInterest works out what came into
+and went out of range since the last one. Entities that entered are sent in
+full with an 'interest' message, since the client can't build them from a
+snapshot record alone; the client drops the ones that left. The snapshot
+itself is cut down to the handles the client knows about, so deltas stay
+per client.
+
+Entities are kept until they are LEAVE_MARGIN times the radius away, so
+something sitting right on the edge doesn't flicker in and out.
+"""
+
+from snapshot import ENTITY_KINDS, WorldState
+
+LEAVE_MARGIN = 1.25
+
+
+class InterestGrid:
+    """One snapshot's entities bucketed by cell, for the per client range queries"""
+
+    def __init__(self, cell_size, entities):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> [(kind, entity)]
+        self.ids = {}  # kind -> ids of every entity of that kind in the room
+        for kind in ENTITY_KINDS:
+            ids = self.ids[kind] = set()
+            for entity in entities[kind]:
+                ids.add(entity.id)
+                cell = (int(entity.x // cell_size), int(entity.y // cell_size))
+                self.cells.setdefault(cell, []).append((kind, entity))
+
+    def around(self, x, y, radius):
+        """(kind, entity, squared distance) for everything in the cells the circle touches"""
+        size = self.cell_size
+        cells = self.cells
+        for cx in range(int((x - radius) // size), int((x + radius) // size) + 1):
+            for cy in range(int((y - radius) // size), int((y + radius) // size) + 1):
+                for kind, entity in cells.get((cx, cy), ()):
+                    dx = entity.x - x
+                    dy = entity.y - y
+                    yield kind, entity, dx*dx + dy*dy
+
+
+class ClientInterest:
+    """The entities one client currently knows about"""
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.known = {kind: {} for kind in ENTITY_KINDS}  # kind -> {entity id: handle}
+
+    def covers(self, viewer, x, y):
+        """Whether a point is close enough to the viewer's player to be of interest"""
+        dx = x - viewer.x
+        dy = y - viewer.y
+        return dx*dx + dy*dy <= self.radius * self.radius
+
+    def add(self, kind, entity):
+        self.known[kind][entity.id] = entity.handle
+
+    def update(self, grid, viewer):
+        """Bring the known set up to date around the viewer's player.
+
+        Returns (entered, left): entities per kind that just came into
+        range and ids per kind that went out of range but still exist.
+        Entities removed from the room are forgotten quietly, the snapshot
+        already tells the client they are gone.
+        """
+        enter_range = self.radius * self.radius
+        keep_range = enter_range * LEAVE_MARGIN * LEAVE_MARGIN
+        relevant = {kind: {} for kind in ENTITY_KINDS}
+        entered = {}
+        for kind, entity, distance in grid.around(viewer.x, viewer.y, self.radius * LEAVE_MARGIN):
+            entity_id = entity.id
+            if entity_id in self.known[kind]:
+                if distance <= keep_range:
+                    relevant[kind][entity_id] = entity.handle
+            elif distance <= enter_range:
+                relevant[kind][entity_id] = entity.handle
+                entered.setdefault(kind, []).append(entity)
+        # the viewer always sees itself
+        if viewer.id not in relevant['players']:
+            relevant['players'][viewer.id] = viewer.handle
+            if viewer.id not in self.known['players']:
+                entered.setdefault('players', []).append(viewer)
+
+        left = {}
+        for kind in ENTITY_KINDS:
+            ids = grid.ids[kind]
+            gone = [entity_id for entity_id in self.known[kind]
+                    if entity_id not in relevant[kind] and entity_id in ids]
+            if gone:
+                left[kind] = gone
+        self.known = relevant
+        return entered, left
+
+    def filter_state(self, state):
+        """The part of a WorldState made of entities this client knows about"""
+        records = {}
+        for kind in ENTITY_KINDS:
+            all_records = getattr(state, kind)
+            records[kind] = {
+                handle: all_records[handle] for handle in self.known[kind].values() if handle in all_records
+            }
+        return WorldState(state.tick, state.flags, state.timer, **records)
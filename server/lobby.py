@@ -0,0 +1,96 @@
+"""
+lobby.py
+
+Assigns joining clients to rooms.
+
+Rooms are filled before new ones are opened, so players end up in matches
+with each other instead of one per room. When rooms are spread over worker
+processes a new room goes to the worker hosting the fewest players.
+
+The pool master hands accepted sockets to the worker hosting their room over
+a Unix SOCK_SEQPACKET channel (file descriptor passing), workers report
+departures back over the same channel.
+"""
+
+import json
+import socket
+import threading
+
+MAX_ROOM_PLAYERS = 8
+
+
+class Lobby:
+    def __init__(self, max_players=MAX_ROOM_PLAYERS, workers=1):
+        self.max_players = max_players
+        self.workers = workers
+        self.rooms = {}  # room_id -> [worker, player count]
+        self.next_room_id = 1
+        self.lock = threading.Lock()
+
+    def assign(self):
+        """Pick a room for a new client and count it in, returns the room id"""
+        with self.lock:
+            open_rooms = [(count, room_id) for room_id, (worker, count) in self.rooms.items()
+                          if count < self.max_players]
+            if open_rooms:
+                # fullest open room first, oldest room on a tie
+                room_id = max(open_rooms, key=lambda room: (room[0], -room[1]))[1]
+            else:
+                room_id = self.next_room_id
+                self.next_room_id += 1
+                self.rooms[room_id] = [self.least_loaded_worker(), 0]
+            self.rooms[room_id][1] += 1
+            return room_id
+
+    def release(self, room_id):
+        """A client assigned to room_id left (or never finished joining)"""
+        with self.lock:
+            room = self.rooms.get(room_id)
+            if room is None:
+                return
+            room[1] -= 1
+            if room[1] <= 0:
+                del self.rooms[room_id]
+
+    def worker_of(self, room_id):
+        return self.rooms[room_id][0]
+
+    def least_loaded_worker(self):
+        load = [0] * self.workers
+        for worker, count in self.rooms.values():
+            load[worker] += count
+        return load.index(min(load))
+
+    def player_count(self):
+        return sum(count for worker, count in self.rooms.values())
+
+
+def hand_off_client(channel, client_socket, addr, room_id):
+    """Pass an accepted client socket to the worker process on the other end of channel"""
+    info = json.dumps({'room_id': room_id, 'addr': list(addr)}).encode('utf-8')
+    socket.send_fds(channel, [info], [client_socket.fileno()])
+
+
+def receive_client(channel, bufsize=4096):
+    """Receive a handed off client, returns (socket, addr, room_id) or None once the master is gone"""
+    info, fds, flags, addr = socket.recv_fds(channel, bufsize, 1)
+    if not info:
+        return None
+    info = json.loads(info)
+    return socket.socket(fileno=fds[0]), tuple(info['addr']), info['room_id']
+
+
+class RemoteLobby:
+    """Lobby of a worker process, the pool master does the bookkeeping"""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def assign(self):
+        raise RuntimeError("Worker processes only host rooms the master assigned")
+
+    def release(self, room_id):
+        try:
+            self.channel.send(json.dumps({'release': room_id}).encode('utf-8'))
+        except OSError:
+            pass  # master is gone, nothing left to report to
@@ -0,0 +1,266 @@
+"""
+metrics.py
+
+Always-on server instrumentation.
+
+Every room keeps a TickStats: how long each phase of a tick took
+(projectiles, cannons, powerups, snapshot serialization, broadcast and the
+whole tick), how often a tick overran its interval and how deep the
+clients' outbound queues were when a snapshot was queued. Samples go into
+log-scale histograms, a bisect and an increment each, written only by the
+thread that ticks the room. The histograms roll over every WINDOW seconds,
+so the numbers describe the last one or two windows rather than the whole
+uptime.
+
+ServerMetrics reads the rooms, the outbound queues and the inbound traffic
+counters of a GameServer on demand, to serve them as plain text or JSON on
+a local side port (MetricsServer) and to print periodic summaries. Readers
+only take copies of the dicts they walk, they never lock the game.
+"""
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WINDOW = 10.0  # seconds per histogram window
+METRICS_HOST = '127.0.0.1'  # the endpoint is for whoever runs the server, not for players
+
+# Upper bucket bounds: durations in seconds, ten buckets per decade from 1 us
+# to 1 s (so percentiles are good to about 25%), and queue depths in frames
+DURATION_BOUNDS = [1e-6 * 10 ** (i / 10) for i in range(61)]
+DEPTH_BOUNDS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096]
+
+PHASES = ('tick', 'projectiles', 'cannons', 'powerups', 'serialize', 'broadcast')
+
+
+class RollingHistogram:
+    def __init__(self, bounds, window=WINDOW):
+        self.bounds = bounds
+        self.window = window
+        self.counts = [0] * (len(bounds) + 1)  # last bucket: above the highest bound
+        self.total = 0.0
+        self.max = 0
+        self.previous = None  # (counts, total, max) of the last full window
+        self.window_start = time.monotonic()
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def roll(self, now):
+        """Start a new window if the current one is over, now is time.monotonic()"""
+        if now - self.window_start < self.window:
+            return
+        self.previous = (self.counts, self.total, self.max)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.max = 0
+        self.window_start = now
+
+    def windows(self):
+        """(counts, total, max) of the current and last window"""
+        current = (list(self.counts), self.total, self.max)
+        return [current] if self.previous is None else [current, self.previous]
+
+
+def summarize(histograms):
+    """count, mean, p50, p95, p99 and max over the recent windows of histograms with equal bounds"""
+    if not histograms:
+        return {'count': 0, 'mean': 0, 'p50': 0, 'p95': 0, 'p99': 0, 'max': 0}
+    bounds = histograms[0].bounds
+    counts = [0] * (len(bounds) + 1)
+    total = 0.0
+    peak = 0
+    for histogram in histograms:
+        for window_counts, window_total, window_max in histogram.windows():
+            for i, count in enumerate(window_counts):
+                counts[i] += count
+            total += window_total
+            peak = max(peak, window_max)
+    count = sum(counts)
+    summary = {'count': count, 'mean': total / count if count else 0, 'max': peak}
+    for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        summary[name] = percentile(counts, bounds, fraction, peak)
+    return summary
+
+
+def percentile(counts, bounds, fraction, peak):
+    """Upper bound of the bucket holding the fraction-th sample, capped at the largest sample"""
+    rank = fraction * sum(counts)
+    seen = 0
+    for i, count in enumerate(counts):
+        seen += count
+        if count and seen >= rank:
+            return min(bounds[i], peak) if i < len(bounds) else peak
+    return 0
+
+
+class TickStats:
+    """Timings of one room, written only by the thread ticking it"""
+
+    def __init__(self):
+        self.phases = {phase: RollingHistogram(DURATION_BOUNDS) for phase in PHASES}
+        self.queue_depth = RollingHistogram(DEPTH_BOUNDS)
+        self.ticks = 0
+        self.overruns = 0  # ticks that took longer than the tick interval
+
+    def lap(self, phase, since):
+        """Record the time since perf_counter time since for phase, returns now"""
+        now = time.perf_counter()
+        self.phases[phase].record(now - since)
+        return now
+
+    def end_tick(self, started, interval):
+        elapsed = time.perf_counter() - started
+        self.phases['tick'].record(elapsed)
+        self.ticks += 1
+        if elapsed > interval:
+            self.overruns += 1
+        if self.ticks % 64 == 0:
+            now = time.monotonic()
+            for histogram in self.phases.values():
+                histogram.roll(now)
+            self.queue_depth.roll(now)
+
+
+class ClientTraffic:
+    """What a client sent us, counted by whichever thread reads its socket"""
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.messages_in = 0
+
+
+class ServerMetrics:
+    def __init__(self, server):
+        self.server = server
+        self.started = time.time()
+        self.last_log = None  # time of the last summary
+        self.last_traffic = {}  # client_id -> (bytes in, bytes out) at the last summary
+
+    def collect(self):
+        """Every metric of the server as a dict of plain values"""
+        rooms = list(self.server.rooms.values())
+        stats = [room.stats for room in rooms]
+        clients = {}
+        for room in rooms:
+            for client_id, sender in list(room.client_senders.items()):
+                traffic = self.server.traffic.get(client_id)
+                clients[client_id] = {
+                    'room': room.room_id,
+                    'bytes_in': traffic.bytes_in if traffic else 0,
+                    'messages_in': traffic.messages_in if traffic else 0,
+                    'bytes_out': sender.bytes_sent,
+                    'frames_out': sender.frames_sent,
+                    'frames_dropped': sender.frames_dropped,
+                    'queue_depth': len(sender),
+                }
+        return {
+            'uptime': time.time() - self.started,
+            'rooms': len(rooms),
+            'clients': len(clients),
+            'ticks': sum(room_stats.ticks for room_stats in stats),
+            'tick_overruns': sum(room_stats.overruns for room_stats in stats),
+            'dropped_ticks': sum(room.clock.dropped_ticks for room in rooms),
+            'phases_ms': {
+                phase: scale(summarize([room_stats.phases[phase] for room_stats in stats]), 1000)
+                for phase in PHASES
+            },
+            'queue_depth': summarize([room_stats.queue_depth for room_stats in stats]),
+            'client_traffic': clients,
+        }
+
+    def render_text(self):
+        metrics = self.collect()
+        lines = [
+            f"uptime {metrics['uptime']:.0f} s  rooms {metrics['rooms']}  clients {metrics['clients']}",
+            f"ticks {metrics['ticks']}  overruns {metrics['tick_overruns']}  dropped {metrics['dropped_ticks']}",
+            "",
+            f"{'phase (ms)':12s} {'count':>8s} {'mean':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}",
+        ]
+        for phase, summary in metrics['phases_ms'].items():
+            lines.append(f"{phase:12s} {summary['count']:8d} {summary['mean']:8.3f} {summary['p50']:8.3f} "
+                         f"{summary['p95']:8.3f} {summary['p99']:8.3f} {summary['max']:8.3f}")
+        depth = metrics['queue_depth']
+        lines.append(f"{'queue depth':12s} {depth['count']:8d} {depth['mean']:8.2f} {depth['p50']:8.0f} "
+                     f"{depth['p95']:8.0f} {depth['p99']:8.0f} {depth['max']:8.0f}")
+        lines += ["", f"{'client':16s} {'room':>5s} {'bytes in':>10s} {'msgs in':>8s} {'bytes out':>11s} "
+                      f"{'frames out':>10s} {'dropped':>8s} {'queued':>7s}"]
+        for client_id, client in sorted(metrics['client_traffic'].items()):
+            lines.append(f"{client_id:16s} {str(client['room']):>5s} {client['bytes_in']:10d} {client['messages_in']:8d} "
+                         f"{client['bytes_out']:11d} {client['frames_out']:10d} {client['frames_dropped']:8d} "
+                         f"{client['queue_depth']:7d}")
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self):
+        """One line for the server log, traffic rates since the previous summary"""
+        metrics = self.collect()
+        now = time.time()
+        # per client deltas, clients that left since the last summary take their totals with them
+        bytes_in = bytes_out = 0
+        traffic = {}
+        for client_id, client in metrics['client_traffic'].items():
+            last_in, last_out = self.last_traffic.get(client_id, (0, 0))
+            bytes_in += client['bytes_in'] - last_in
+            bytes_out += client['bytes_out'] - last_out
+            traffic[client_id] = (client['bytes_in'], client['bytes_out'])
+        rates = ""
+        if self.last_log is not None:
+            elapsed = max(now - self.last_log, 1e-6)
+            rates = f" | in {bytes_in / elapsed / 1024:.1f} KB/s out {bytes_out / elapsed / 1024:.1f} KB/s"
+        self.last_log = now
+        self.last_traffic = traffic
+        tick = metrics['phases_ms']['tick']
+        depth = metrics['queue_depth']
+        print(f"Metrics: {metrics['rooms']} rooms, {metrics['clients']} clients | tick p50 {tick['p50']:.2f} ms "
+              f"p95 {tick['p95']:.2f} ms max {tick['max']:.2f} ms | overruns {metrics['tick_overruns']} "
+              f"dropped {metrics['dropped_ticks']} | queue p95 {depth['p95']:.0f}{rates}")
+
+
+def scale(summary, factor):
+    return {key: value * factor if key != 'count' else value for key, value in summary.items()}
+
+
+class MetricsServer:
+    """Serves ServerMetrics on GET / (text) and GET /json from a daemon thread"""
+
+    def __init__(self, metrics, port, host=METRICS_HOST):
+        handler = type('MetricsHandler', (MetricsHandler,), {'metrics': metrics})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Metrics on http://{host}:{port}/ (and /json)")
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None  # set on the subclass MetricsServer makes
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/json':
+            body = json.dumps(self.metrics.collect()).encode('utf-8')
+            content_type = 'application/json'
+        elif self.path == '/':
+            body = self.metrics.render_text().encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would drown the game log
+        pass
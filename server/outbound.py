@@ -0,0 +1,194 @@
+"""
+outbound.py
+
+Per-client outbound queues.
+
+The game thread only ever appends already encoded frames to a client's
+queue, so a slow or stalled client can't hold up the tick for everyone
+else. Frames are shared bytes objects: a broadcast is encoded once and the
+same object is queued for every client.
+
+ClientSender drains its queue from a dedicated writer thread (threaded
+engine), LoopSender is flushed with non-blocking sends by the event loop
+(event loop engine). Both share the queueing policies of OutboundQueue.
+
+When the client has a UDP channel up (udp_channel.py) its droppable frames
+skip the queue and go out as datagrams right away.
+"""
+
+import threading
+from collections import deque
+
+# What to do with a droppable frame (game snapshots) when the queue is full
+DROP_OLDEST = 'drop_oldest'  # throw away the oldest queued snapshot, the new one is fresher
+DROP_NEWEST = 'drop_newest'  # keep what's queued, throw away the incoming snapshot
+
+# What to do when reliable frames (events) alone exceed the hard limit
+RELIABLE_DISCONNECT = 'disconnect'  # the client is hopelessly behind, drop the connection
+RELIABLE_GROW = 'grow'  # keep queueing, never lose an event
+
+
+class OutboundQueue:
+    """Bounded queue of encoded frames for one client"""
+
+    def __init__(self, client_id, on_error, max_frames=64, max_reliable_frames=4096,
+                 drop_policy=DROP_OLDEST, reliable_policy=RELIABLE_DISCONNECT):
+        self.client_id = client_id
+        self.on_error = on_error
+        self.max_frames = max_frames
+        self.max_reliable_frames = max_reliable_frames
+        self.drop_policy = drop_policy
+        self.reliable_policy = reliable_policy
+
+        self.queue = deque()  # (frame, droppable)
+        self.droppable_count = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.datagram = None  # UdpPeer while the client takes snapshots over UDP
+
+        # Stats
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frames_dropped = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def send(self, frame, droppable=False):
+        """Queue a frame, returns False if it was dropped"""
+        datagram = self.datagram
+        if droppable and datagram is not None and not self.closed and datagram.send(frame):
+            self.frames_sent += 1
+            self.bytes_sent += len(frame)
+            return True
+        with self.condition:
+            if self.closed:
+                return False
+            overflow = False
+            if len(self.queue) >= self.max_frames:
+                if droppable:
+                    if self.drop_policy == DROP_NEWEST or not self.drop_oldest_snapshot():
+                        self.frames_dropped += 1
+                        return False
+                elif not self.drop_oldest_snapshot():
+                    # only events left in the queue, those are never dropped
+                    overflow = (len(self.queue) >= self.max_reliable_frames
+                                and self.reliable_policy == RELIABLE_DISCONNECT)
+            if not overflow:
+                self.queue.append((frame, droppable))
+                if droppable:
+                    self.droppable_count += 1
+                self.wake()
+                return True
+
+        print(f"Outbound queue overflow for client {self.client_id}, disconnecting")
+        self.close()
+        self.on_error(self.client_id)
+        return False
+
+    def wake(self):
+        """Called with the condition held after a frame was queued"""
+        self.condition.notify()
+
+    def drop_oldest_snapshot(self):
+        """Remove the oldest queued droppable frame, caller holds the condition"""
+        for i, (frame, droppable) in enumerate(self.queue):
+            if droppable:
+                del self.queue[i]
+                self.droppable_count -= 1
+                self.frames_dropped += 1
+                return True
+        return False
+
+    def take_all(self):
+        """Remove and return every queued frame, caller holds the condition"""
+        frames = [frame for frame, droppable in self.queue]
+        self.queue.clear()
+        self.droppable_count = 0
+        return frames
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.queue.clear()
+            self.droppable_count = 0
+            self.condition.notify()
+
+
+class ClientSender(OutboundQueue):
+    """Outbound queue written to a blocking socket by its own thread"""
+
+    def __init__(self, client_id, sock, on_error, **policy):
+        super().__init__(client_id, on_error, **policy)
+        self.socket = sock
+        self.thread = threading.Thread(target=self.run, name=f"sender-{client_id}")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                # take everything queued so far and write it with one syscall
+                frames = self.take_all()
+            data = frames[0] if len(frames) == 1 else b''.join(frames)
+            try:
+                self.socket.sendall(data)
+            except Exception as e:
+                if not self.closed:
+                    print(f"Error sending to client {self.client_id}: {e}")
+                    self.close()
+                    self.on_error(self.client_id)
+                return
+            self.frames_sent += len(frames)
+            self.bytes_sent += len(data)
+
+
+class LoopSender(OutboundQueue):
+    """Outbound queue written to a non-blocking socket by an event loop.
+
+    want_write(sender, bool) is called whenever the sender starts or stops
+    needing writability notifications, the loop calls flush() on them.
+    """
+
+    def __init__(self, client_id, sock, on_error, want_write, **policy):
+        super().__init__(client_id, on_error, **policy)
+        self.socket = sock
+        self.want_write = want_write
+        self.pending = b''  # partially written data
+        self.writing = False
+
+    def __len__(self):
+        return len(self.queue) + (1 if self.pending else 0)
+
+    def wake(self):
+        if not self.writing:
+            self.writing = True
+            self.want_write(self, True)
+
+    def flush(self):
+        """Write as much as the socket takes without blocking"""
+        if self.closed:
+            return
+        with self.condition:
+            frames = self.take_all()
+        if frames:
+            self.frames_sent += len(frames)
+            self.pending = self.pending + b''.join(frames) if self.pending else b''.join(frames)
+        try:
+            while self.pending:
+                written = self.socket.send(self.pending)
+                self.bytes_sent += written
+                self.pending = self.pending[written:]
+        except BlockingIOError:
+            return
+        except Exception as e:
+            print(f"Error sending to client {self.client_id}: {e}")
+            self.close()
+            self.on_error(self.client_id)
+            return
+        self.writing = False
+        self.want_write(self, False)
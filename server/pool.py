@@ -0,0 +1,168 @@
+"""
+pool.py
+
+Rooms spread over worker processes behind one listening port.
+
+The master process owns the port and the lobby. Every accepted client is
+assigned a room and its socket is handed to the worker process hosting
+that room, which runs a normal GameServer (either engine) without a
+listening socket of its own. Rooms on different workers tick on different
+cores, so a busy match can't starve the others.
+
+File descriptor passing needs a Unix platform.
+"""
+
+import json
+import multiprocessing
+import selectors
+import socket
+import time
+
+from lobby import Lobby, RemoteLobby, MAX_ROOM_PLAYERS, hand_off_client
+from server import GameServer, BUFFER_SIZE, open_listening_socket
+
+
+def run_worker(engine, channel, settings):
+    """Entry point of a worker process, settings are GameServer keyword arguments"""
+    if engine == 'eventloop':
+        from event_loop import EventLoopServer
+        server = EventLoopServer(handoff=channel, lobby=RemoteLobby(channel), **settings)
+    else:
+        server = GameServer(handoff=channel, lobby=RemoteLobby(channel), **settings)
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def worker_settings(settings, index):
+    """Settings of worker index, every worker serves its metrics and UDP channel on ports of its own"""
+    settings = dict(settings)
+    for key in ('metrics_port', 'udp_port'):
+        if settings.get(key):
+            settings[key] += index
+    return settings
+
+
+class RoomPool:
+    def __init__(self, workers, engine='threaded', settings=None):
+        settings = settings or {}
+        max_room_players = settings.get('max_room_players', MAX_ROOM_PLAYERS)
+        self.socket = open_listening_socket()
+        self.lobby = Lobby(max_room_players, workers)
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+
+        # One channel per worker: client sockets go down, departures come back up
+        # Spawned rather than forked so workers don't inherit the listening
+        # socket or the other workers' channels
+        context = multiprocessing.get_context('spawn')
+        self.channels = []
+        self.processes = []
+        for i in range(workers):
+            channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            process = context.Process(
+                target=run_worker, args=(engine, worker_channel, worker_settings(settings, i)), name=f"room-worker-{i}"
+            )
+            process.daemon = True
+            process.start()
+            worker_channel.close()
+            self.channels.append(channel)
+            self.processes.append(process)
+        print(f"Hosting rooms of up to {max_room_players} players on {workers} {engine} worker processes")
+
+        # Auto-termination for empty server
+        self.empty_server_start_time = None
+        self.empty_server_timeout = 30  # Terminate after 30 seconds of inactivity
+        self.player_ever_joined = False  # Flag to track if any player has ever joined
+
+    def start(self):
+        self.running = True
+        self.socket.setblocking(False)
+        self.selector.register(self.socket, selectors.EVENT_READ, None)
+        for worker, channel in enumerate(self.channels):
+            self.selector.register(channel, selectors.EVENT_READ, worker)
+
+        try:
+            while self.running:
+                for key, mask in self.selector.select(1.0):
+                    if key.data is None:
+                        self.accept()
+                    else:
+                        self.read_worker(key.data)
+                self.check_inactivity(time.time())
+        except Exception as e:
+            print(f"Server error: {e}")
+        finally:
+            self.close()
+
+    def accept(self):
+        try:
+            client_socket, addr = self.socket.accept()
+        except BlockingIOError:
+            return
+        except Exception as e:
+            if self.running:
+                print(f"Socket accept error: {e}")
+            return
+        room_id = self.lobby.assign()
+        worker = self.lobby.worker_of(room_id)
+        print(f"New connection from {addr}, room {room_id} on worker {worker}")
+        try:
+            hand_off_client(self.channels[worker], client_socket, addr, room_id)
+        except OSError as e:
+            print(f"Could not hand client to worker {worker}: {e}")
+            self.lobby.release(room_id)
+        finally:
+            # the worker holds its own copy of the socket now
+            client_socket.close()
+        self.player_ever_joined = True
+
+    def read_worker(self, worker):
+        data = self.channels[worker].recv(BUFFER_SIZE)
+        if not data:
+            print(f"Worker {worker} exited, shutting down")
+            self.running = False
+            return
+        message = json.loads(data)
+        if 'release' in message:
+            self.lobby.release(message['release'])
+
+    def check_inactivity(self, current_time):
+        players = self.lobby.player_count()
+        if not players and self.player_ever_joined and self.empty_server_start_time is None:
+            # Server just became empty after having players, start the timer
+            self.empty_server_start_time = current_time
+            print(f"All players disconnected. Server will terminate in {self.empty_server_timeout} seconds if no one joins.")
+        elif players:
+            # Reset timer if any clients are connected
+            self.empty_server_start_time = None
+        elif self.empty_server_start_time and (current_time - self.empty_server_start_time) >= self.empty_server_timeout:
+            print(f"Server terminating after {self.empty_server_timeout} seconds with no players connected.")
+            self.running = False
+
+    def close(self):
+        self.running = False
+
+        # Workers shut down once their channel closes
+        for channel in self.channels:
+            try:
+                channel.close()
+            except:
+                pass
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.channels = []
+        self.processes = []
+
+        try:
+            self.socket.close()
+        except:
+            pass
+        self.selector.close()
+
+        print("Server closed")
@@ -0,0 +1,79 @@
+"""
+recorder.py
+
+Writes a room's match to a replay file (common/replay.py) off the tick.
+
+The tick thread only hands over what it has anyway: the WorldState and full
+snapshot payload each broadcast captures, the framed bytes of each event
+and, once per keyframe interval, its entities as 'init' carries them. Deltas,
+JSON, compression and the file writes happen on the recorder's own thread.
+"""
+
+import queue
+import threading
+
+from replay import RECORD_DELTA, RECORD_EVENT, RECORD_KEYFRAME, ReplayWriter, encode_event, encode_keyframe
+from snapshot import encode_delta_snapshot
+
+KEYFRAME_SECONDS = 5  # of match time between keyframes, the most a seek has to replay
+
+
+class MatchRecorder:
+    def __init__(self, path, header, keyframe_interval):
+        self.path = path
+        self.writer = ReplayWriter(path, header)
+        self.keyframe_interval = keyframe_interval  # ticks
+        self.last_keyframe = None  # tick
+        self.queue = queue.SimpleQueue()
+        self.closed = False
+        self.failed = False
+        # not a daemon, a server that is shutting down still finishes the file
+        self.thread = threading.Thread(target=self.run, name=f"recorder-{header.get('room_id')}")
+        self.thread.start()
+
+    def keyframe_due(self, tick):
+        return self.last_keyframe is None or tick - self.last_keyframe >= self.keyframe_interval
+
+    def record_snapshot(self, state, full_payload, entities=None):
+        """Queue the snapshot of a tick, a keyframe when the entities at that tick come along"""
+        if entities is not None:
+            self.last_keyframe = state.tick
+        self.queue.put((RECORD_KEYFRAME if entities is not None else RECORD_DELTA, state, full_payload, entities))
+
+    def record_event(self, tick, frame):
+        """Queue a broadcast event, frame is what framed clients got"""
+        self.queue.put((RECORD_EVENT, tick, frame))
+
+    def run(self):
+        previous = None  # state of the last snapshot written, the baseline of the next delta
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.failed:
+                continue
+            try:
+                if item[0] == RECORD_EVENT:
+                    _, tick, frame = item
+                    self.writer.write(RECORD_EVENT, tick, encode_event(frame))
+                    continue
+                kind, state, full_payload, entities = item
+                if kind == RECORD_KEYFRAME:
+                    self.writer.write(RECORD_KEYFRAME, state.tick, encode_keyframe(entities, full_payload))
+                elif previous is not None:
+                    self.writer.write(RECORD_DELTA, state.tick, encode_delta_snapshot(state, previous))
+                previous = state
+            except OSError as e:
+                print(f"Recording to {self.path} failed, the rest of the match is not recorded: {e}")
+                self.failed = True
+        try:
+            self.writer.close()
+        except OSError as e:
+            print(f"Couldn't finish {self.path}: {e}")
+
+    def close(self):
+        """Write out what's queued and the index, without waiting for it"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
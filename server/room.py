@@ -0,0 +1,974 @@
+"""
+room.py
+
+One match: its players, map, cannons, projectiles, powerups and the
+simulation that drives them. A server process hosts any number of rooms,
+each one only ever talks to its own players.
+
+The room's tick is the single writer of its game state: commands read by
+the network threads, joins, leaves and timers are queued and applied at
+the start of the next step().
+"""
+
+import os
+import random
+import time
+from collections import deque
+
+from clock import FixedStepClock
+from spatial import SpatialHash
+from sweep import ObstacleGrid, segment_circle
+from interest import ClientInterest, InterestGrid, LEAVE_MARGIN
+from metrics import TickStats
+from entities import Player, Cannon, Projectile, PowerUp, EntityRegistry, wire_entities
+from recorder import KEYFRAME_SECONDS, MatchRecorder
+from movement import PLAYER_RADIUS, PLAYER_BOOST_SPEED, SPEED_BOOST_DURATION, ARENA_MARGIN, apply_move
+from protocol import PROTOCOL_FRAMED, PROTOCOL_LEGACY, encode_message, encode_frame, encode_legacy_message
+from snapshot import (
+    CANNON_TYPES, POWERUP_TYPES, SnapshotHistory, capture_snapshot, encode_delta_snapshot, encode_full_snapshot
+)
+
+# Simulation ticks per second, every tick advances the match by exactly 1 / TICK_RATE
+TICK_RATE = 20
+# Snapshots per second sent to clients, at most one per tick
+SEND_RATE = 20
+
+# How projectiles are stored and simulated: a list of dicts advanced one at a
+# time, or NumPy arrays advanced in batches (needs numpy installed)
+PROJECTILES_DICT = 'dict'
+PROJECTILES_NUMPY = 'numpy'
+
+CANNON_SPAWN_DELAY = 5  # seconds without any cannon before a new one spawns
+CANNON_PICKUP_RANGE = 40
+# Movement inputs a player may send per second (one per client frame) and
+# how many can pile up, anything faster is acked but not applied
+INPUT_RATE = 60
+INPUT_BURST = 15
+MAX_PROJECTILE_BOUNCES_PER_TICK = 4  # wall contacts a projectile resolves in one tick
+# Commands a client can have waiting for the next tick, a client that sends
+# more than that is disconnected rather than losing any of them
+INBOUND_QUEUE_SIZE = 256
+# Commands that only set state: of several from one client in a tick, the latest is applied
+COALESCED_COMMANDS = ('player_update', 'snapshot_ack')
+
+# Cannon properties by type - increasing speeds significantly
+CANNON_PROPERTIES = {
+    'RAPID': {'damage': 10, 'speed': 350, 'cooldown': 0.3, 'shots': 10, 'radius': 5, 'color': (255, 0, 0)},
+    'EXPLOSIVE': {'damage': 30, 'speed': 250, 'cooldown': 1.0, 'shots': 3, 'radius': 15, 'color': (255, 255, 0)},
+    'BOUNCING': {'damage': 15, 'speed': 200, 'cooldown': 0.7, 'shots': 5, 'radius': 8, 'color': (0, 255, 0)}
+}
+
+POWERUP_PROPERTIES = {
+    'HEALTH': {'radius': 10, 'color': (0, 255, 0)},
+    'SPEED': {'radius': 10, 'color': (255, 255, 0)}
+}
+
+class GameRoom:
+    def __init__(self, room_id, schedule, tick_rate=TICK_RATE, send_rate=SEND_RATE,
+                 projectile_engine=PROJECTILES_DICT, interest_radius=None):
+        self.room_id = room_id
+        self.schedule = schedule  # schedule(delay, callback) of the hosting server
+        self.running = True
+        
+        # Fixed timestep simulation, snapshots go out every send_interval ticks
+        self.tick_rate = tick_rate
+        self.clock = FixedStepClock(tick_rate)
+        self.tick_interval = self.clock.interval
+        self.send_interval = max(1, round(tick_rate / send_rate))
+        self.tick = 0
+        self.snapshot_due = False
+        # Phase timings, overruns and queue depths, read by the server's metrics
+        self.stats = TickStats()
+        # Replay file writer, see start_recording()
+        self.recorder = None
+        
+        # Members of this room
+        self.client_protocols = {}  # client_id -> PROTOCOL_FRAMED / PROTOCOL_LEGACY
+        self.client_senders = {}  # client_id -> outbound queue
+        
+        # The room's tick is the only writer of game state. Network threads
+        # queue what comes in, apply_commands() takes it on at the next tick.
+        self.members = set()  # client ids joined or queued to join, kept by the network threads
+        self.room_commands = deque()  # callbacks for the next tick: joins, leaves, timers
+        self.inbound = {}  # client_id -> deque of commands from that client, in join order
+        
+        # Game state, the registry indexes every entity (see entities.py).
+        # players, cannons, projectiles and powerups are its stores, never rebound.
+        self.projectile_engine = projectile_engine
+        projectiles = None
+        if projectile_engine == PROJECTILES_NUMPY:
+            from projectile_arrays import ProjectileArrays
+            projectiles = ProjectileArrays()
+        self.entities = EntityRegistry(projectiles)
+        self.players = self.entities.players
+        self.cannons = self.entities.cannons
+        self.projectiles = self.entities.projectiles
+        self.powerups = self.entities.powerups
+        self.obstacles = []
+        
+        # Delta snapshots: recent states sent to each client and the last tick it applied
+        self.snapshot_histories = {}
+        self.snapshot_acks = {}
+        
+        # Area of interest, framed clients only hear about entities within
+        # interest_radius of their player (None: the whole map)
+        self.interest_radius = interest_radius
+        self.client_interests = {}  # client_id -> ClientInterest
+        # Last (input seq, x, y) acked to each framed client, so unchanged acks aren't resent
+        self.input_acks = {}
+        
+        # Game settings
+        self.map_width = 1000
+        self.map_height = 700
+        self.grid_size = 50
+        # Broad phase for collisions, players bucketed by map grid cell
+        self.player_index = SpatialHash(self.grid_size)
+        self.game_started = False
+        self.sudden_death = False
+        self.sudden_death_timer = 120  # 2 minutes
+        
+        self.last_cannon_spawn_tick = 0
+        
+        # Generate map obstacles
+        self.generate_obstacles()
+        # Obstacle boxes bucketed by cell once, projectiles are swept against them every tick
+        self.obstacle_grid = ObstacleGrid(self.obstacles, self.grid_size, (
+            ARENA_MARGIN, ARENA_MARGIN, self.map_width - ARENA_MARGIN, self.map_height - ARENA_MARGIN
+        ))
+    
+    def generate_obstacles(self):
+        grid_width = self.map_width // self.grid_size
+        grid_height = self.map_height // self.grid_size
+        
+        for i in range(1, grid_width - 1):
+            for j in range(1, grid_height - 1):
+                if (i + j) % 2 == 0:  
+                    self.obstacles.append({
+                        'x': i * self.grid_size,
+                        'y': j * self.grid_size,
+                        'width': self.grid_size,
+                        'height': self.grid_size
+                    })
+    
+    def start_recording(self, directory):
+        """Record this match into a replay file in directory"""
+        path = os.path.join(directory, f"room-{self.room_id}-{time.strftime('%Y%m%d-%H%M%S')}.replay")
+        header = {
+            'room_id': self.room_id,
+            'started': time.time(),
+            'map_width': self.map_width,
+            'map_height': self.map_height,
+            'tick_rate': self.tick_rate,
+            'obstacles': self.obstacles,
+            'tables': self.snapshot_tables()
+        }
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self.recorder = MatchRecorder(path, header, max(1, round(KEYFRAME_SECONDS * self.tick_rate)))
+        except OSError as e:
+            print(f"Room {self.room_id} is not recorded, can't write {path}: {e}")
+            return
+        print(f"Recording room {self.room_id} to {path}")
+    
+    def record_snapshot(self, state, full_payload):
+        entities = None
+        if self.recorder.keyframe_due(state.tick):
+            # copied at this tick, the recorder thread encodes them while the match goes on
+            entities = wire_entities(self.players.values(), self.cannons, self.projectiles, self.powerups)
+        self.recorder.record_snapshot(state, full_payload, entities)
+    
+    def encode_for_client(self, protocol, msg_type, data):
+        if protocol == PROTOCOL_FRAMED:
+            return encode_message(msg_type, {'data': data})
+        return encode_legacy_message({'type': msg_type, 'data': data})
+
+    def send_message_to_client(self, client_id, msg_type, data):
+        protocol = self.client_protocols.get(client_id, PROTOCOL_LEGACY)
+        message_bytes = self.encode_for_client(protocol, msg_type, data)
+        sender = self.client_senders.get(client_id)
+        if sender is not None:
+            sender.send(message_bytes)
+    
+    def call_soon(self, callback):
+        """Run callback on the room's tick, before the next step simulates anything"""
+        self.room_commands.append(callback)
+    
+    def schedule_tick(self, delay, callback):
+        """Like schedule() but callback runs at the first tick after delay seconds"""
+        self.schedule(delay, lambda: self.call_soon(callback))
+    
+    def add_player(self, client_id, player_info, protocol, sender):
+        """Queue a new member, it joins the match at the next tick"""
+        self.members.add(client_id)
+        # a reconnect starts over with an empty queue, commands may arrive before the join is applied
+        self.inbound[client_id] = deque()
+        self.call_soon(lambda: self.join(client_id, player_info, protocol, sender))
+    
+    def join(self, client_id, player_info, protocol, sender):
+        # player ID and starting position
+        x = random.randint(50, self.map_width - 50)
+        y = random.randint(50, self.map_height - 50)
+        color = player_info.get('color', (255, 0, 0)) 
+        name = player_info.get('name', f"Player_{random.randint(100, 999)}")
+        
+        # Add player to the game
+        self.client_protocols[client_id] = protocol
+        self.client_senders[client_id] = sender
+        if protocol == PROTOCOL_FRAMED:
+            # a reconnect starts over from a full snapshot
+            self.snapshot_histories[client_id] = SnapshotHistory()
+            self.snapshot_acks.pop(client_id, None)
+            if self.interest_radius:
+                self.client_interests[client_id] = ClientInterest(self.interest_radius)
+        player = Player(client_id, self.entities.player_handles.allocate(self.players.values()), x, y, color, name,
+                        INPUT_BURST)
+        self.entities.add_player(player)
+        self.player_index.insert(client_id, x, y)
+        
+        # Initial state for the new player, only what is around it when interest is on
+        players, cannons, projectiles, powerups = self.players.values(), self.cannons, self.projectiles, self.powerups
+        interest = self.client_interests.get(client_id)
+        if interest is not None:
+            entered, _ = interest.update(self.interest_grid(), player)
+            players = entered.get('players', [])
+            cannons = entered.get('cannons', [])
+            projectiles = entered.get('projectiles', [])
+            powerups = entered.get('powerups', [])
+        
+        # Send initial state to the new player
+        self.send_message_to_client(client_id, 'init', dict(
+            wire_entities(players, cannons, projectiles, powerups),
+            client_id=client_id,
+            room_id=self.room_id,
+            map_width=self.map_width,
+            map_height=self.map_height,
+            tick_rate=self.tick_rate,
+            obstacles=self.obstacles,
+            tables=self.snapshot_tables()
+        ))
+        
+        # Broadcast to all clients about new player, the snapshot follows on the next tick
+        self.broadcast_message('player_joined', {'player': player.wire()}, at=(x, y), entity=('players', player))
+        self.snapshot_due = True
+        
+        if not self.game_started:
+            self.game_started = True
+            self.broadcast_message('game_start', {'message': 'Game starting!'})
+            self.spawn_cannon()
+    
+    def queue_client_message(self, client_id, message):
+        """Take a command from a client on whichever thread read it, it's applied at
+        the next tick. False if the client has INBOUND_QUEUE_SIZE commands waiting
+        already, nothing is dropped: the caller is expected to disconnect it.
+        """
+        commands = self.inbound.get(client_id)
+        if commands is None:
+            return True
+        if message.get('type') != 'batch':
+            if len(commands) >= INBOUND_QUEUE_SIZE:
+                return False
+            commands.append(message)
+            return True
+        
+        # several commands the client queued up during one of its network ticks
+        queued = [command for command in message.get('messages', [])
+                  if isinstance(command, dict) and command.get('type') != 'batch']
+        if len(commands) + len(queued) > INBOUND_QUEUE_SIZE:
+            return False
+        commands.extend(queued)
+        return True
+    
+    def apply_commands(self):
+        """Everything queued since the last tick: joins, leaves and timers, then
+        each client's commands in join order. Only the latest of a client's
+        COALESCED_COMMANDS of each type is applied.
+        """
+        room_commands = self.room_commands
+        while room_commands:
+            room_commands.popleft()()
+        
+        for client_id, commands in list(self.inbound.items()):
+            if not commands:
+                continue
+            # popleft until empty, the reader thread may append meanwhile
+            pending = []
+            try:
+                while True:
+                    pending.append(commands.popleft())
+            except IndexError:
+                pass
+            latest = {}
+            for i, message in enumerate(pending):
+                msg_type = message.get('type')
+                if msg_type in COALESCED_COMMANDS:
+                    latest[msg_type] = i
+            for i, message in enumerate(pending):
+                msg_type = message.get('type')
+                if msg_type in COALESCED_COMMANDS and latest[msg_type] != i:
+                    continue
+                try:
+                    self.handle_client_message(client_id, message)
+                except Exception as e:
+                    print(f"Error processing message from client {client_id}: {e}")
+    
+    def handle_client_message(self, client_id, message):
+        """Apply one command, on the room's tick"""
+        msg_type = message.get('type')
+        
+        if msg_type == 'player_input':
+            self.handle_player_input(client_id, message.get('seq'), message.get('move'), message.get('count', 1))
+        
+        elif msg_type == 'player_update':
+            # Absolute positions are only taken from legacy clients, framed
+            # clients send inputs and the server moves them
+            if self.client_protocols.get(client_id) != PROTOCOL_LEGACY:
+                return
+            player_data = message.get('data', {})
+            player = self.players.get(client_id)
+            if player and player.alive:
+                if 'x' in player_data and 'y' in player_data:
+                    new_x = player_data['x']
+                    new_y = player_data['y']
+                    player.x = new_x
+                    player.y = new_y
+                    self.player_index.move(client_id, new_x, new_y)
+        
+        elif msg_type == 'cannon_pickup':
+            cannon_id = message.get('cannon_id')
+            self.handle_cannon_pickup(client_id, cannon_id)
+        
+        elif msg_type == 'cannon_shoot':
+            target_x = message.get('target_x')
+            target_y = message.get('target_y')
+            self.handle_cannon_shoot(client_id, target_x, target_y)
+
+        elif msg_type == 'snapshot_ack':
+            # None means the client lost its baseline and needs a full snapshot
+            tick = message.get('tick')
+            if tick is None:
+                self.snapshot_acks.pop(client_id, None)
+            else:
+                self.snapshot_acks[client_id] = tick
+        
+        elif msg_type == 'ping':
+            self.send_message_to_client(client_id, 'pong', {})
+    
+    def handle_player_input(self, client_id, seq, move, count=1):
+        """Apply count identical movement inputs ending at sequence number seq.
+
+        The client replays whatever we haven't acked yet on top of our position.
+        """
+        player = self.players.get(client_id)
+        if not player or not isinstance(seq, int) or not isinstance(count, int) or seq <= player.input_seq:
+            return
+        # only the inputs we haven't seen yet
+        steps = min(count, seq - player.input_seq)
+        # acked even when refused, the client's prediction gets corrected by the next ack
+        player.input_seq = seq
+        if not player.alive or player.has_cannon:
+            return
+        if not isinstance(move, list) or len(move) != 2:
+            return
+        
+        speed = player.speed
+        if self.tick * self.tick_interval < player.speed_boost_end:
+            speed = PLAYER_BOOST_SPEED
+        x, y = player.x, player.y
+        for _ in range(steps):
+            if player.input_budget < 1:
+                break
+            player.input_budget -= 1
+            x, y = apply_move(x, y, move[0], move[1], speed, self.map_width, self.map_height)
+        player.x = x
+        player.y = y
+        self.player_index.move(client_id, x, y)
+    
+    def handle_cannon_pickup(self, client_id, cannon_id):
+        cannon = self.cannons.get(cannon_id)
+        player = self.players.get(client_id)
+        
+        if cannon and player and cannon.controlled_by is None:
+            # Check if player close enough to pick up cannon
+            dx = player.x - cannon.x
+            dy = player.y - cannon.y
+            
+            if dx*dx + dy*dy < CANNON_PICKUP_RANGE * CANNON_PICKUP_RANGE: 
+                # Player gets control of the cannon
+                self.entities.take_cannon(player, cannon)
+                
+                # Broadcast cannon pickup
+                self.broadcast_message('cannon_pickup', {
+                    'cannon_id': cannon_id,
+                    'player_id': client_id
+                })
+    
+    def handle_cannon_shoot(self, client_id, target_x, target_y):
+        player = self.players.get(client_id)
+        if not player or not player.alive or not player.has_cannon:
+            return
+        
+        # Find player's cannon
+        cannon = self.entities.cannon_of(client_id)
+        
+        if cannon and cannon.shots_left > 0:
+            # Calculate direction
+            player_x, player_y = player.x, player.y
+            dx = target_x - player_x
+            dy = target_y - player_y
+            distance = max(1, (dx*dx + dy*dy) ** 0.5)
+            dx /= distance
+            dy /= distance
+            
+            # Check cooldown, in simulation time
+            current_time = self.tick * self.tick_interval
+            if cannon.last_shot_time is not None and current_time - cannon.last_shot_time < cannon.cooldown:
+                return 
+            
+            # Create new projectile
+            can_bounce = cannon.type == 'BOUNCING'
+            projectile = Projectile(
+                self.entities.next_id(), self.entities.projectile_handles.allocate(self.projectiles), cannon.type,
+                player_x, player_y, dx * cannon.speed, dy * cannon.speed, cannon.damage, cannon.radius, cannon.color,
+                client_id, can_bounce, 3 if can_bounce else 0
+            )
+            self.projectiles.append(projectile)
+            
+            # Update cannon state
+            cannon.shots_left -= 1
+            cannon.last_shot_time = current_time
+            cannon.use_timer = 0 
+            
+            # If cannon is out of shots, release it
+            if cannon.shots_left <= 0:
+                self.entities.remove_cannon(cannon)
+                
+                self.broadcast_message('cannon_depleted', {
+                    'cannon_id': cannon.id
+                })
+            
+            self.broadcast_message('cannon_shot', {
+                'projectile': projectile.wire()
+            }, at=(player_x, player_y), entity=('projectiles', projectile))
+    
+    def spawn_cannon(self):
+        # Find a position not occupied by obstacles
+        while True:
+            x = random.randint(self.grid_size, self.map_width - self.grid_size)
+            y = random.randint(self.grid_size, self.map_height - self.grid_size)
+            
+            # Check for collision with obstacles
+            collision = False
+            for obstacle in self.obstacles:
+                ox, oy = obstacle['x'], obstacle['y']
+                ow, oh = obstacle['width'], obstacle['height']
+                if (ox <= x <= ox + ow and oy <= y <= oy + oh):
+                    collision = True
+                    break
+            
+            if not collision:
+                # Choose a random cannon type
+                cannon_types = ['RAPID', 'EXPLOSIVE', 'BOUNCING']
+                cannon_type = random.choice(cannon_types)
+                
+                # Create the cannon
+                cannon = Cannon(self.entities.next_id(), self.entities.cannon_handles.allocate(self.cannons),
+                                x, y, cannon_type, CANNON_PROPERTIES[cannon_type])
+                self.cannons.append(cannon)
+                
+                # Broadcast new cannon
+                self.broadcast_message('cannon_spawn', {
+                    'cannon': cannon.wire()
+                }, at=(x, y), entity=('cannons', cannon))
+                
+                break
+    
+    def spawn_powerup(self, x, y):
+        power_types = ['HEALTH', 'SPEED']
+        power_type = random.choice(power_types)
+        
+        properties = POWERUP_PROPERTIES[power_type]
+        powerup = PowerUp(self.entities.next_id(), self.entities.powerup_handles.allocate(self.powerups),
+                          x, y, power_type, properties['radius'], properties['color'])
+        self.powerups.append(powerup)
+        
+        # Broadcast new powerup
+        self.broadcast_message('powerup_spawn', {
+            'powerup': powerup.wire()
+        }, at=(x, y), entity=('powerups', powerup))
+    
+    def update_projectiles(self, delta_time):
+        if self.projectile_engine == PROJECTILES_NUMPY:
+            # array store, simulated in batches
+            self.projectiles.advance(self, delta_time, PLAYER_RADIUS)
+            return
+        
+        for projectile in list(self.projectiles):
+            hit = self.move_projectile(projectile, delta_time)
+            if hit is None:
+                continue
+            # Remove projectile
+            self.projectiles.remove(projectile)
+            if hit:
+                player_id, player = hit
+                self.hit_player(player_id, player, projectile.damage, projectile.owner_id)
+    
+    def move_projectile(self, projectile, delta_time):
+        """Sweep a projectile along its path for one tick.
+
+        Walls (obstacles and the arena edge) reflect bouncing projectiles that
+        have bounces left and stop everything else. Returns None if the
+        projectile keeps flying, (player_id, player) if it hit somebody, or
+        False if it ran into a wall.
+        """
+        x, y = projectile.x, projectile.y
+        vx, vy = projectile.dx, projectile.dy
+        radius = projectile.radius
+        remaining = delta_time
+        for _ in range(MAX_PROJECTILE_BOUNCES_PER_TICK):
+            move_x = vx * remaining
+            move_y = vy * remaining
+            wall = self.obstacle_grid.first_hit(x, y, move_x, move_y, radius)
+            reach = 1.0 if wall is None else wall[0]
+            
+            # Players along the path up to the wall
+            hit = self.find_projectile_hit(x, y, move_x, move_y, reach, PLAYER_RADIUS + radius,
+                                           projectile.owner_id)
+            if hit:
+                t, player_id, player = hit
+                projectile.x, projectile.y = x + move_x * t, y + move_y * t
+                return player_id, player
+            
+            if wall is None:
+                x += move_x
+                y += move_y
+                break
+            
+            t, normal_x, normal_y = wall
+            x += move_x * t
+            y += move_y * t
+            if not (projectile.can_bounce and projectile.bounces > 0):
+                projectile.x, projectile.y = x, y
+                return False
+            # Reflect off the face that was hit and fly on for the rest of the tick
+            if normal_x:
+                vx = -vx
+            if normal_y:
+                vy = -vy
+            projectile.bounces -= 1
+            remaining *= 1 - t
+        
+        projectile.x, projectile.y = x, y
+        projectile.dx, projectile.dy = vx, vy
+        return None
+    
+    def find_projectile_hit(self, x, y, move_x, move_y, reach, hit_radius, owner_id):
+        """Earliest live player other than the owner that the segment (x, y) +
+        t * (move_x, move_y), t <= reach, passes within hit_radius of, as
+        (t, player_id, player)
+        """
+        # Players in the cells around the swept segment
+        half_x = move_x * reach / 2
+        half_y = move_y * reach / 2
+        query_radius = hit_radius + (half_x*half_x + half_y*half_y) ** 0.5
+        best = None
+        for player_id in self.player_index.query(x + half_x, y + half_y, query_radius):
+            player = self.players.get(player_id)
+            if player and player.alive and player_id != owner_id:
+                t = segment_circle(x, y, move_x, move_y, player.x, player.y, hit_radius)
+                if t is not None and t <= reach and (best is None or t < best[0]):
+                    best = (t, player_id, player)
+        return best
+    
+    def hit_player(self, player_id, player, damage, owner_id):
+        # Player is hit
+        # In sudden death mode, any hit is fatal
+        if self.sudden_death:
+            player.health = 0 
+        else:
+            player.health -= damage
+        
+        # Check if player is eliminated
+        if player.health <= 0:
+            self.eliminate_player(player, owner_id)
+            
+            # Add a specific message for sudden death eliminations
+            if self.sudden_death:
+                self.broadcast_message('player_hit', {
+                    'player_id': player_id,
+                    'damage': player.health,
+                    'health': 0,
+                    'sudden_death_kill': True
+                }, at=(player.x, player.y))
+            
+            self.check_game_over()
+        
+        # Broadcast hit
+        self.broadcast_message('player_hit', {
+            'player_id': player_id,
+            'damage': damage,
+            'health': player.health
+        }, at=(player.x, player.y))
+    
+    def eliminate_player(self, player, eliminator_id):
+        self.entities.set_alive(player, False)
+        player.health = 0
+        
+        # If player had a cannon, it goes with them
+        cannon = self.entities.cannon_of(player.id)
+        if cannon is not None:
+            self.entities.remove_cannon(cannon)
+        
+        # Spawn a powerup at player's position
+        self.spawn_powerup(player.x, player.y)
+        
+        # Broadcast player elimination
+        self.broadcast_message('player_eliminated', {
+            'player_id': player.id,
+            'eliminator_id': eliminator_id
+        })
+    
+    def check_game_over(self):
+        """End the match once at most one player is left standing"""
+        if self.entities.alive_count > 1:
+            return
+        # Game over - last player standing wins
+        winner = self.entities.survivor()
+        self.broadcast_message('game_over', {
+            'winner_id': winner.id if winner else None
+        })
+        # Reset the game in 10 seconds
+        self.schedule_tick(10, self.reset_game)
+    
+    def update_cannons(self, delta_time):
+        # only held cannons change, their explosion timer runs while they aren't fired
+        for player_id, cannon in list(self.entities.controlled_cannons.items()):
+            cannon.use_timer += delta_time
+            if cannon.use_timer < 10:
+                continue
+            
+            # Explode cannon and damage controlling player
+            self.entities.remove_cannon(cannon)
+            player = self.players.get(player_id)
+            if player is not None:
+                player.health -= 50
+                # Check if player is eliminated by explosion
+                if player.health <= 0:
+                    self.eliminate_player(player, None)  # Eliminated by cannon explosion
+                    self.check_game_over()
+                
+                # Broadcast hit
+                self.broadcast_message('player_hit', {
+                    'player_id': player_id,
+                    'damage': 50,
+                    'health': player.health
+                }, at=(player.x, player.y))
+            
+            # Broadcast cannon explosion
+            self.broadcast_message('cannon_exploded', {
+                'cannon_id': cannon.id
+            })
+    
+    def update_powerups(self, delta_time):
+        for powerup in list(self.powerups):
+            pickup_radius = PLAYER_RADIUS + powerup.radius
+            for player_id in self.player_index.query(powerup.x, powerup.y, pickup_radius):
+                player = self.players.get(player_id)
+                if player and player.alive:
+                    dx = player.x - powerup.x
+                    dy = player.y - powerup.y
+                    
+                    if dx*dx + dy*dy < pickup_radius * pickup_radius: 
+                        # Apply powerup effect
+                        if powerup.type == 'HEALTH':
+                            player.health = min(player.health + 30, 100)
+                        elif powerup.type == 'SPEED':
+                            player.speed_boost_end = self.tick * self.tick_interval + SPEED_BOOST_DURATION
+                        
+                        self.powerups.remove(powerup)
+                        
+                        # Broadcast powerup pickup
+                        self.broadcast_message('powerup_pickup', {
+                            'powerup_id': powerup.id,
+                            'player_id': player_id,
+                            'type': powerup.type
+                        })
+                        break
+    
+    def run(self):
+        """Tick loop of a room on its own thread, until the room is closed"""
+        self.clock.reset(time.perf_counter())
+        
+        while self.running:
+            self.advance(time.perf_counter())
+            
+            # Sleep until the next tick is due
+            delay = self.clock.next_deadline() - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    
+    def advance(self, now):
+        """Run every fixed step that is due at perf_counter time now"""
+        for _ in range(self.clock.advance(now)):
+            if not self.running:
+                break
+            self.step()
+    
+    def step(self):
+        """Advance the match by exactly one tick"""
+        started = time.perf_counter()
+        self.tick += 1
+        delta_time = self.tick_interval
+        
+        # What came in since the last tick
+        self.apply_commands()
+        
+        # Refill every player's movement input budget
+        for player in list(self.players.values()):
+            player.input_budget = min(INPUT_BURST, player.input_budget + INPUT_RATE * delta_time)
+        
+        # Update game state
+        if self.game_started:
+            # Update projectiles
+            lap = time.perf_counter()
+            self.update_projectiles(delta_time)
+            lap = self.stats.lap('projectiles', lap)
+            
+            # Update cannons
+            self.update_cannons(delta_time)
+            lap = self.stats.lap('cannons', lap)
+            
+            # Update powerups
+            self.update_powerups(delta_time)
+            self.stats.lap('powerups', lap)
+            
+            # Spawn new cannon if needed (every 5 seconds)
+            if (self.tick - self.last_cannon_spawn_tick) * delta_time >= CANNON_SPAWN_DELAY and len(self.cannons) == 0:
+                # Only spawn a new cannon if there are no cannons currently in the game
+                self.spawn_cannon()
+                self.last_cannon_spawn_tick = self.tick
+            
+            # Update sudden death timer
+            if not self.sudden_death:
+                self.sudden_death_timer -= delta_time
+                if self.sudden_death_timer <= 0:
+                    self.sudden_death = True
+                    self.broadcast_message('sudden_death', {'message': 'Sudden Death Mode Activated!'})
+            
+            # Broadcast game state update at the send rate
+            if self.snapshot_due or self.tick % self.send_interval == 0:
+                self.broadcast_game_update()
+        
+        self.stats.end_tick(started, self.tick_interval)
+    
+    def snapshot_tables(self):
+        # Static per-type data so snapshots only need to carry type ids
+        return {
+            'cannon_types': [
+                {'type': cannon_type, 'radius': CANNON_PROPERTIES[cannon_type]['radius'],
+                 'color': CANNON_PROPERTIES[cannon_type]['color']}
+                for cannon_type in CANNON_TYPES
+            ],
+            'powerup_types': [
+                {'type': power_type, 'radius': POWERUP_PROPERTIES[power_type]['radius'],
+                 'color': POWERUP_PROPERTIES[power_type]['color']}
+                for power_type in POWERUP_TYPES
+            ]
+        }
+    
+    def interest_grid(self):
+        """This tick's entities bucketed for the per client interest queries"""
+        return InterestGrid(self.interest_radius * LEAVE_MARGIN, {
+            'players': self.players.values(),
+            'cannons': self.cannons,
+            'projectiles': list(self.projectiles),
+            'powerups': self.powerups
+        })
+    
+    def broadcast_game_update(self):
+        started = time.perf_counter()
+        self.snapshot_due = False
+        state, full_payload = capture_snapshot(
+            self.players, self.cannons, self.projectiles, self.powerups,
+            self.sudden_death, self.sudden_death_timer, self.tick
+        )
+        full_frame = encode_frame('game_snapshot', full_payload)
+        if self.recorder is not None:
+            self.record_snapshot(state, full_payload)
+        # time spent encoding, the rest of this method is queueing frames
+        encoding = time.perf_counter() - started
+        delta_frames = {}  # baseline tick -> frame, clients on the same baseline share it
+        legacy_frame = None
+        grid = self.interest_grid() if self.client_interests else None
+        
+        for client_id, sender in list(self.client_senders.items()):
+            if self.client_protocols.get(client_id) == PROTOCOL_FRAMED:
+                self.send_input_ack(client_id, sender)
+                # Delta against the last state this client acked, full snapshot if
+                # it hasn't acked anything yet or the baseline fell out of the ring
+                history = self.snapshot_histories[client_id]
+                base_tick = self.snapshot_acks.get(client_id)
+                base = history.get(base_tick) if base_tick is not None else None
+                interest = self.client_interests.get(client_id)
+                encode_start = time.perf_counter()
+                if interest is not None:
+                    frame, state_sent = self.filtered_snapshot(client_id, sender, interest, grid, state, base)
+                elif base is None:
+                    frame, state_sent = full_frame, state
+                else:
+                    if base_tick not in delta_frames:
+                        delta_frames[base_tick] = encode_frame('game_delta', encode_delta_snapshot(state, base))
+                    frame, state_sent = delta_frames[base_tick], state
+                encoding += time.perf_counter() - encode_start
+                history.add(state_sent)
+            else:
+                # legacy clients rebuild their world from every update, they get all of it
+                if legacy_frame is None:
+                    encode_start = time.perf_counter()
+                    legacy_frame = encode_legacy_message({'type': 'game_update', 'data': self.legacy_update()})
+                    encoding += time.perf_counter() - encode_start
+                frame = legacy_frame
+            # snapshots are superseded by the next one, fine to drop for a slow client
+            self.stats.queue_depth.record(len(sender))
+            sender.send(frame, droppable=True)
+        
+        self.stats.phases['serialize'].record(encoding)
+        self.stats.phases['broadcast'].record(time.perf_counter() - started - encoding)
+    
+    def legacy_update(self):
+        """The whole world as a legacy client's game_update"""
+        return dict(
+            wire_entities(self.players.values(), self.cannons, self.projectiles, self.powerups),
+            type='game_update', tick=self.tick,
+            sudden_death=self.sudden_death, sudden_death_timer=self.sudden_death_timer
+        )
+    
+    def send_input_ack(self, client_id, sender):
+        """Tell a client the last input we applied and where that left its player"""
+        player = self.players.get(client_id)
+        if player is None:
+            return
+        ack = (player.input_seq, player.x, player.y)
+        if self.input_acks.get(client_id) == ack:
+            return
+        self.input_acks[client_id] = ack
+        sender.send(self.encode_for_client(PROTOCOL_FRAMED, 'input_ack', {
+            'seq': ack[0], 'x': ack[1], 'y': ack[2]
+        }))
+    
+    def filtered_snapshot(self, client_id, sender, interest, grid, state, base):
+        """Snapshot frame cut down to one client's area of interest, as (frame, state)"""
+        player = self.players.get(client_id)
+        if player is not None:
+            entered, left = interest.update(grid, player)
+            if entered or left:
+                # the client needs the whole entity before a snapshot record can refer to it
+                sender.send(self.encode_for_client(PROTOCOL_FRAMED, 'interest', {
+                    'enter': {kind: [e.wire() for e in entities] for kind, entities in entered.items()},
+                    'leave': left, 'tick': self.tick
+                }))
+        state = interest.filter_state(state)
+        if base is None:
+            return encode_frame('game_snapshot', encode_full_snapshot(state)), state
+        return encode_frame('game_delta', encode_delta_snapshot(state, base)), state
+    
+    def broadcast_message(self, msg_type, data, at=None, entity=None):
+        """Send an event to the room.
+
+        Events that happen somewhere (at=(x, y)) only go to clients with that
+        point in their area of interest; entity=(kind, entity) marks the
+        entity the event carries as known to the clients that got it.
+        """
+        # events carry the tick they happened on
+        data = dict(data, tick=self.tick)
+        framed = lambda: self.encode_for_client(PROTOCOL_FRAMED, msg_type, data)
+        if self.recorder is not None:
+            # encoded right away, the file gets the same bytes framed clients do
+            frame = framed()
+            framed = lambda: frame
+            self.recorder.record_event(self.tick, frame)
+        self.broadcast_encoded({
+            PROTOCOL_FRAMED: framed,
+            PROTOCOL_LEGACY: lambda: self.encode_for_client(PROTOCOL_LEGACY, msg_type, data)
+        }, at, entity)
+    
+    def broadcast_encoded(self, encoders, at=None, entity=None):
+        # Encode at most once per protocol, not once per client
+        encoded = {}
+        
+        for client_id, sender in list(self.client_senders.items()):
+            interest = self.client_interests.get(client_id)
+            if interest is not None and at is not None:
+                viewer = self.players.get(client_id)
+                if viewer is not None and not interest.covers(viewer, *at):
+                    continue
+                if entity is not None:
+                    interest.add(*entity)
+            protocol = self.client_protocols.get(client_id, PROTOCOL_LEGACY)
+            if protocol not in encoded:
+                encoded[protocol] = encoders[protocol]()
+            sender.send(encoded[protocol])
+    
+    def remove_player(self, client_id):
+        """Queue a member's departure, it leaves the match at the next tick"""
+        # The reader and writer threads can both get here for the same client
+        self.members.discard(client_id)
+        self.inbound.pop(client_id, None)
+        self.call_soon(lambda: self.leave(client_id))
+    
+    def leave(self, client_id):
+        sender = self.client_senders.pop(client_id, None)
+        if sender is not None:
+            sender.close()
+        self.client_protocols.pop(client_id, None)
+        self.snapshot_histories.pop(client_id, None)
+        self.snapshot_acks.pop(client_id, None)
+        self.client_interests.pop(client_id, None)
+        self.input_acks.pop(client_id, None)
+        
+        # Release any cannon the player was holding
+        cannon = self.entities.cannon_of(client_id)
+        if cannon is not None:
+            self.entities.remove_cannon(cannon)
+        player = self.entities.remove_player(client_id)
+        self.player_index.remove(client_id)
+        if player:
+            # Broadcast player left
+            self.broadcast_message('player_left', {'player_id': client_id})
+            
+            if self.game_started:
+                self.check_game_over()
+    
+    def reset_game(self):
+        if not self.running:
+            # everyone left before the reset timer fired
+            return
+        
+        # Clear game objects
+        self.entities.clear_items()
+        
+        # Reset player states
+        for player_id, player in self.players.items():
+            player.x = random.randint(50, self.map_width - 50)
+            player.y = random.randint(50, self.map_height - 50)
+            player.health = 100
+            self.entities.set_alive(player, True)
+            player.speed_boost_end = 0
+            self.player_index.move(player_id, player.x, player.y)
+        
+        # Reset game settings
+        self.sudden_death = False
+        self.sudden_death_timer = 120
+        
+        # Broadcast game reset
+        self.broadcast_message('game_reset', {'message': 'New game starting!'})
+        
+        # Spawn initial cannon
+        self.spawn_cannon()
+    
+    def close(self):
+        """Stop the room's tick and drop its outbound queues"""
+        self.running = False
+        for sender in list(self.client_senders.values()):
+            sender.close()
+        if self.recorder is not None:
+            self.recorder.close()
@@ -1,88 +1,120 @@
+import argparse
 import socket
 import threading
 import pickle
 import time
 import random
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from protocol import (
+    PROTOCOL_HELLO, PROTOCOL_VERSION, PROTOCOL_FRAMED, PROTOCOL_LEGACY,
+    FrameBuffer, ProtocolError, parse_hello
+)
+from outbound import ClientSender, DROP_OLDEST, RELIABLE_DISCONNECT
+from lobby import Lobby, MAX_ROOM_PLAYERS, receive_client
+from room import GameRoom, TICK_RATE, SEND_RATE, PROJECTILES_DICT, PROJECTILES_NUMPY
+from metrics import ClientTraffic, ServerMetrics, MetricsServer
+from udp_channel import UdpChannel
 
 # Server config
 HOST = '0.0.0.0'  
 PORT = 5555
 BUFFER_SIZE = 4096
 
-UPDATE_INTERVAL = 0.05
+# Outbound queue per client: snapshots beyond OUTBOUND_QUEUE_SIZE queued frames are
+# dropped per OUTBOUND_DROP_POLICY, events are never dropped but a client with more
+# than OUTBOUND_RELIABLE_LIMIT of them pending is handled per OUTBOUND_RELIABLE_POLICY
+OUTBOUND_QUEUE_SIZE = 64
+OUTBOUND_RELIABLE_LIMIT = 4096
+OUTBOUND_DROP_POLICY = DROP_OLDEST
+OUTBOUND_RELIABLE_POLICY = RELIABLE_DISCONNECT
+
+def get_ip_address():
+    hostname = socket.gethostname()
+    ip_address = socket.gethostbyname(hostname)
+    return ip_address
+
+def open_listening_socket():
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listening_socket.bind((HOST, PORT))
+    listening_socket.listen(5)
+    print(f"Server started on {HOST}:{PORT}")
+    print(f"Server IP: {get_ip_address()}")
+    print("Run python client/client.py to connect as local client")
+    print(f"Run python client/client.py {get_ip_address()} to connect as remote client")
+    return listening_socket
 
 class GameServer:
-    def __init__(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind((HOST, PORT))
-        self.socket.listen(5)
-        print(f"Server started on {HOST}:{PORT}")
-        print(f"Server IP: {self.get_ip_address()}")
-        print("Run python client/client.py to connect as local client")
-        print(f"Run python client/client.py {self.get_ip_address()} to connect as remote client")
+    def __init__(self, handoff=None, lobby=None, max_room_players=MAX_ROOM_PLAYERS,
+                 tick_rate=TICK_RATE, send_rate=SEND_RATE, projectile_engine=PROJECTILES_DICT,
+                 interest_radius=None, metrics_port=None, metrics_interval=None, udp_port=None, record_dir=None):
+        # A standalone server accepts its own clients, a pool worker gets them
+        # handed over by the pool master on the handoff channel
+        self.handoff = handoff
+        self.socket = open_listening_socket() if handoff is None else None
+        self.lobby = lobby or Lobby(max_room_players)
         
-        # Game state
-        self.clients = {}
-        self.players = {}
-        self.cannons = []
-        self.projectiles = []
-        self.powerups = []
-        self.obstacles = []
+        # Connections
+        self.clients = {}  # client_id -> socket
+        self.client_rooms = {}  # client_id -> GameRoom
+        self.traffic = {}  # client_id -> ClientTraffic, what each client sent us
         
-        # Game settings
-        self.map_width = 1000
-        self.map_height = 700
-        self.grid_size = 50
+        # Matches hosted by this server
+        self.rooms = {}  # room_id -> GameRoom
+        self.rooms_lock = threading.RLock()
+        self.tick_rate = tick_rate
+        self.send_rate = send_rate
+        self.projectile_engine = projectile_engine
+        self.interest_radius = interest_radius
         self.running = False
-        self.game_started = False
-        self.sudden_death = False
-        self.sudden_death_timer = 120  # 2 minutes
+        
+        # Instrumentation is always collected, the endpoint and the log summaries are opt-in
+        self.metrics = ServerMetrics(self)
+        self.metrics_port = metrics_port
+        self.metrics_interval = metrics_interval
+        self.metrics_server = None
+        
+        # Optional UDP channel for snapshots and inputs, None: everything over TCP
+        self.udp_port = udp_port
+        self.udp = None
+        
+        # Directory every room writes a replay file to, None: nothing is recorded
+        self.record_dir = record_dir
         
         # Auto-termination for empty server
         self.empty_server_start_time = None
         self.empty_server_timeout = 30  # Terminate after 30 seconds of inactivity
         self.player_ever_joined = False  # Flag to track if any player has ever joined
-        
-        # Generate map obstacles
-        self.generate_obstacles()
-    
-    def get_ip_address(self):
-        hostname = socket.gethostname()
-        ip_address = socket.gethostbyname(hostname)
-        return ip_address
-
-    def generate_obstacles(self):
-        grid_width = self.map_width // self.grid_size
-        grid_height = self.map_height // self.grid_size
-        
-        for i in range(1, grid_width - 1):
-            for j in range(1, grid_height - 1):
-                if (i + j) % 2 == 0:  
-                    self.obstacles.append({
-                        'x': i * self.grid_size,
-                        'y': j * self.grid_size,
-                        'width': self.grid_size,
-                        'height': self.grid_size
-                    })
     
     def start(self):
         self.running = True
-        
-        # Start game update thread
-        update_thread = threading.Thread(target=self.game_update_loop)
-        update_thread.daemon = True
-        update_thread.start()
-        self.socket.settimeout(1.0) 
+        self.start_metrics()
+        if self.start_udp():
+            udp_thread = threading.Thread(target=self.udp.run, name="udp")
+            udp_thread.daemon = True
+            udp_thread.start()
+        intake = self.socket if self.handoff is None else self.handoff
+        intake.settimeout(1.0) 
         
         # Accept client connections
         try:
             while self.running:
                 try:
-                    client_socket, addr = self.socket.accept()
+                    if self.handoff is None:
+                        client_socket, addr = self.socket.accept()
+                        room_id = self.lobby.assign()
+                    else:
+                        client = receive_client(self.handoff, BUFFER_SIZE)
+                        if client is None:
+                            break  # pool master went away
+                        client_socket, addr, room_id = client
+                        client_socket.settimeout(None)
                     print(f"New connection from {addr}")
-                    client_thread = threading.Thread(target=self.handle_client, args=(client_socket, addr))
+                    client_thread = threading.Thread(target=self.handle_client, args=(client_socket, addr, room_id))
                     client_thread.daemon = True
                     client_thread.start()
                 except socket.timeout:
@@ -90,679 +122,386 @@ class GameServer:
                 except Exception as e:
                     if self.running: 
                         print(f"Socket accept error: {e}")
+                finally:
+                    self.check_inactivity(time.time())
         except Exception as e:
             print(f"Server error: {e}")
         finally:
             self.close()
 
-    def send_message_to_client(self, client_id, msg_type, data):
-        message = {
-            'type': msg_type,
-            'data': data
-        }
-        message_json = json.dumps(message).encode('utf-8')
+    def start_metrics(self):
+        if self.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+            except OSError as e:
+                print(f"Metrics endpoint unavailable on port {self.metrics_port}: {e}")
+        if self.metrics_interval:
+            self.schedule(self.metrics_interval, self.log_metrics)
+    
+    def log_metrics(self):
+        if not self.running:
+            return
         try:
-            self.clients[client_id].sendall(message_json)
+            self.metrics.log_summary()
         except Exception as e:
-            print(f"Error sending to client {client_id}: {e}")
-            self.handle_disconnect(client_id)
-
+            print(f"Metrics error: {e}")
+        self.schedule(self.metrics_interval, self.log_metrics)
     
-    def handle_client(self, client_socket, addr):
+    def start_udp(self):
+        """Open the UDP channel if one was asked for, False leaves every client on TCP"""
+        if not self.udp_port:
+            return False
+        try:
+            self.udp = UdpChannel(HOST, self.udp_port, self.handle_datagram)
+        except OSError as e:
+            print(f"UDP channel unavailable on port {self.udp_port}, clients stay on TCP: {e}")
+            return False
+        return True
+    
+    def create_sender(self, client_id, client_socket):
+        return ClientSender(
+            client_id, client_socket, self.handle_disconnect,
+            max_frames=OUTBOUND_QUEUE_SIZE, max_reliable_frames=OUTBOUND_RELIABLE_LIMIT,
+            drop_policy=OUTBOUND_DROP_POLICY, reliable_policy=OUTBOUND_RELIABLE_POLICY
+        )
+    
+    def schedule(self, delay, callback):
+        """Run callback after delay seconds"""
+        threading.Timer(delay, callback).start()
+    
+    def start_room(self, room):
+        # Every room ticks on its own thread so a busy match can't stall the others
+        room_thread = threading.Thread(target=room.run, name=f"room-{room.room_id}")
+        room_thread.daemon = True
+        room_thread.start()
+    
+    def close_room(self, room):
+        with self.rooms_lock:
+            if room.members or self.rooms.get(room.room_id) is not room:
+                return
+            del self.rooms[room.room_id]
+        room.close()
+        print(f"Room {room.room_id} closed")
+    
+    def handle_client(self, client_socket, addr, room_id):
         client_id = None
-        buffer = "" 
         try:
-            # First message should be player registration
-            data = client_socket.recv(BUFFER_SIZE)
-            if not data:
+            # First message is either a protocol hello or a legacy JSON registration,
+            # the hello may arrive split over several segments
+            data = b''
+            while len(data) < len(PROTOCOL_HELLO) and not data.startswith(b'{'):
+                received = client_socket.recv(BUFFER_SIZE)
+                if not received:
+                    return
+                data += received
+            
+            if data.startswith(b'{'):
+                # Old client, JSON registration and brace-delimited stream
+                try:
+                    player_info = json.loads(data.decode('utf-8'))
+                except json.JSONDecodeError as e:
+                    print(f"Invalid JSON in registration: {e}")
+                    return
+                client_id = self.register_player(client_socket, player_info, PROTOCOL_LEGACY, room_id)
+                self.read_legacy_messages(client_id, client_socket)
                 return
             
-            # Register the player
-            try:
-                player_info = json.loads(data.decode('utf-8'))
-                client_id = player_info.get('client_id', str(random.randint(1000, 9999)))
-                
-                # player ID and starting position
-                x = random.randint(50, self.map_width - 50)
-                y = random.randint(50, self.map_height - 50)
-                color = player_info.get('color', (255, 0, 0)) 
-                name = player_info.get('name', f"Player_{random.randint(100, 999)}")
-                
-                # Add player to the game
-                self.clients[client_id] = client_socket
-                self.players[client_id] = {
-                    'id': client_id,
-                    'x': x,
-                    'y': y,
-                    'color': color,
-                    'name': name,
-                    'health': 100,
-                    'alive': True,
-                    'has_cannon': False,
-                    'cannon_id': None,
-                    'speed': 5,
-                }
-                
-                initial_state = {
-                    'type': 'init',
-                    'data': {
-                        'client_id': client_id,
-                        'map_width': self.map_width,
-                        'map_height': self.map_height,
-                        'obstacles': self.obstacles,
-                        'players': self.players,
-                        'cannons': self.cannons,
-                        'projectiles': self.projectiles,
-                        'powerups': self.powerups
-                    }
-                }
-                # Send initial state to the new player
-                client_socket.sendall(json.dumps(initial_state).encode('utf-8'))
-                
-                # Broadcast to all clients about new player
-                self.broadcast_game_update()
-                
-                if not self.game_started:
-                    self.game_started = True
-                    self.broadcast_message('game_start', {'message': 'Game starting!'})
-                    self.spawn_cannon()
-                
-                self.player_ever_joined = True
-            except json.JSONDecodeError as e:
-                print(f"Invalid JSON in registration: {e}")
+            version = parse_hello(data)
+            if version is None:
+                print(f"Unknown handshake from {addr}, closing")
+                client_socket.close()
+                return
+            if version != PROTOCOL_VERSION:
+                print(f"Client {addr} speaks protocol v{version}, server speaks v{PROTOCOL_VERSION}")
+                client_socket.close()
                 return
+            client_socket.sendall(PROTOCOL_HELLO)
             
-            # Main client communication loop
-            while self.running:
-                data = client_socket.recv(BUFFER_SIZE)
-                if not data:
-                    break
-                
-                # Add received data to buffer
-                buffer += data.decode('utf-8')
-                
-                # Process complete messages in buffer
-                messages_processed = 0
-                while True:
-                    try:
-                        json_start = buffer.find('{')
-                        if json_start == -1:
-                            break 
-                        depth = 0
-                        json_end = -1
-                        for i in range(json_start, len(buffer)):
-                            if buffer[i] == '{':
-                                depth += 1
-                            elif buffer[i] == '}':
-                                depth -= 1
-                                if depth == 0:
-                                    json_end = i
-                                    break
-                        
-                        if json_end == -1:
-                            break 
-                        # Parse and process the complete JSON message
-                        message_json = buffer[json_start:json_end+1]
-                        message = json.loads(message_json)
-                        self.handle_client_message(client_id, message)
-                        
-                        # Remove the processed message from buffer
-                        buffer = buffer[json_end+1:]
-                        messages_processed += 1
-                        
-                    except json.JSONDecodeError as e:
-                        # Skip invalid JSON by finding the next opening brace
-                        next_start = buffer.find('{', json_start + 1)
-                        if next_start == -1:
-                            buffer = "" 
-                        else:
-                            buffer = buffer[next_start:]
-                        print(f"Invalid JSON from client {client_id}: {e}")
-                    except Exception as e:
-                        print(f"Error processing message: {e}")
-                        buffer = "" 
+            frames = FrameBuffer()
+            frames.feed(data[len(PROTOCOL_HELLO):])
+            
+            # Wait for the framed registration
+            player_info = None
+            while player_info is None:
+                for message in frames.messages():
+                    if message.get('type') == 'register':
+                        player_info = message
                         break
-                
-                if messages_processed == 0 and len(buffer) > BUFFER_SIZE * 2:
-                    # If buffer is too large without valid messages, clear it
-                    print(f"Buffer overflow from client {client_id}, clearing")
-                    buffer = ""
+                else:
+                    if not frames.recv_from(client_socket):
+                        return
+            
+            client_id = self.register_player(client_socket, player_info, PROTOCOL_FRAMED, room_id)
+            self.read_framed_messages(client_id, client_socket, frames)
         
         except ConnectionError:
             print(f"Connection error with client {client_id}")
+        except ProtocolError as e:
+            print(f"Protocol error from client {client_id}: {e}")
         except Exception as e:
             print(f"Client handler error: {e}")
         finally:
             # Clean up when client disconnects
             if client_id:
                 self.handle_disconnect(client_id)
+            else:
+                # never made it into its room
+                self.lobby.release(room_id)
+                client_socket.close()
     
-    def handle_client_message(self, client_id, message):
-        msg_type = message.get('type')
+    def register_player(self, client_socket, player_info, protocol, room_id):
+        client_id = player_info.get('client_id', str(random.randint(1000, 9999)))
         
-        if msg_type == 'player_update':
-            # Update player state (position, etc.)
-            player_data = message.get('data', {})
-            if client_id in self.players and self.players[client_id]['alive']:
-                if 'x' in player_data and 'y' in player_data:
-                    new_x = player_data['x']
-                    new_y = player_data['y']
-                    self.players[client_id]['x'] = new_x
-                    self.players[client_id]['y'] = new_y
+        self.clients[client_id] = client_socket
+        self.traffic[client_id] = ClientTraffic()
+        with self.rooms_lock:
+            room = self.rooms.get(room_id)
+            if room is None:
+                room = GameRoom(room_id, self.schedule, self.tick_rate, self.send_rate, self.projectile_engine,
+                                self.interest_radius)
+                if self.record_dir:
+                    room.start_recording(self.record_dir)
+                self.rooms[room_id] = room
+                self.start_room(room)
+                print(f"Room {room_id} opened")
+            self.client_rooms[client_id] = room
+            room.add_player(client_id, player_info, protocol, self.create_sender(client_id, client_socket))
+            if self.udp is not None and protocol == PROTOCOL_FRAMED:
+                # the client may move its snapshots and inputs over, see udp_channel.py
+                peer = self.udp.offer(client_id)
+                # after the join, the client hears about its own room first
+                room.call_soon(lambda: room.send_message_to_client(
+                    client_id, 'udp_offer', {'port': self.udp.port, 'token': peer.token}
+                ))
         
-        elif msg_type == 'cannon_pickup':
-            cannon_id = message.get('cannon_id')
-            self.handle_cannon_pickup(client_id, cannon_id)
-        
-        elif msg_type == 'cannon_shoot':
-            target_x = message.get('target_x')
-            target_y = message.get('target_y')
-            self.handle_cannon_shoot(client_id, target_x, target_y)
-
-        elif msg_type == 'ping':
-            self.send_message_to_client(client_id, 'pong', {})
+        self.player_ever_joined = True
+        return client_id
     
-    def handle_cannon_pickup(self, client_id, cannon_id):
-        # Find the cannon by ID
-        cannon = None
-        for c in self.cannons:
-            if c.get('id') == cannon_id:
-                cannon = c
+    def read_framed_messages(self, client_id, client_socket, frames):
+        # Main client communication loop, one header unpack per message
+        traffic = self.traffic.setdefault(client_id, ClientTraffic())
+        while self.running:
+            for message in frames.messages():
+                traffic.messages_in += 1
+                self.handle_client_message(client_id, message)
+            received = frames.recv_from(client_socket, BUFFER_SIZE)
+            if not received:
                 break
-        
-        if cannon and cannon.get('controlled_by') is None:
-            player = self.players[client_id]
-            
-            # Check if player close enough to pick up cannon
-            dx = player['x'] - cannon['x']
-            dy = player['y'] - cannon['y']
-            distance = (dx*dx + dy*dy) ** 0.5
-            
-            if distance < 40: 
-                # Player gets control of the cannon
-                cannon['controlled_by'] = client_id
-                player['has_cannon'] = True
-                player['cannon_id'] = cannon_id
-                
-                # Broadcast cannon pickup
-                self.broadcast_message('cannon_pickup', {
-                    'cannon_id': cannon_id,
-                    'player_id': client_id
-                })
+            traffic.bytes_in += received
     
-    def handle_cannon_shoot(self, client_id, target_x, target_y):
-        player = self.players.get(client_id)
-        if not player or not player['alive'] or not player['has_cannon']:
-            return
-        
-        # Find player's cannon
-        cannon = None
-        for c in self.cannons:
-            if c.get('id') == player['cannon_id']:
-                cannon = c
+    def read_legacy_messages(self, client_id, client_socket):
+        buffer = "" 
+        traffic = self.traffic.setdefault(client_id, ClientTraffic())
+        # Main client communication loop
+        while self.running:
+            data = client_socket.recv(BUFFER_SIZE)
+            if not data:
                 break
-        
-        if cannon and cannon.get('shots_left', 0) > 0:
-            # Calculate direction
-            player_x, player_y = player['x'], player['y']
-            dx = target_x - player_x
-            dy = target_y - player_y
-            distance = max(1, (dx*dx + dy*dy) ** 0.5)
-            dx /= distance
-            dy /= distance
-            
-            # Check cooldown
-            current_time = time.time()
-            if current_time - cannon.get('last_shot_time', 0) < cannon.get('cooldown', 0.5):
-                return 
-            
-            # Create new projectile
-            projectile_id = f"proj_{time.time()}_{random.randint(1000, 9999)}"
-            speed = cannon.get('speed', 10)
-            damage = cannon.get('damage', 10)
-            radius = cannon.get('radius', 5)
-            can_bounce = cannon.get('type') == 'BOUNCING'
-            bounces = 3 if can_bounce else 0
-            
-            projectile = {
-                'id': projectile_id,
-                'x': player_x,
-                'y': player_y,
-                'dx': dx * speed,
-                'dy': dy * speed,
-                'damage': damage,
-                'radius': radius,
-                'color': cannon.get('color', (255, 0, 0)),
-                'owner_id': client_id,
-                'can_bounce': can_bounce,
-                'bounces': bounces
-            }
-            self.projectiles.append(projectile)
+            traffic.bytes_in += len(data)
             
-            # Update cannon state
-            cannon['shots_left'] -= 1
-            cannon['last_shot_time'] = current_time
-            cannon['use_timer'] = 0 
+            # Add received data to buffer
+            buffer += data.decode('utf-8')
             
-            # If cannon is out of shots, release it
-            if cannon['shots_left'] <= 0:
-                cannon['controlled_by'] = None
-                player['has_cannon'] = False
-                player['cannon_id'] = None
-                self.cannons = [c for c in self.cannons if c.get('id') != cannon['id']]
-                
-                self.broadcast_message('cannon_depleted', {
-                    'cannon_id': cannon['id']
-                })
-            
-            self.broadcast_message('cannon_shot', {
-                'projectile': projectile
-            })
+            # Process complete messages in buffer
+            messages, buffer = self.split_legacy_messages(client_id, buffer)
+            traffic.messages_in += len(messages)
+            for message in messages:
+                try:
+                    self.handle_client_message(client_id, message)
+                except Exception as e:
+                    print(f"Error processing message: {e}")
     
-    def spawn_cannon(self):
-        # Find a position not occupied by obstacles
+    def split_legacy_messages(self, client_id, buffer):
+        """Take the complete JSON objects off the front of a legacy stream buffer"""
+        messages = []
         while True:
-            x = random.randint(self.grid_size, self.map_width - self.grid_size)
-            y = random.randint(self.grid_size, self.map_height - self.grid_size)
-            
-            # Check for collision with obstacles
-            collision = False
-            for obstacle in self.obstacles:
-                ox, oy = obstacle['x'], obstacle['y']
-                ow, oh = obstacle['width'], obstacle['height']
-                if (ox <= x <= ox + ow and oy <= y <= oy + oh):
-                    collision = True
-                    break
-            
-            if not collision:
-                # Choose a random cannon type
-                cannon_types = ['RAPID', 'EXPLOSIVE', 'BOUNCING']
-                cannon_type = random.choice(cannon_types)
-                
-                # Set properties based on type - increasing speeds significantly
-                properties = {
-                    'RAPID': {'damage': 10, 'speed': 350, 'cooldown': 0.3, 'shots': 10, 'radius': 5, 'color': (255, 0, 0)},
-                    'EXPLOSIVE': {'damage': 30, 'speed': 250, 'cooldown': 1.0, 'shots': 3, 'radius': 15, 'color': (255, 255, 0)},
-                    'BOUNCING': {'damage': 15, 'speed': 200, 'cooldown': 0.7, 'shots': 5, 'radius': 8, 'color': (0, 255, 0)}
-                }
+            try:
+                json_start = buffer.find('{')
+                if json_start == -1:
+                    break 
+                depth = 0
+                json_end = -1
+                for i in range(json_start, len(buffer)):
+                    if buffer[i] == '{':
+                        depth += 1
+                    elif buffer[i] == '}':
+                        depth -= 1
+                        if depth == 0:
+                            json_end = i
+                            break
                 
-                # Create the cannon
-                cannon_id = f"cannon_{time.time()}_{random.randint(1000, 9999)}"
-                cannon = {
-                    'id': cannon_id,
-                    'x': x,
-                    'y': y,
-                    'type': cannon_type,
-                    'shots_left': properties[cannon_type]['shots'],
-                    'damage': properties[cannon_type]['damage'],
-                    'speed': properties[cannon_type]['speed'],
-                    'cooldown': properties[cannon_type]['cooldown'],
-                    'radius': properties[cannon_type]['radius'],
-                    'color': properties[cannon_type]['color'],
-                    'controlled_by': None,
-                    'spawn_time': time.time(),
-                    'use_timer': 0,
-                    'last_shot_time': 0
-                }
-                self.cannons.append(cannon)
+                if json_end == -1:
+                    break 
+                # Parse the complete JSON message
+                message_json = buffer[json_start:json_end+1]
+                messages.append(json.loads(message_json))
                 
-                # Broadcast new cannon
-                self.broadcast_message('cannon_spawn', {
-                    'cannon': cannon
-                })
+                # Remove the processed message from buffer
+                buffer = buffer[json_end+1:]
                 
-                break
-    
-    def spawn_powerup(self, x, y):
-        power_types = ['HEALTH', 'SPEED']
-        power_type = random.choice(power_types)
-        
-        powerup_id = f"powerup_{time.time()}_{random.randint(1000, 9999)}"
-        powerup = {
-            'id': powerup_id,
-            'x': x,
-            'y': y,
-            'type': power_type,
-            'radius': 10,
-            'color': (0, 255, 0) if power_type == 'HEALTH' else (255, 255, 0)
-        }
-        self.powerups.append(powerup)
-        
-        # Broadcast new powerup
-        self.broadcast_message('powerup_spawn', {
-            'powerup': powerup
-        })
-    
-    def update_projectiles(self, delta_time):
-        for projectile in self.projectiles[:]:
-            projectile['x'] += projectile['dx'] * delta_time
-            projectile['y'] += projectile['dy'] * delta_time
-            
-            # Check if out of bounds
-            x, y = projectile['x'], projectile['y']
-            if x < 50 or x > self.map_width-50 or y < 50 or y > self.map_height-50:
-                if projectile['can_bounce'] and projectile['bounces'] > 0:
-                    if x < 50 or x > self.map_width-50:
-                        projectile['dx'] = -projectile['dx']
-                    if y < 50 or y > self.map_height-50:
-                        projectile['dy'] = -projectile['dy']
-                    projectile['bounces'] -= 1
-                    # Adjust position to be within bounds
-                    projectile['x'] = max(0, min(self.map_width, projectile['x']))
-                    projectile['y'] = max(0, min(self.map_height, projectile['y']))
+            except json.JSONDecodeError as e:
+                # Skip invalid JSON by finding the next opening brace
+                next_start = buffer.find('{', json_start + 1)
+                if next_start == -1:
+                    buffer = "" 
                 else:
-                    # Remove projectile
-                    self.projectiles.remove(projectile)
-                    continue
-            
-            # Check for collisions with players
-            for player_id, player in self.players.items():
-                if player['alive'] and player_id != projectile.get('owner_id'):
-                    px, py = player['x'], player['y']
-                    dx = px - x
-                    dy = py - y
-                    distance = (dx*dx + dy*dy) ** 0.5
-                    if distance < 20 + projectile['radius']: 
-                        # Player is hit
-                        # In sudden death mode, any hit is fatal
-                        if self.sudden_death:
-                            player['health'] = 0 
-                        else:
-                            player['health'] -= projectile['damage']
-                        
-                        # Check if player is eliminated
-                        if player['health'] <= 0:
-                            player['alive'] = False
-                            player['health'] = 0
-                            
-                            # If player had a cannon, release it
-                            if player['has_cannon']:
-                                for cannon in self.cannons[:]:
-                                    if cannon.get('controlled_by') == player_id:
-                                        self.cannons.remove(cannon)
-                                        break
-                                player['has_cannon'] = False
-                                player['cannon_id'] = None
-                            
-                            # Spawn a powerup at player's position
-                            self.spawn_powerup(px, py)
-                            
-                            # Broadcast player elimination
-                            self.broadcast_message('player_eliminated', {
-                                'player_id': player_id,
-                                'eliminator_id': projectile.get('owner_id')
-                            })
-                            
-                            # Add a specific message for sudden death eliminations
-                            if self.sudden_death:
-                                self.broadcast_message('player_hit', {
-                                    'player_id': player_id,
-                                    'damage': player['health'],
-                                    'health': 0,
-                                    'sudden_death_kill': True
-                                })
-                            
-                            # Check if the game is over
-                            alive_players = [p for p_id, p in self.players.items() if p['alive']]
-                            if len(alive_players) <= 1:
-                                # Game over - last player standing wins
-                                winner_id = alive_players[0]['id'] if alive_players else None
-                                self.broadcast_message('game_over', {
-                                    'winner_id': winner_id
-                                })
-                                # Reset the game in 10 seconds
-                                threading.Timer(10, self.reset_game).start()
-                        
-                        # Remove projectile
-                        if projectile in self.projectiles:
-                            self.projectiles.remove(projectile)
-                        
-                        # Broadcast hit
-                        self.broadcast_message('player_hit', {
-                            'player_id': player_id,
-                            'damage': projectile['damage'],
-                            'health': player['health']
-                        })
-                        break
-    
-    def update_cannons(self, delta_time):
-        for cannon in self.cannons[:]:
-            # Update explosion timer if cannon is controlled but not used
-            if cannon.get('controlled_by') is not None:
-                cannon['use_timer'] += delta_time
-                if cannon['use_timer'] >= 10: 
-                    # Explode cannon and damage controlling player
-                    player_id = cannon['controlled_by']
-                    if player_id in self.players:
-                        self.players[player_id]['health'] -= 50
-                        self.players[player_id]['has_cannon'] = False
-                        self.players[player_id]['cannon_id'] = None
-                          # Check if player is eliminated by explosion
-                        if self.players[player_id]['health'] <= 0:
-                            self.players[player_id]['alive'] = False
-                            self.players[player_id]['health'] = 0
-                            
-                            # Spawn a powerup at player's position
-                            self.spawn_powerup(self.players[player_id]['x'], self.players[player_id]['y'])
-                            
-                            # Broadcast player elimination
-                            self.broadcast_message('player_eliminated', {
-                                'player_id': player_id,
-                                'eliminator_id': None  # Eliminated by cannon explosion
-                            })
-                            
-                            # Check if the game is over - THIS WAS MISSING
-                            alive_players = [p for p_id, p in self.players.items() if p['alive']]
-                            if len(alive_players) <= 1:
-                                # Game over - last player standing wins
-                                winner_id = alive_players[0]['id'] if alive_players else None
-                                self.broadcast_message('game_over', {
-                                    'winner_id': winner_id
-                                })
-                                # Reset the game in 10 seconds
-                                threading.Timer(10, self.reset_game).start()
-                        
-                        # Broadcast hit
-                        self.broadcast_message('player_hit', {
-                            'player_id': player_id,
-                            'damage': 50,
-                            'health': self.players[player_id]['health']
-                        })
-                    
-                    # Remove the cannon
-                    self.cannons.remove(cannon)
-                    
-                    # Broadcast cannon explosion
-                    self.broadcast_message('cannon_exploded', {
-                        'cannon_id': cannon['id']
-                    })
+                    buffer = buffer[next_start:]
+                print(f"Invalid JSON from client {client_id}: {e}")
+        
+        if not messages and len(buffer) > BUFFER_SIZE * 2:
+            # If buffer is too large without valid messages, clear it
+            print(f"Buffer overflow from client {client_id}, clearing")
+            buffer = ""
+        return messages, buffer
     
-    def update_powerups(self, delta_time):
-        for powerup in self.powerups[:]:
-            for player_id, player in self.players.items():
-                if player['alive']:
-                    px, py = player['x'], player['y']
-                    dx = px - powerup['x']
-                    dy = py - powerup['y']
-                    distance = (dx*dx + dy*dy) ** 0.5
-                    
-                    if distance < 20 + powerup['radius']: 
-                        # Apply powerup effect
-                        if powerup['type'] == 'HEALTH':
-                            player['health'] = min(player['health'] + 30, 100)
-                        elif powerup['type'] == 'SPEED':
-                            pass
-                        
-                        self.powerups.remove(powerup)
-                        
-                        # Broadcast powerup pickup
-                        self.broadcast_message('powerup_pickup', {
-                            'powerup_id': powerup['id'],
-                            'player_id': player_id,
-                            'type': powerup['type']
-                        })
-                        break
+    def handle_client_message(self, client_id, message):
+        room = self.client_rooms.get(client_id)
+        if not room:
+            return
+        msg_type = message.get('type')
+        if msg_type in ('udp_ready', 'udp_close'):
+            self.set_udp(client_id, room, msg_type == 'udp_ready')
+        elif not room.queue_client_message(client_id, message):
+            # its commands pile up faster than the room ticks, none of them may be lost
+            print(f"Inbound queue overflow for client {client_id}, disconnecting")
+            self.handle_disconnect(client_id)
     
-    def game_update_loop(self):
-        last_update_time = time.time()
-        last_cannon_spawn_time = last_update_time
-        
-        while self.running:
-            current_time = time.time()
-            delta_time = current_time - last_update_time
-            
-            if delta_time >= UPDATE_INTERVAL:
-                # Update game state
-                if self.game_started:
-                    # Update projectiles
-                    self.update_projectiles(delta_time)
-                    
-                    # Update cannons
-                    self.update_cannons(delta_time)
-                    
-                    # Update powerups
-                    self.update_powerups(delta_time)
-                    
-                    # Spawn new cannon if needed (every 5 seconds)
-                    if current_time - last_cannon_spawn_time >= 5 and len(self.cannons) == 0:
-                        # Only spawn a new cannon if there are no cannons currently in the game
-                        self.spawn_cannon()
-                        last_cannon_spawn_time = current_time
-                    
-                    # Update sudden death timer
-                    if not self.sudden_death:
-                        self.sudden_death_timer -= delta_time
-                        if self.sudden_death_timer <= 0:
-                            self.sudden_death = True
-                            self.broadcast_message('sudden_death', {'message': 'Sudden Death Mode Activated!'})
-                    
-                    # Broadcast game state update
-                    self.broadcast_game_update()
-                
-                last_update_time = current_time
-            # Check for server termination due to inactivity
-            if not self.clients and self.player_ever_joined and self.empty_server_start_time is None:
-                # Server just became empty after having players, start the timer
-                self.empty_server_start_time = current_time
-                print(f"All players disconnected. Server will terminate in {self.empty_server_timeout} seconds if no one joins.")
-            elif self.clients:
-                # Reset timer if any clients are connected
-                self.empty_server_start_time = None
-            elif self.empty_server_start_time and (current_time - self.empty_server_start_time) >= self.empty_server_timeout:
-                print(f"Server terminating after {self.empty_server_timeout} seconds with no players connected.")
-                self.running = False
-                break
-            
-            # Sleep to avoid consuming too much CPU
-            time.sleep(0.01)
+    def set_udp(self, client_id, room, enabled):
+        """Send a client's snapshots over its UDP peer, or back over TCP"""
+        sender = room.client_senders.get(client_id)
+        if sender is None:
+            return
+        peer = self.udp.client_peers.get(client_id) if self.udp is not None else None
+        if enabled and peer is not None and peer.addr is not None:
+            sender.datagram = peer
+            print(f"Client {client_id} takes snapshots over UDP")
+        elif sender.datagram is not None:
+            sender.datagram = None
+            print(f"Client {client_id} is back to TCP only")
     
-    def broadcast_game_update(self):
-        state = {
-            'type': 'game_update',
-            'players': self.players,
-            'cannons': self.cannons,
-            'projectiles': self.projectiles,
-            'powerups': self.powerups,
-            'sudden_death': self.sudden_death,
-            'sudden_death_timer': self.sudden_death_timer
-        }
-        self.broadcast_message('game_update', state)
+    def handle_datagram(self, client_id, message, size):
+        """A command that came in over the UDP channel"""
+        traffic = self.traffic.get(client_id)
+        if traffic is None:
+            return
+        traffic.bytes_in += size
+        traffic.messages_in += 1
+        try:
+            self.handle_client_message(client_id, message)
+        except Exception as e:
+            print(f"Error processing datagram: {e}")
     
-    def broadcast_message(self, msg_type, data):
-        message = {
-            'type': msg_type,
-            'data': data
-        }
-        message_json = json.dumps(message).encode('utf-8')
-        
-        for client_id, client_socket in list(self.clients.items()):
-            try:
-                client_socket.sendall(message_json)
-            except Exception as e:
-                print(f"Error sending to client {client_id}: {e}")
-                self.handle_disconnect(client_id)
+    def check_inactivity(self, current_time):
+        """Clears self.running when the server has been empty for too long"""
+        if self.handoff is not None:
+            # a pool worker lives as long as the pool master
+            return
+        if not self.clients and self.player_ever_joined and self.empty_server_start_time is None:
+            # Server just became empty after having players, start the timer
+            self.empty_server_start_time = current_time
+            print(f"All players disconnected. Server will terminate in {self.empty_server_timeout} seconds if no one joins.")
+        elif self.clients:
+            # Reset timer if any clients are connected
+            self.empty_server_start_time = None
+        elif self.empty_server_start_time and (current_time - self.empty_server_start_time) >= self.empty_server_timeout:
+            print(f"Server terminating after {self.empty_server_timeout} seconds with no players connected.")
+            self.running = False
     
     def handle_disconnect(self, client_id):
-        if client_id in self.clients:
+        # The reader and writer threads can both get here for the same client
+        room = self.client_rooms.pop(client_id, None)
+        self.traffic.pop(client_id, None)
+        if self.udp is not None:
+            self.udp.forget(client_id)
+        if room:
+            room.remove_player(client_id)
+            self.lobby.release(room.room_id)
+        client_socket = self.clients.pop(client_id, None)
+        if client_socket:
             try:
-                self.clients[client_id].close()
+                client_socket.close()
             except:
                 pass
-            del self.clients[client_id]
-        
-        if client_id in self.players:
-            # Release any cannon the player was holding
-            if self.players[client_id].get('has_cannon'):
-                for cannon in self.cannons[:]:
-                    if cannon.get('controlled_by') == client_id:
-                        self.cannons.remove(cannon)
-                        break
-            
-            # Remove the player
-            del self.players[client_id]
-            
-            # Broadcast player left
-            self.broadcast_message('player_left', {'player_id': client_id})
-            
-            # Check if the game is over
-            alive_players = [p for p_id, p in self.players.items() if p.get('alive', False)]
-            if len(alive_players) <= 1 and self.game_started:
-                # Game over - last player standing wins
-                winner_id = alive_players[0]['id'] if alive_players else None
-                self.broadcast_message('game_over', {
-                    'winner_id': winner_id
-                })
-                # Reset the game in 10 seconds
-                threading.Timer(10, self.reset_game).start()
-    
-    def reset_game(self):
-        # Clear game objects
-        self.cannons = []
-        self.projectiles = []
-        self.powerups = []
-        
-        # Reset player states
-        for player_id in self.players:
-            self.players[player_id]['x'] = random.randint(50, self.map_width - 50)
-            self.players[player_id]['y'] = random.randint(50, self.map_height - 50)
-            self.players[player_id]['health'] = 100
-            self.players[player_id]['alive'] = True
-            self.players[player_id]['has_cannon'] = False
-            self.players[player_id]['cannon_id'] = None
-        
-        # Reset game settings
-        self.sudden_death = False
-        self.sudden_death_timer = 120
-        
-        # Broadcast game reset
-        self.broadcast_message('game_reset', {'message': 'New game starting!'})
-        
-        # Spawn initial cannon
-        self.spawn_cannon()
+        if room and not room.members:
+            self.close_room(room)
     
     def close(self):
         self.running = False
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.udp is not None:
+            self.udp.close()
         
         # Close all client connections
-        for client_id, client_socket in self.clients.items():
+        for room in list(self.rooms.values()):
+            room.close()
+        for client_id, client_socket in list(self.clients.items()):
             try:
                 client_socket.close()
             except:
                 pass
         
         # Close server socket
-        try:
-            self.socket.close()
-        except:
-            pass
+        for intake in (self.socket, self.handoff):
+            if intake is None:
+                continue
+            try:
+                intake.close()
+            except:
+                pass
         
         print("Server closed")
 
 if __name__ == "__main__":
-    server = GameServer()
+    parser = argparse.ArgumentParser(description="Cannon Chaos game server")
+    parser.add_argument('--engine', choices=['threaded', 'eventloop'], default='threaded',
+                        help="threaded: one thread per client, eventloop: single selectors loop")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="spread rooms over this many worker processes (0: host them in this process)")
+    parser.add_argument('--room-size', type=int, default=MAX_ROOM_PLAYERS,
+                        help="players per room before the lobby opens a new one")
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE,
+                        help="simulation ticks per second")
+    parser.add_argument('--send-rate', type=int, default=SEND_RATE,
+                        help="snapshots per second sent to clients")
+    parser.add_argument('--projectile-engine', choices=[PROJECTILES_DICT, PROJECTILES_NUMPY], default=PROJECTILES_DICT,
+                        help="dict: one dict per projectile, numpy: batched structure-of-arrays")
+    parser.add_argument('--interest-radius', type=float, default=None,
+                        help="only send clients the entities within this many pixels of their player "
+                             "(default: the whole map)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve tick timings, overruns, queue depths and per-client traffic on "
+                             "http://127.0.0.1:PORT/ (with --workers, worker i uses PORT + i)")
+    parser.add_argument('--metrics-log', type=float, default=None, metavar='SECONDS',
+                        help="print a metrics summary every SECONDS")
+    parser.add_argument('--udp-port', type=int, default=None,
+                        help="offer clients a UDP channel on this port for snapshots and inputs, events stay "
+                             "on TCP (with --workers, worker i uses PORT + i)")
+    parser.add_argument('--record', default=None, metavar='DIR',
+                        help="record every match to a replay file in DIR, play it with client/replay_player.py")
+    args = parser.parse_args()
+    if args.projectile_engine == PROJECTILES_NUMPY:
+        try:
+            import numpy
+        except ImportError:
+            parser.error("--projectile-engine numpy needs numpy installed (pip install numpy)")
+    settings = {'max_room_players': args.room_size, 'tick_rate': args.tick_rate, 'send_rate': args.send_rate,
+                'projectile_engine': args.projectile_engine, 'interest_radius': args.interest_radius,
+                'metrics_port': args.metrics_port, 'metrics_interval': args.metrics_log, 'udp_port': args.udp_port,
+                'record_dir': args.record}
+    
+    if args.workers > 0:
+        from pool import RoomPool
+        server = RoomPool(args.workers, args.engine, settings)
+    elif args.engine == 'eventloop':
+        from event_loop import EventLoopServer
+        server = EventLoopServer(**settings)
+    else:
+        server = GameServer(**settings)
     try:
         server.start()
     except KeyboardInterrupt:
         print("Server stopped by user")
     finally:
-        server.close()
\ No newline at end of file
+        server.close()
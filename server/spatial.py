@@ -0,0 +1,73 @@
+"""
+spatial.py
+
+Uniform grid spatial hash used as the collision broad phase.
+
+Entities are bucketed by the grid cell their position falls in. Moving an
+entity only touches the index when it crosses into another cell, and a
+query only looks at the cells overlapping the query circle's bounding box,
+so a collision check costs a handful of candidates instead of every entity
+in the room.
+"""
+
+
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> {key: None}, a dict keeps insertion order
+        self.entity_cells = {}  # key -> (cx, cy)
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, key, x, y):
+        cell = self.cell_of(x, y)
+        self.entity_cells[key] = cell
+        self.cells.setdefault(cell, {})[key] = None
+
+    def move(self, key, x, y):
+        """Update an entity's position, cheap unless it changed cell"""
+        cell = self.cell_of(x, y)
+        old_cell = self.entity_cells.get(key)
+        if cell == old_cell:
+            return
+        if old_cell is not None:
+            self._discard(key, old_cell)
+        self.entity_cells[key] = cell
+        self.cells.setdefault(cell, {})[key] = None
+
+    def remove(self, key):
+        cell = self.entity_cells.pop(key, None)
+        if cell is not None:
+            self._discard(key, cell)
+
+    def _discard(self, key, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.entity_cells.clear()
+
+    def query(self, x, y, radius):
+        """Keys of the entities in every cell the circle (x, y, radius) touches.
+
+        This is a broad phase: callers still do the exact distance check.
+        """
+        size = self.cell_size
+        min_cx, max_cx = int((x - radius) // size), int((x + radius) // size)
+        min_cy, max_cy = int((y - radius) // size), int((y + radius) // size)
+        cells = self.cells
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def __len__(self):
+        return len(self.entity_cells)
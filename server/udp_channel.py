@@ -0,0 +1,146 @@
+"""
+udp_channel.py
+
+Optional UDP channel next to a server's TCP listener.
+
+Snapshots are superseded by the next one, so over TCP a lost segment holds
+back every later snapshot until it is retransmitted. Framed clients can
+therefore move the droppable part of the traffic to UDP:
+
+    server -> client (TCP)  udp_offer {port, token}
+    client -> server (UDP)  udp_hello, repeated until answered
+    server -> client (UDP)  udp_hello, the echo proves both directions work
+    client -> server (TCP)  udp_ready, snapshots switch to UDP from here on
+
+From then on snapshots and deltas (server to client) and movement inputs
+and snapshot acks (client to server) are datagrams, everything else stays
+on TCP. Every datagram carries the session token and a sequence number,
+anything older than the newest one received is dropped. A snapshot frame
+too big for one datagram still goes over TCP. A client that stops hearing
+the server on UDP sends udp_close over TCP and both ends fall back to
+TCP only.
+"""
+
+import secrets
+import select
+import socket
+
+from protocol import (
+    DATAGRAM_MESSAGE_TYPES, MAX_DATAGRAM_FRAME, MAX_DATAGRAM_SIZE, ProtocolError,
+    decode_datagram, encode_datagram, encode_message
+)
+
+
+class UdpPeer:
+    """One client's end of the channel"""
+
+    def __init__(self, channel, client_id, token):
+        self.channel = channel
+        self.client_id = client_id
+        self.token = token
+        self.addr = None  # learned from the client's hello, NAT may rewrite it
+        self.send_seq = 0
+        self.recv_seq = 0
+
+    def send(self, frame):
+        """Send a frame as one datagram, False if it has to go over TCP instead"""
+        if self.addr is None or len(frame) > MAX_DATAGRAM_FRAME:
+            return False
+        self.send_seq += 1
+        try:
+            self.channel.socket.sendto(encode_datagram(self.token, self.send_seq, frame), self.addr)
+        except (BlockingIOError, InterruptedError):
+            pass  # socket buffer full, the datagram is lost like any other
+        except OSError as e:
+            print(f"UDP send to client {self.client_id} failed: {e}")
+            return False
+        return True
+
+
+class UdpChannel:
+    """Non-blocking UDP socket shared by every client of a server.
+
+    on_message(client_id, message, size) is called for every accepted
+    client command.
+    """
+
+    def __init__(self, host, port, on_message):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+        self.on_message = on_message
+        self.peers = {}  # token -> UdpPeer
+        self.client_peers = {}  # client_id -> UdpPeer
+        self.closed = False
+        print(f"UDP snapshot channel on {host}:{self.port}")
+
+    def offer(self, client_id):
+        """Make a peer with a fresh token for a client, returns it"""
+        self.forget(client_id)
+        token = secrets.randbits(32)
+        while token == 0 or token in self.peers:
+            token = secrets.randbits(32)
+        peer = UdpPeer(self, client_id, token)
+        self.peers[token] = peer
+        self.client_peers[client_id] = peer
+        return peer
+
+    def forget(self, client_id):
+        peer = self.client_peers.pop(client_id, None)
+        if peer is not None:
+            self.peers.pop(peer.token, None)
+
+    def receive(self):
+        """Handle every datagram that is waiting"""
+        while not self.closed:
+            try:
+                data, addr = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError:
+                # an ICMP port unreachable from some client, nothing to do with the others
+                continue
+            except OSError:
+                return  # closed under us
+            try:
+                token, seq, message = decode_datagram(data)
+            except ProtocolError:
+                continue  # not ours or corrupted, don't let strangers fill the log
+            peer = self.peers.get(token)
+            if peer is None or seq <= peer.recv_seq:
+                continue  # unknown session, or a duplicate or reordered datagram
+            msg_type = message.get('type')
+            if msg_type == 'udp_hello':
+                # the token is the proof, a client behind a NAT may show up from a new address
+                peer.addr = addr
+                peer.recv_seq = seq
+                peer.send(encode_message('udp_hello', {}))
+                continue
+            if addr != peer.addr:
+                continue
+            peer.recv_seq = seq
+            if msg_type == 'batch':
+                commands = [command for command in message.get('messages', [])
+                            if isinstance(command, dict) and command.get('type') in DATAGRAM_MESSAGE_TYPES]
+                message = {'type': 'batch', 'messages': commands}
+            elif msg_type not in DATAGRAM_MESSAGE_TYPES:
+                continue
+            self.on_message(peer.client_id, message, len(data))
+
+    def run(self):
+        """Receive loop for a thread of its own (threaded engine)"""
+        while not self.closed:
+            try:
+                readable, _, _ = select.select([self.socket], [], [], 1.0)
+            except (OSError, ValueError):
+                return  # closed under us
+            if readable:
+                self.receive()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.socket.close()
+        except OSError:
+            pass